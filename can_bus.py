@@ -10,6 +10,10 @@ CORREZIONI IMPLEMENTATE:
 3. ERROR FLAG PASSIVE: 8 bit RECESSIVE (1) quando TEC >= 128
 4. TEC decrementato (-1) dopo trasmissione con successo
 5. Collision: ENTRAMBE le ECU incrementano TEC di +8
+6. Kernel a eventi discreti con clock virtuale (default): la simulazione gira alla
+   velocità della CPU. La modalità wall-clock resta disponibile con realtime=True.
+7. ECU senza thread: i timer di trasmissione sono in una timer wheel gerarchica
+   avanzata dal master a ogni bit-time.
 """
 
 from __future__ import annotations
@@ -18,10 +22,15 @@ import time
 import threading
 import queue
 import random
-from collections import deque
+import math
+import heapq
+import itertools
+import functools
+import argparse
+from array import array
 from dataclasses import dataclass
 from enum import Enum, auto
-from typing import Deque, Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 try:
     import can  # python-can
@@ -29,6 +38,14 @@ try:
 except Exception:
     CAN_AVAILABLE = False
 
+from can_tracer import TRACE, TraceLevel  # tracing a livelli (stesso repo)
+
+try:
+    from can_trace import TraceFileWriter  # trace binaria (stesso repo)
+    TRACE_FILE_AVAILABLE = True
+except Exception:
+    TRACE_FILE_AVAILABLE = False
+
 
 class BitValue(Enum):
     DOMINANT = 0
@@ -92,127 +109,441 @@ class BitTransmission:
     field: Field
 
 
-def _crc15_can(bits: List[int]) -> int:
-    """Compute CRC-15/CAN over a bit stream."""
-    poly = 0x4599
+@dataclass
+class DecodedFrame:
+    arbitration_id: int
+    data: bytes
+    r0: int
+    timestamp: float  # bus time dell'ultimo bit di EOF
+
+
+@dataclass
+class RxErrorEvent:
+    kind: str  # "stuff" | "form" | "crc"
+    field: Field
+    bit_index: int  # bit (destuffed) del frame in cui è stato rilevato l'errore
+    timestamp: float
+
+
+# ---- Lookup tables (rappresentazione compatta: bit 0/1 e Field.value in bytearray) ----
+
+_BIT_VALUES: Tuple[BitValue, BitValue] = (BitValue.DOMINANT, BitValue.RECESSIVE)
+FIELD_BY_CODE: Dict[int, Field] = {f.value: f for f in Field}
+
+_STUFFED_FIELD_CODES = frozenset(
+    f.value for f in (Field.SOF, Field.ID, Field.RTR, Field.IDE, Field.R0, Field.DLC, Field.DATA, Field.CRC)
+)
+
+# MSB-first bits of every byte / 11-bit ID / 4-bit DLC
+_BYTE_BITS: Tuple[bytes, ...] = tuple(bytes((v >> i) & 1 for i in range(7, -1, -1)) for v in range(256))
+_ID_BITS: Tuple[bytes, ...] = tuple(bytes((v >> i) & 1 for i in range(10, -1, -1)) for v in range(0x800))
+_DLC_BITS: Tuple[bytes, ...] = tuple(bytes((v >> i) & 1 for i in range(3, -1, -1)) for v in range(16))
+
+# Tail after CRC: CRC_DELIM, ACK_SLOT, ACK_DELIM, 7x EOF, 3x INTERMISSION (all recessive, never stuffed)
+_TAIL_BITS = bytes([1] * 13)
+_TAIL_FIELDS = bytes(
+    [Field.CRC_DELIM.value, Field.ACK_SLOT.value, Field.ACK_DELIM.value]
+    + [Field.EOF.value] * 7
+    + [Field.INTERMISSION.value] * 3
+)
+_HEAD_FIELDS = bytes(
+    [Field.SOF.value] + [Field.ID.value] * 11 + [Field.RTR.value, Field.IDE.value, Field.R0.value] + [Field.DLC.value] * 4
+)
+_CRC_FIELDS = bytes([Field.CRC.value] * 15)
+
+_CRC15_POLY = 0x4599
+
+
+def _crc15_can_bitwise(bits) -> int:
+    """Compute CRC-15/CAN over a bit stream (bit-serial reference)."""
     crc = 0
     for b in bits:
         msb = (crc >> 14) & 1
         crc = ((crc << 1) & 0x7FFF) | (b & 1)
         if msb:
-            crc ^= poly
+            crc ^= _CRC15_POLY
     return crc & 0x7FFF
 
 
+def _build_crc15_table() -> Tuple[int, ...]:
+    # T[h] = contributo dei top-8 bit del registro dopo 8 shift (h * x^15 mod P)
+    table = []
+    for h in range(256):
+        crc = h << 7
+        for _ in range(8):
+            msb = (crc >> 14) & 1
+            crc = (crc << 1) & 0x7FFF
+            if msb:
+                crc ^= _CRC15_POLY
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC15_TABLE = _build_crc15_table()
+
+
+def _crc15_can(bits) -> int:
+    """Compute CRC-15/CAN over a bit stream (table-driven, 8 bits per step)."""
+    n = len(bits)
+    head = n % 8
+    crc = _crc15_can_bitwise(bits[:head])
+    table = _CRC15_TABLE
+    for i in range(head, n, 8):
+        byte = (
+            (bits[i] << 7) | (bits[i + 1] << 6) | (bits[i + 2] << 5) | (bits[i + 3] << 4)
+            | (bits[i + 4] << 3) | (bits[i + 5] << 2) | (bits[i + 6] << 1) | bits[i + 7]
+        )
+        crc = (((crc & 0x7F) << 8) ^ table[crc >> 7] ^ byte) & 0x7FFF
+    return crc
+
+
 class CANBitStream:
-    """Build a *stuffed* CAN base frame bit stream and per-bit field labels."""
+    """Build a *stuffed* CAN base frame bit stream and per-bit field labels.
+
+    ``bits`` holds 0/1 (DOMINANT/RECESSIVE) and ``fields`` the ``Field.value`` codes,
+    both as ``bytearray``; use ``bit_at``/``field_at`` to get the Enum members back.
+    """
 
     def __init__(self, arbitration_id: int, data: bytes, r0: BitValue = BitValue.RECESSIVE):
         self.arb_id = arbitration_id & 0x7FF
-        self.data = data[:8]
+        self.data = bytes(data[:8])
         self.r0 = r0
 
-        self.bits: List[BitValue] = []
-        self.fields: List[Field] = []
+        self.bits = bytearray()
+        self.fields = bytearray()
         self._build()
 
-    def _push(self, bit: BitValue, field: Field):
-        self.bits.append(bit)
-        self.fields.append(field)
-
-    def _build_unstuffed_payload_bits(self) -> Tuple[List[BitValue], List[Field]]:
-        bits: List[BitValue] = []
-        fields: List[Field] = []
-
-        def push(bit: BitValue, field: Field):
-            bits.append(bit)
-            fields.append(field)
+    def __len__(self) -> int:
+        return len(self.bits)
 
-        # SOF
-        push(BitValue.DOMINANT, Field.SOF)
+    def bit_at(self, idx: int) -> BitValue:
+        return _BIT_VALUES[self.bits[idx]]
 
-        # 11-bit ID (MSB first)
-        for i in range(10, -1, -1):
-            push(BitValue.from_int((self.arb_id >> i) & 1), Field.ID)
+    def field_at(self, idx: int) -> Field:
+        return FIELD_BY_CODE[self.fields[idx]]
 
-        # Control field (base frame)
-        push(BitValue.DOMINANT, Field.RTR)
-        push(BitValue.DOMINANT, Field.IDE)
-        push(self.r0, Field.R0)
-
-        # DLC 4 bits
+    def _build_unstuffed_payload_bits(self) -> Tuple[bytearray, bytearray]:
         dlc = len(self.data)
-        for i in range(3, -1, -1):
-            push(BitValue.from_int((dlc >> i) & 1), Field.DLC)
+
+        # SOF, 11-bit ID (MSB first), RTR, IDE, R0, DLC
+        bits = bytearray(b"\x00")
+        bits += _ID_BITS[self.arb_id]
+        bits += bytes((0, 0, int(self.r0)))
+        bits += _DLC_BITS[dlc]
+        fields = bytearray(_HEAD_FIELDS)
 
         # DATA bytes
         for byte in self.data:
-            for i in range(7, -1, -1):
-                push(BitValue.from_int((byte >> i) & 1), Field.DATA)
+            bits += _BYTE_BITS[byte]
+        fields += bytes([Field.DATA.value]) * (8 * dlc)
 
         # CRC
-        crc_input = [int(b) for b in bits]
-        crc = _crc15_can(crc_input)
-        for i in range(14, -1, -1):
-            push(BitValue.from_int((crc >> i) & 1), Field.CRC)
-
-        # CRC delimiter
-        push(BitValue.RECESSIVE, Field.CRC_DELIM)
-        # ACK slot
-        push(BitValue.RECESSIVE, Field.ACK_SLOT)
-        push(BitValue.RECESSIVE, Field.ACK_DELIM)
-        # EOF 7 recessive
-        for _ in range(7):
-            push(BitValue.RECESSIVE, Field.EOF)
-        # Intermission 3 recessive
-        for _ in range(3):
-            push(BitValue.RECESSIVE, Field.INTERMISSION)
+        crc = _crc15_can(bits)
+        bits += _BYTE_BITS[crc >> 8][1:] + _BYTE_BITS[crc & 0xFF]
+        fields += _CRC_FIELDS
+
+        # CRC delimiter, ACK slot/delimiter, EOF, intermission
+        bits += _TAIL_BITS
+        fields += _TAIL_FIELDS
 
         return bits, fields
 
     @staticmethod
-    def _apply_bit_stuffing(bits: List[BitValue], fields: List[Field]) -> Tuple[List[BitValue], List[Field]]:
+    def _apply_bit_stuffing(bits: bytearray, fields: bytearray) -> Tuple[bytearray, bytearray]:
         """Stuff from SOF through end of CRC sequence (inclusive)."""
-        out_bits: List[BitValue] = []
-        out_fields: List[Field] = []
+        out_bits = bytearray()
+        out_fields = bytearray()
+        stuff_code = Field.STUFF.value
 
-        run_val: Optional[BitValue] = None
+        run_val = -1
         run_len = 0
 
-        def should_stuff(idx: int) -> bool:
-            return fields[idx] in {
-                Field.SOF, Field.ID, Field.RTR, Field.IDE, Field.R0, Field.DLC, Field.DATA, Field.CRC
-            }
-
-        for i, (b, f) in enumerate(zip(bits, fields)):
+        for b, f in zip(bits, fields):
             out_bits.append(b)
             out_fields.append(f)
 
-            if not should_stuff(i):
-                run_val = None
+            if f not in _STUFFED_FIELD_CODES:
+                run_val = -1
                 run_len = 0
                 continue
 
-            if run_val is None or b != run_val:
+            if b != run_val:
                 run_val = b
                 run_len = 1
             else:
                 run_len += 1
 
             if run_len == 5:
-                stuffed = BitValue.DOMINANT if b is BitValue.RECESSIVE else BitValue.RECESSIVE
-                out_bits.append(stuffed)
-                out_fields.append(Field.STUFF)
-                run_val = None
+                out_bits.append(b ^ 1)
+                out_fields.append(stuff_code)
+                run_val = -1
                 run_len = 0
 
         return out_bits, out_fields
 
     def _build(self):
         raw_bits, raw_fields = self._build_unstuffed_payload_bits()
-        stuffed_bits, stuffed_fields = self._apply_bit_stuffing(raw_bits, raw_fields)
-        self.bits = stuffed_bits
-        self.fields = stuffed_fields
+        self.bits, self.fields = self._apply_bit_stuffing(raw_bits, raw_fields)
+
+
+FRAME_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=FRAME_CACHE_SIZE)
+def _encode_frame_cached(arb_id: int, data: bytes, r0: int) -> CANBitStream:
+    return CANBitStream(arb_id, data, r0=_BIT_VALUES[r0])
+
+
+def encode_frame(arbitration_id: int, data: bytes, r0: BitValue = BitValue.RECESSIVE) -> CANBitStream:
+    """Encoded frame from a bounded LRU cache keyed by (arb_id, data, r0).
+
+    The cache is shared by the master and every ECU; the returned stream must be
+    treated as read-only (cursors live in the ECU, not in the stream).
+    """
+    return _encode_frame_cached(arbitration_id & 0x7FF, bytes(data[:8]), int(r0))
+
+
+def frame_cache_info():
+    """Hit/miss counters of the encoding cache (functools ``CacheInfo``)."""
+    return _encode_frame_cached.cache_info()
+
+
+class RxState(Enum):
+    IDLE = auto()  # attesa SOF (bit dominante)
+    FRAME = auto()  # SOF..CRC: destuffing attivo
+    TRAILER = auto()  # CRC_DELIM, ACK, EOF (mai stuffati)
+    RECOVER = auto()  # dopo un errore: attesa di 8 bit recessivi (error delimiter)
+
+
+_HEAD_LEN = len(_HEAD_FIELDS)  # SOF..DLC = 19 bit
+_TRAILER_FIELDS: Tuple[Field, ...] = (Field.CRC_DELIM, Field.ACK_SLOT, Field.ACK_DELIM) + (Field.EOF,) * 7
+_RECOVER_BITS = 8
+
+
+class CANFrameDecoder:
+    """Streaming receiver: consumes bus bits one at a time, O(1) per bit.
+
+    Destuffs (same variant as ``CANBitStream``: the stuff bit does not open a new
+    run), tracks the current field, updates the CRC bit-serially and checks stuff,
+    form and CRC errors. Decoded frames and error events are pushed to the
+    subscribed listeners, so a single decoder fed by the master serves every node.
+    """
+
+    def __init__(self):
+        self._frame_listeners: List = []
+        self._error_listeners: List = []
+        self.frames_ok = 0
+        self.errors = 0
+        self._reset(RxState.IDLE)
+
+    def subscribe(self, on_frame=None, on_error=None):
+        if on_frame is not None:
+            self._frame_listeners.append(on_frame)
+        if on_error is not None:
+            self._error_listeners.append(on_error)
+
+    def _reset(self, state: RxState):
+        self.state = state
+        self._run_val = -1
+        self._run_len = 0
+        self._n = 0  # bit destuffed ricevuti nel frame corrente
+        self._arb_id = 0
+        self._r0 = 1
+        self._dlc = 0
+        self._data_end = _HEAD_LEN
+        self._crc_end = _HEAD_LEN + 15
+        self._data = bytearray()
+        self._byte = 0
+        self._crc = 0
+        self._crc_calc = 0
+        self._crc_rx = 0
+        self._t = 0  # indice nel trailer
+        self._recessive_run = 0
+
+    def feed(self, bit: int, timestamp: float):
+        state = self.state
+        if state is RxState.IDLE:
+            if bit == 0:
+                self._reset(RxState.FRAME)
+                self._on_stuffed_bit(0, timestamp)
+            return
+
+        if state is RxState.FRAME:
+            self._on_stuffed_bit(bit, timestamp)
+        elif state is RxState.TRAILER:
+            self._on_trailer_bit(bit, timestamp)
+        else:
+            self._recessive_run = self._recessive_run + 1 if bit else 0
+            if self._recessive_run >= _RECOVER_BITS:
+                self._reset(RxState.IDLE)
+
+    def _on_stuffed_bit(self, bit: int, timestamp: float):
+        if self._run_len == 5:
+            # Stuff bit atteso: deve essere opposto al run, poi viene scartato
+            if bit == self._run_val:
+                self._error("stuff", Field.STUFF, timestamp)
+                return
+            self._run_val = -1
+            self._run_len = 0
+            return
+
+        if self._n >= self._crc_end:
+            # CRC completo (ed eventuale stuff bit finale consumato): inizia il trailer
+            self.state = RxState.TRAILER
+            self._on_trailer_bit(bit, timestamp)
+            return
+
+        if bit == self._run_val:
+            self._run_len += 1
+        else:
+            self._run_val = bit
+            self._run_len = 1
+
+        n = self._n
+        self._n = n + 1
+        if n < self._data_end:
+            msb = self._crc >> 14
+            self._crc = ((self._crc << 1) & 0x7FFF) | bit
+            if msb:
+                self._crc ^= _CRC15_POLY
+            if 1 <= n <= 11:
+                self._arb_id = (self._arb_id << 1) | bit
+            elif n == 14:
+                self._r0 = bit
+            elif 15 <= n <= 18:
+                self._dlc = (self._dlc << 1) | bit
+                if n == 18:
+                    self._data_end = _HEAD_LEN + 8 * min(self._dlc, 8)
+                    self._crc_end = self._data_end + 15
+            elif n >= _HEAD_LEN:
+                self._byte = (self._byte << 1) | bit
+                if (n - _HEAD_LEN) % 8 == 7:
+                    self._data.append(self._byte)
+                    self._byte = 0
+            if self._n == self._data_end:
+                self._crc_calc = self._crc
+        else:
+            self._crc_rx = (self._crc_rx << 1) | bit
+
+    def _on_trailer_bit(self, bit: int, timestamp: float):
+        t = self._t
+        field = _TRAILER_FIELDS[t]
+        if field is Field.CRC_DELIM:
+            if not bit:
+                self._error("form", field, timestamp)
+                return
+            if self._crc_rx != self._crc_calc:
+                self._error("crc", Field.CRC, timestamp)
+                return
+        elif field is not Field.ACK_SLOT and not bit:
+            self._error("form", field, timestamp)
+            return
+
+        self._t = t + 1
+        if self._t == len(_TRAILER_FIELDS):
+            frame = DecodedFrame(self._arb_id, bytes(self._data), self._r0, timestamp)
+            self.frames_ok += 1
+            self._reset(RxState.IDLE)
+            for cb in self._frame_listeners:
+                cb(frame)
+
+    def _error(self, kind: str, field: Field, timestamp: float):
+        ev = RxErrorEvent(kind, field, self._n, timestamp)
+        self.errors += 1
+        self._reset(RxState.RECOVER)
+        for cb in self._error_listeners:
+            cb(ev)
+
+
+class BusBitRing:
+    """Preallocated, sequence-numbered ring of bus bits (one writer, N readers).
+
+    The writer only stores into fixed slots and bumps ``head``: broadcast cost does
+    not depend on the number of readers. Each reader keeps its own cursor; a reader
+    that falls ``capacity`` bits behind (its next slot is the one being rewritten)
+    skips ahead and counts an overrun.
+    """
+
+    def __init__(self, capacity: int = 4096):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self._mask = size - 1
+        self._bits = bytearray(size)
+        self._fields = bytearray(size)
+        self._times = array("d", bytes(8 * size))
+        self._senders: List[str] = [""] * size
+        self.head = 0  # sequence number del prossimo bit da scrivere
+
+    def publish(self, bit: int, field_code: int, timestamp: float, sender_name: str):
+        i = self.head & self._mask
+        self._bits[i] = bit
+        self._fields[i] = field_code
+        self._times[i] = timestamp
+        self._senders[i] = sender_name
+        self.head += 1
+
+    def reader(self, *, from_start: bool = False) -> "BusBitReader":
+        return BusBitReader(self, 0 if from_start else self.head)
+
+
+class BusBitReader:
+    """Cursor over a ``BusBitRing``; ``overruns`` counts bits lost by lagging."""
+
+    def __init__(self, ring: BusBitRing, cursor: int):
+        self.ring = ring
+        self.cursor = cursor
+        self.overruns = 0
+
+    def available(self) -> int:
+        return self.ring.head - self.cursor
+
+    def _check_overrun(self) -> bool:
+        # lag == capacity: il cursore punta allo slot che il writer sta per riscrivere
+        lag = self.ring.head - self.cursor
+        if lag >= self.ring.capacity:
+            keep = self.ring.capacity - 1
+            self.overruns += lag - keep
+            self.cursor = self.ring.head - keep
+            return True
+        return False
+
+    def read_nowait(self) -> Optional[BitTransmission]:
+        ring = self.ring
+        while self.cursor < ring.head:
+            self._check_overrun()
+            seq = self.cursor
+            i = seq & ring._mask
+            bt = BitTransmission(_BIT_VALUES[ring._bits[i]], ring._times[i], ring._senders[i],
+                                 FIELD_BY_CODE[ring._fields[i]])
+            # Lo slot può essere stato riscritto durante la lettura: riprova dal nuovo cursore
+            if self._check_overrun():
+                continue
+            self.cursor = seq + 1
+            return bt
+        return None
+
+    def read(self, timeout: float = 0.0) -> Optional[BitTransmission]:
+        bt = self.read_nowait()
+        if bt is not None or timeout <= 0:
+            return bt
+        deadline = time.time() + timeout
+        while True:
+            remaining = deadline - time.time()
+            if remaining <= 0:
+                return None
+            time.sleep(min(0.001, remaining))
+            bt = self.read_nowait()
+            if bt is not None:
+                return bt
+
+    def skip_all(self) -> int:
+        """Advance to the writer without materialising bits; returns how many were skipped."""
+        self._check_overrun()
+        n = self.ring.head - self.cursor
+        self.cursor += n
+        return n
 
 
 class FaultInjector:
@@ -222,6 +553,9 @@ class FaultInjector:
         self.flip_r0_every_n_frames = flip_r0_every_n_frames
         self._frame_count = 0
 
+    def is_active(self) -> bool:
+        return bool(self.flip_r0_every_n_frames)
+
     def on_new_frame(self):
         self._frame_count += 1
 
@@ -232,6 +566,193 @@ class FaultInjector:
         return current_bus
 
 
+class EventKernel:
+    """Discrete-event kernel driven by a virtual clock.
+
+    Events (ECU wake-ups, bit ticks, timers) live in a priority queue ordered by
+    (time, insertion order). ``run_until`` pops them in order and jumps the clock
+    straight to each event, so simulated time runs as fast as the CPU allows.
+    """
+
+    def __init__(self, start_time: float = 0.0):
+        self.now = float(start_time)
+        self._heap: List[list] = []
+        self._seq = itertools.count()
+        self._stopped = False
+
+    def schedule_at(self, t: float, callback) -> list:
+        """Schedule ``callback()`` at virtual time ``t``; returns a cancellable handle."""
+        ev = [max(float(t), self.now), next(self._seq), callback, True]
+        heapq.heappush(self._heap, ev)
+        return ev
+
+    def schedule_in(self, delay: float, callback) -> list:
+        return self.schedule_at(self.now + max(0.0, delay), callback)
+
+    @staticmethod
+    def cancel(ev: Optional[list]):
+        if ev is not None:
+            ev[3] = False
+
+    def next_time(self) -> Optional[float]:
+        while self._heap and not self._heap[0][3]:
+            heapq.heappop(self._heap)
+        return self._heap[0][0] if self._heap else None
+
+    def step(self) -> bool:
+        """Run the earliest pending event. Returns False when the queue is empty."""
+        while self._heap:
+            t, _seq, callback, alive = heapq.heappop(self._heap)
+            if not alive:
+                continue
+            self.now = t
+            callback()
+            return True
+        return False
+
+    def run_until(self, t_end: float):
+        self._stopped = False
+        while not self._stopped:
+            t = self.next_time()
+            if t is None or t > t_end:
+                break
+            self.step()
+        if not self._stopped:
+            self.now = max(self.now, float(t_end))
+
+    def stop(self):
+        self._stopped = True
+        self._heap.clear()
+
+
+class TimerWheel:
+    """Hierarchical timing wheel (levels of 256/64/64/64 slots) advanced by the master.
+
+    Times are quantised to ``resolution`` seconds (the bit time). A timer lands in
+    the lowest level whose span covers its delay and is cascaded down as the wheel
+    turns, so insert, cancel and fire are O(1) however many ECUs are scheduled.
+    ``advance`` jumps over empty stretches instead of visiting every tick.
+    """
+
+    _BITS = (8, 6, 6, 6)
+
+    def __init__(self, resolution: float, start_time: float = 0.0):
+        self.resolution = float(resolution)
+        self._cur = self._tick_of(start_time)  # ultimo tick già processato
+        self._shifts: List[int] = []
+        shift = 0
+        for bits in self._BITS:
+            self._shifts.append(shift)
+            shift += bits
+        self._span = 1 << shift
+        self._levels = [[[] for _ in range(1 << bits)] for bits in self._BITS]
+        self._counts = [0] * len(self._BITS)
+
+    def _ticks(self, t: float) -> float:
+        """t in tick; agganciato al tick intero se ci cade a meno dell'arrotondamento.
+
+        Tolleranza relativa: l'errore di t / resolution cresce con t (a ~3e7 tick supera
+        già 1e-9), mentre rel_tol=1e-12 resta sotto il nanosecondo per anni di bit time.
+        """
+        q = t / self.resolution
+        n = round(q)
+        return n if math.isclose(q, n, rel_tol=1e-12, abs_tol=1e-9) else q
+
+    def _tick_of(self, t: float) -> int:
+        return math.ceil(self._ticks(t))
+
+    def __len__(self) -> int:
+        return sum(self._counts)
+
+    def schedule_at(self, t: float, callback) -> list:
+        """Schedule ``callback()`` at time ``t``; returns a cancellable handle."""
+        ev = [max(self._tick_of(t), self._cur + 1), callback, True]
+        self._insert(ev)
+        return ev
+
+    @staticmethod
+    def cancel(ev: Optional[list]):
+        if ev is not None:
+            ev[2] = False
+
+    def _insert(self, ev: list):
+        tick = ev[0]
+        delta = tick - self._cur
+        for level, bits in enumerate(self._BITS):
+            shift = self._shifts[level]
+            if delta < (1 << (shift + bits)):
+                self._levels[level][(tick >> shift) & ((1 << bits) - 1)].append(ev)
+                self._counts[level] += 1
+                return
+        # Oltre lo span: ultimo slot del livello più alto, re-inserito al cascade
+        level = len(self._BITS) - 1
+        shift = self._shifts[level]
+        mask = (1 << self._BITS[level]) - 1
+        self._levels[level][((self._cur >> shift) + mask) & mask].append(ev)
+        self._counts[level] += 1
+
+    def _cascade(self, level: int, idx: int):
+        slot = self._levels[level][idx]
+        if not slot:
+            return
+        self._levels[level][idx] = []
+        self._counts[level] -= len(slot)
+        for ev in slot:
+            if ev[2]:
+                self._insert(ev)
+
+    def _tick(self):
+        self._cur += 1
+        cur = self._cur
+        for level in range(1, len(self._BITS)):
+            if cur & ((1 << self._shifts[level]) - 1):
+                break
+            self._cascade(level, (cur >> self._shifts[level]) & ((1 << self._BITS[level]) - 1))
+        idx = cur & ((1 << self._BITS[0]) - 1)
+        slot = self._levels[0][idx]
+        if not slot:
+            return
+        self._levels[0][idx] = []
+        self._counts[0] -= len(slot)
+        for ev in slot:
+            if ev[2]:
+                ev[2] = False
+                ev[1]()
+
+    def advance(self, now: float):
+        """Fire every timer due at or before ``now`` (in scheduling order per tick)."""
+        target = math.floor(self._ticks(now))
+        while self._cur < target:
+            level = next((lv for lv, c in enumerate(self._counts) if c), None)
+            if level is None:
+                self._cur = target
+                return
+            if level > 0:
+                # Nulla da sparare prima del prossimo cascade del livello più basso non vuoto
+                boundary = ((self._cur >> self._shifts[level]) + 1) << self._shifts[level]
+                self._cur = max(self._cur, min(target, boundary - 1))
+                if self._cur >= target:
+                    return
+            self._tick()
+
+    def next_expiry(self) -> Optional[float]:
+        """Time of the earliest live timer (None if the wheel is empty)."""
+        best: Optional[int] = None
+        for level, bits in enumerate(self._BITS):
+            if not self._counts[level]:
+                continue
+            shift = self._shifts[level]
+            mask = (1 << bits) - 1
+            base = self._cur >> shift
+            for k in range(1 if level == 0 else 0, mask + 2):
+                live = [ev[0] for ev in self._levels[level][(base + k) & mask] if ev[2]]
+                if live:
+                    cand = min(live)
+                    best = cand if best is None else min(best, cand)
+                    break
+        return None if best is None else best * self.resolution
+
+
 class BaseECU:
     def __init__(
         self,
@@ -258,8 +779,8 @@ class BaseECU:
 
         self._stop = False
         self.auto_tx = bool(auto_tx)
-        self._tx_thread = threading.Thread(target=self._tx_loop, daemon=True)
-        self._rx_thread = threading.Thread(target=self._rx_loop, daemon=True)
+        # Nessun thread per ECU: il master chiama _tx_wakeup dalla sua timer wheel
+        self._tx_timer: Optional[list] = None
 
         # Transmission state
         self._pending_req: Optional[TransmissionRequest] = None
@@ -268,24 +789,28 @@ class BaseECU:
         self._currently_transmitting = False
 
         self._silence_bit_errors = False  # used to ignore repeated bit-errors in ERROR_PASSIVE
+
+        # Ricezione: frame/errori decodificati dal decoder condiviso del master
+        self.rx_frames = 0
+        self.rx_errors = 0
+        self.last_rx_frame: Optional[DecodedFrame] = None
         self.master.register_slave(self)
 
     def start(self):
-        print(f"[{self.name}] START slave_id={self.slave_id} ID=0x{self.arb_id:03X} period={self.tx_period:.2f}s")
-        self.next_tx_time = time.time() + self.start_delay
-        self._rx_thread.start()
+        TRACE.emit(TraceLevel.STATE, "[%s] START slave_id=%s ID=0x%03X period=%.2fs", self.name, self.slave_id, self.arb_id, self.tx_period)
+        self.next_tx_time = self.master.now() + self.start_delay
         if self.auto_tx:
-            self._tx_thread.start()
+            self._tx_timer = self.master.schedule_timer(self.next_tx_time, self._tx_wakeup)
 
     def request_once(self, data: bytes, *, arbitration_id: Optional[int] = None):
         """Queue exactly one transmission (used for deterministic tests)."""
         if self.is_bus_off():
-            print(f"[{self.name}] request_once ignored (BUS_OFF)")
+            TRACE.emit(TraceLevel.STATE, "[%s] request_once ignored (BUS_OFF)", self.name)
             return
         if self._pending_req is not None:
-            print(f"[{self.name}] request_once ignored (already pending)")
+            TRACE.emit(TraceLevel.STATE, "[%s] request_once ignored (already pending)", self.name)
             return
-        now = time.time()
+        now = self.master.now()
         aid = self.arb_id if arbitration_id is None else (arbitration_id & 0x7FF)
         self._pending_req = TransmissionRequest(
             slave_name=self.name,
@@ -300,6 +825,7 @@ class BaseECU:
 
     def stop(self):
         self._stop = True
+        self.master.timers.cancel(self._tx_timer)
 
     def _update_state(self):
         if self.tec >= 256:
@@ -308,6 +834,7 @@ class BaseECU:
             self.state = NodeState.ERROR_PASSIVE
         else:
             self.state = NodeState.ERROR_ACTIVE
+        self.master.record_tec(self)
 
     # ---- Master-facing API ----
 
@@ -321,16 +848,17 @@ class BaseECU:
         """Ensure bitstream is ready for a pending request."""
         if self._pending_req is None or self._bitstream is not None:
             return
-        self._bitstream = CANBitStream(self._pending_req.arbitration_id, self._pending_req.data, r0=BitValue.RECESSIVE)
+        self._bitstream = encode_frame(self._pending_req.arbitration_id, self._pending_req.data, r0=BitValue.RECESSIVE)
         self._cursor = 0
 
     def peek_next_bit(self) -> Optional[Tuple[BitValue, Field]]:
         if not self.has_pending_frame():
             return None
         assert self._bitstream is not None
-        if self._cursor >= len(self._bitstream.bits):
+        bs = self._bitstream
+        if self._cursor >= len(bs.bits):
             return None
-        return self._bitstream.bits[self._cursor], self._bitstream.fields[self._cursor]
+        return _BIT_VALUES[bs.bits[self._cursor]], FIELD_BY_CODE[bs.fields[self._cursor]]
 
     def advance(self):
         self._cursor += 1
@@ -367,48 +895,50 @@ class BaseECU:
         self.tec = max(0, self.tec - 1)
         self._update_state()
 
+    def on_frame_received(self, frame: DecodedFrame):
+        """Frame valido decodificato sul bus (anche quelli trasmessi da questa ECU)."""
+        self.rx_frames += 1
+        self.last_rx_frame = frame
+
+    def on_rx_error(self, event: RxErrorEvent):
+        """Errore stuff/form/CRC rilevato dal receiver."""
+        self.rx_errors += 1
+
     def get_time_until_tx(self) -> float:
         """Ritorna il tempo rimanente prima della prossima trasmissione (in secondi)."""
-        return max(0.0, self.next_tx_time - time.time())
+        return max(0.0, self.next_tx_time - self.master.now())
+
+    def _on_tx_due(self, now: float):
+        """Crea una nuova richiesta (se non ce n'è una pendente) e programma la prossima."""
+        if self._pending_req is None:
+            data = bytes([self.slave_id] * 8)  # Dati identificativi
+            self._pending_req = TransmissionRequest(
+                slave_name=self.name,
+                slave_id=self.slave_id,
+                arbitration_id=self.arb_id,
+                data=data,
+                timestamp=now,
+            )
+            self._bitstream = None
+            self._cursor = 0
+            self.master.submit_request(self._pending_req)
+            TRACE.emit(TraceLevel.FRAME, "[%s] VUOLE TRASMETTERE (ID=0x%03X) TEC=%s REC=%s State=%s", self.name, self.arb_id, self.tec, self.rec, self.state.name)
 
-    # ---- Internal threads ----
+        # Programma la prossima trasmissione
+        self.next_tx_time = now + self.tx_period
 
-    def _tx_loop(self):
-        if not self.auto_tx:
+    def _tx_wakeup(self):
+        """Build-and-submit hook, called by the master's timer wheel at next_tx_time."""
+        if self._stop:
             return
-        
-        while not self._stop:
-            if self.is_bus_off():
-                time.sleep(0.2)
-                continue
-            
-            now = time.time()
-            if now >= self.next_tx_time:
-                # Crea una nuova richiesta solo se non ce n'è una pendente
-                if self._pending_req is None:
-                    data = bytes([self.slave_id] * 8)  # Dati identificativi
-                    self._pending_req = TransmissionRequest(
-                        slave_name=self.name,
-                        slave_id=self.slave_id,
-                        arbitration_id=self.arb_id,
-                        data=data,
-                        timestamp=now,
-                    )
-                    self._bitstream = None
-                    self._cursor = 0
-                    self.master.submit_request(self._pending_req)
-                    print(f"[{self.name}] VUOLE TRASMETTERE (ID=0x{self.arb_id:03X}) TEC={self.tec} REC={self.rec} State={self.state.name}")
-                
-                # Programma la prossima trasmissione
-                self.next_tx_time = now + self.tx_period
-            
-            time.sleep(0.05)
-
-    def _rx_loop(self):
-        while not self._stop:
-            bt = self.master.get_bit_for_slave(self.slave_id, timeout=0.1)
-            if bt is None:
-                continue
+        now = self.master.now()
+        if self.is_bus_off():
+            self._tx_timer = self.master.schedule_timer(now + 0.2, self._tx_wakeup)
+            return
+        # La wheel spara al bit-time successivo: si usa l'istante nominale per non accumulare drift
+        due = self.next_tx_time if now - self.next_tx_time < self.tx_period else now
+        self._on_tx_due(due)
+        self._tx_timer = self.master.schedule_timer(self.next_tx_time, self._tx_wakeup)
 
 
 class CANMaster:
@@ -418,19 +948,42 @@ class CANMaster:
         forward_to_socketcan: bool = False,
         can_channel: str = "vcan0",
         fault_injector: Optional[FaultInjector] = None,
-        gather_window_s: float = 0.30,
+        gather_window_s: float = 0.0,
+        realtime: bool = False,
     ):
         self.tick = tick_ms / 1000.0
         self.state = MasterState.IDLE
         self.clock = 0
 
+        # realtime=True: un thread avanza di un bit ogni time.sleep(tick) (wall-clock).
+        # realtime=False: EventKernel con clock virtuale, nessun thread.
+        self.realtime = bool(realtime)
+        self.kernel = EventKernel()
+        # Timer delle ECU (e dello status) in una timer wheel avanzata a ogni bit-time
+        self.timers = TimerWheel(self.tick, start_time=self.now())
+        self._timer_lock = threading.RLock()
+        self.status_period_s = 3.0
+        # Bit-time extra consumati dallo step corrente (fast-forward di un frame intero)
+        self._skip_ticks = 0
+        # Idle skipping: con bus IDLE e nessuna ECU pending il master "parcheggia" il
+        # clock fino alla prossima next_tx_time (o finché arriva una submit_request).
+        self._idle_park = False
+        self._parked = False
+        self._tick_ev: Optional[list] = None
+        self._wake = threading.Event()
+
         self.slaves: Dict[int, BaseECU] = {}
-        self.bit_queues: Dict[int, "queue.Queue[BitTransmission]"] = {}
+        # Un solo receiver per tutto il bus: ogni ECU si iscrive invece di decodificare da sé
+        self.rx_decoder = CANFrameDecoder()
+        # Bit grezzi per get_bit_for_slave (API pubblica per ECU/strumenti che leggono il bus
+        # bit per bit, come le ECU delle versioni a thread): le ECU di questo file usano
+        # rx_decoder, quindi il ring viene scritto solo se qualcuno ha aperto un reader.
+        self.bus_ring = BusBitRing()
+        self.bit_readers: Dict[int, BusBitReader] = {}
         self._pending_starts: "queue.Queue[TransmissionRequest]" = queue.Queue()
 
         self._stop = False
         self._thread = threading.Thread(target=self._loop, daemon=True)
-        self._status_thread = threading.Thread(target=self._status_loop, daemon=True)
 
         # Bus activity
         self._contenders: List[int] = []
@@ -439,7 +992,7 @@ class CANMaster:
         self._current_field: Field = Field.INTERMISSION
         self._arbitration_window = False
         
-        # Arbitration gather window (to simulate the master "waiting a bit" to collect contenders)
+        # Optional gather window (legacy): 0 = contenders collected at bus idle, no extra latency
         self.gather_window_s = float(gather_window_s)
         self._collecting = False
         self._collect_deadline = 0.0
@@ -454,6 +1007,9 @@ class CANMaster:
 
         self._fault = fault_injector or FaultInjector()
 
+        # Trace binaria opzionale (open_trace_file)
+        self.recorder: Optional["TraceFileWriter"] = None
+
         # SocketCAN
         self.forward = bool(forward_to_socketcan and CAN_AVAILABLE)
         self.hw_bus = None
@@ -461,68 +1017,130 @@ class CANMaster:
         if self.forward:
             try:
                 self.hw_bus = can.interface.Bus(channel=can_channel, interface="socketcan")
-                print(f"[MASTER] SocketCAN enabled on {can_channel}")
+                TRACE.emit(TraceLevel.STATE, "[MASTER] SocketCAN enabled on %s", can_channel)
             except Exception as e:
-                print(f"[MASTER] SocketCAN init failed: {e}")
+                TRACE.emit(TraceLevel.STATE, "[MASTER] SocketCAN init failed: %s", e)
                 self.forward = False
 
+    def open_trace_file(self, path: str):
+        """Record bits, frames, error flags and TEC/REC snapshots to a binary trace."""
+        if not TRACE_FILE_AVAILABLE:
+            raise RuntimeError("can_trace module not available")
+        self.recorder = TraceFileWriter(path)
+
+    def record_tec(self, ecu: BaseECU):
+        if self.recorder is not None:
+            self.recorder.tec_rec(self.now(), ecu.name, ecu.tec, ecu.rec, ecu.state.value - 1)
+
+    def now(self) -> float:
+        """Tempo corrente della simulazione (wall-clock o virtuale)."""
+        return time.time() if self.realtime else self.kernel.now
+
     def register_slave(self, ecu: BaseECU):
         self.slaves[ecu.slave_id] = ecu
-        self.bit_queues[ecu.slave_id] = queue.Queue()
+        self.rx_decoder.subscribe(on_frame=ecu.on_frame_received, on_error=ecu.on_rx_error)
 
     def submit_request(self, req: TransmissionRequest):
         self._pending_starts.put(req)
+        self._wake_from_idle()
+
+    def _wake_from_idle(self):
+        if self.realtime:
+            self._wake.set()
+        elif self._parked and not self._stop:
+            self._parked = False
+            self.kernel.cancel(self._tick_ev)
+            self._tick_ev = self.kernel.schedule_in(0.0, self._bit_tick)
+
+    def schedule_timer(self, t: float, callback) -> list:
+        """Register ``callback()`` on the timer wheel at time ``t`` (thread-safe)."""
+        with self._timer_lock:
+            ev = self.timers.schedule_at(t, callback)
+        # Un master parcheggiato deve ricalcolare la prossima scadenza
+        self._wake_from_idle()
+        return ev
+
+    def _advance_timers(self):
+        with self._timer_lock:
+            self.timers.advance(self.now())
+
+    def _next_due_time(self) -> Optional[float]:
+        """Earliest timer on the wheel (ECU transmissions, status)."""
+        with self._timer_lock:
+            return self.timers.next_expiry()
 
     def get_bit_for_slave(self, slave_id: int, timeout: float = 0.01) -> Optional[BitTransmission]:
-        q = self.bit_queues.get(slave_id)
-        if q is None:
-            return None
-        try:
-            return q.get(timeout=timeout)
-        except queue.Empty:
+        if slave_id not in self.slaves:
             return None
+        reader = self.bit_readers.get(slave_id)
+        if reader is None:
+            reader = self.bit_readers[slave_id] = self.bus_ring.reader()
+        return reader.read(timeout=timeout)
+
+    def bit_overruns(self) -> int:
+        """Bus bits lost by readers that fell more than a ring behind the master."""
+        return sum(r.overruns for r in self.bit_readers.values())
 
     def start(self):
-        print("[MASTER] START")
+        TRACE.emit(TraceLevel.STATE, "[MASTER] START (%s)", 'real-time' if self.realtime else 'virtual time')
+        self.schedule_timer(self.now() + self.status_period_s, self._status_tick)
+        if not self.realtime:
+            self._tick_ev = self.kernel.schedule_in(self.tick, self._bit_tick)
+            return
         self._thread.start()
-        self._status_thread.start()
+
+    def run_for(self, seconds: float):
+        """Avanza la simulazione di ``seconds``: sleep in real-time, eventi in virtual time."""
+        if self.realtime:
+            time.sleep(seconds)
+        else:
+            self.kernel.run_until(self.kernel.now + seconds)
 
     def stop(self):
         self._stop = True
-        self._thread.join(timeout=2)
+        if self.realtime:
+            self._wake.set()
+            self._thread.join(timeout=2)
+        else:
+            self.kernel.stop()
+        if self.recorder is not None:
+            self.recorder.close()
         if self.hw_bus:
             try:
                 self.hw_bus.shutdown()
             except Exception:
                 pass
-        print("[MASTER] STOP")
+        TRACE.emit(TraceLevel.STATE, "[MASTER] STOP")
 
-    def _status_loop(self):
-        """Thread separato per stampare lo stato periodicamente."""
-        while not self._stop:
-            time.sleep(3.0)  # Ogni 3 secondi
-            
-            if self.state == MasterState.IDLE:
-                print(f"\n{'='*100}")
-                print(f"STATUS BUS (IDLE)")
-                print(f"{'='*100}")
-                
-                for sid in sorted(self.slaves.keys()):
-                    ecu = self.slaves[sid]
-                    time_left = ecu.get_time_until_tx()
-                    
-                    if ecu.is_bus_off():
-                        status = "BUS-OFF"
-                    elif ecu._pending_req is not None:
-                        status = "PENDING"
-                    elif time_left > 0:
-                        status = f"Attende {time_left:.2f}s"
-                    else:
-                        status = "PRONTA"
-                    
-                    print(f"  [{ecu.name:6s}] ID=0x{ecu.arb_id:03X} | TEC={ecu.tec:3d} REC={ecu.rec:3d} | {ecu.state.name:13s} | {status}")
-                
-                print(f"{'='*100}\n")
+    def _status_tick(self):
+        """Stampa lo stato periodicamente (ogni status_period_s) dalla timer wheel."""
+        if self._stop:
+            return
+        self._print_status()
+        self.schedule_timer(self.now() + self.status_period_s, self._status_tick)
+
+    def _print_status(self):
+        if self.state == MasterState.IDLE and TRACE.state:
+            TRACE.emit(TraceLevel.STATE, "\n%s", '='*100)
+            TRACE.emit(TraceLevel.STATE, "STATUS BUS (IDLE)")
+            TRACE.emit(TraceLevel.STATE, "%s", '='*100)
+
+            for sid in sorted(self.slaves.keys()):
+                ecu = self.slaves[sid]
+                time_left = ecu.get_time_until_tx()
+
+                if ecu.is_bus_off():
+                    status = "BUS-OFF"
+                elif ecu._pending_req is not None:
+                    status = "PENDING"
+                elif time_left > 0:
+                    status = f"Attende {time_left:.2f}s"
+                else:
+                    status = "PRONTA"
+
+                TRACE.emit(TraceLevel.STATE, "  [%-6s] ID=0x%03X | TEC=%3d REC=%3d | %-13s | %s", ecu.name, ecu.arb_id, ecu.tec, ecu.rec, ecu.state.name, status)
+
+            TRACE.emit(TraceLevel.STATE, "%s\n", '='*100)
 
     # ---- Error reporting ----
 
@@ -544,28 +1162,33 @@ class CANMaster:
             if sender_slave_id in self._passive_error_senders:
                 return
 
-            print(f"\n[MASTER] BIT ERROR (PASSIVE) rilevato da {sender.name} (offender={offender}) -> error flag recessivo, frame continua")
+            TRACE.emit(TraceLevel.ERROR, "\n[MASTER] BIT ERROR (PASSIVE) rilevato da %s (offender=%s) -> error flag recessivo, frame continua", sender.name, offender)
+            if self.recorder is not None:
+                self.recorder.error_flag(self.now(), True, sender.name)
             sender.apply_error_update(tec_delta=8)
             sender._silence_bit_errors = True
             self._passive_error_senders.add(sender_slave_id)
-            print(f"[MASTER] {sender.name}: TEC={sender.tec} (+8 per errore PASSIVE) State={sender.state.name}")
+            TRACE.emit(TraceLevel.ERROR, "[MASTER] %s: TEC=%s (+8 per errore PASSIVE) State=%s", sender.name, sender.tec, sender.state.name)
             return
 
         # -------------------------------
         # ERROR ACTIVE: errore visibile sul bus -> frame abortito
         # -------------------------------
         self._frame_ok = False
-        print(f"\n[MASTER] BIT ERROR rilevato da {sender.name} (offender={offender})")
+        if self.recorder is not None:
+            self.recorder.frame_error(self.now(), sender.arb_id, sender.name)
+        TRACE.emit(TraceLevel.ERROR, "\n[MASTER] BIT ERROR rilevato da %s (offender=%s)", sender.name, offender)
 
         # Solo i trasmettitori coinvolti (active_senders) incrementano TEC
         self._error_senders = list(set(self._active_senders)) if self._active_senders else [sender_slave_id]
-        print(f"[MASTER] ECU coinvolte nell'errore: {', '.join([self.slaves[sid].name for sid in self._error_senders if sid in self.slaves])}")
+        if TRACE.error:
+            TRACE.emit(TraceLevel.ERROR, "[MASTER] ECU coinvolte nell'errore: %s", ', '.join([self.slaves[sid].name for sid in self._error_senders if sid in self.slaves]))
 
         # TEC +8 per tutti i trasmettitori coinvolti
         for sid in self._error_senders:
             ecu = self.slaves[sid]
             ecu.apply_error_update(tec_delta=8)
-            print(f"[MASTER] {ecu.name}: TEC={ecu.tec} (+8 per errore) State={ecu.state.name}")
+            TRACE.emit(TraceLevel.ERROR, "[MASTER] %s: TEC=%s (+8 per errore) State=%s", ecu.name, ecu.tec, ecu.state.name)
 
             # IMPORTANT: dopo un errore ACTIVE, queste ECU NON devono rientrare in arbitraggio subito.
             # Le consideriamo "tentativo concluso": cancelliamo la richiesta pendente (rispetta tx_period).
@@ -583,6 +1206,8 @@ class CANMaster:
         has_active = any(self.slaves[sid].state is NodeState.ERROR_ACTIVE for sid in self._error_senders if sid in self.slaves)
         self._error_flag_bits_left = 6 if has_active else 8
         self._error_delim_bits_left = 8  # Error delimiter sempre 8 bit RECESSIVE
+        if self.recorder is not None:
+            self.recorder.error_flag(self.now(), not has_active, sender.name)
 
         # Ferma tutte le trasmissioni in corso
         for sid in set(list(self._active_senders) + list(self._contenders)):
@@ -591,25 +1216,59 @@ class CANMaster:
 
         self.state = MasterState.ERROR_FLAG
 
+    def _step(self):
+        """Un bit-time della macchina a stati del master."""
+        self.clock += 1
+        self._advance_timers()
+        if self.state == MasterState.IDLE:
+            self._handle_idle()
+        elif self.state == MasterState.ARBITRATION:
+            self._handle_arbitration_step()
+        elif self.state == MasterState.TRANSMIT:
+            self._handle_transmit_step()
+        elif self.state == MasterState.ERROR_FLAG:
+            self._handle_error_flag_step()
+        elif self.state == MasterState.ERROR_DELIM:
+            self._handle_error_delim_step()
+        elif self.state == MasterState.EOF:
+            self._handle_eof()
+        elif self.state == MasterState.INTERFRAME:
+            self._handle_interframe()
+
+    def _consume_skip_ticks(self) -> int:
+        skip, self._skip_ticks = self._skip_ticks, 0
+        return skip
+
     def _loop(self):
         while not self._stop:
-            self.clock += 1
-            if self.state == MasterState.IDLE:
-                self._handle_idle()
-            elif self.state == MasterState.ARBITRATION:
-                self._handle_arbitration_step()
-            elif self.state == MasterState.TRANSMIT:
-                self._handle_transmit_step()
-            elif self.state == MasterState.ERROR_FLAG:
-                self._handle_error_flag_step()
-            elif self.state == MasterState.ERROR_DELIM:
-                self._handle_error_delim_step()
-            elif self.state == MasterState.EOF:
-                self._handle_eof()
-            elif self.state == MasterState.INTERFRAME:
-                self._handle_interframe()
-
-            time.sleep(self.tick)
+            self._step()
+            if self._idle_park:
+                # Bus IDLE senza pending: dorme fino alla prossima ECU (o a una submit_request)
+                self._idle_park = False
+                due = self._next_due_time()
+                timeout = None if due is None else max(self.tick, due - time.time())
+                self._wake.wait(timeout)
+                self._wake.clear()
+                continue
+            time.sleep(self.tick * (1 + self._consume_skip_ticks()))
+
+    def _bit_tick(self):
+        if self._stop:
+            return
+        # questo tick è la catena attiva: una submit_request durante lo step (timer di una ECU)
+        # non deve crearne un'altra
+        self._parked = False
+        self._step()
+        if self._idle_park:
+            # Salta direttamente alla prossima next_tx_time; submit_request ci risveglia prima.
+            self._idle_park = False
+            self._parked = True
+            due = self._next_due_time()
+            self._tick_ev = None
+            if due is not None:
+                self._tick_ev = self.kernel.schedule_at(max(due, self.kernel.now + self.tick), self._bit_tick)
+            return
+        self._tick_ev = self.kernel.schedule_in(self.tick * (1 + self._consume_skip_ticks()), self._bit_tick)
 
     def _drain_start_intents(self) -> List[int]:
         """Collect ALL pending start intents."""
@@ -630,13 +1289,14 @@ class CANMaster:
                 new_contenders.append(req.slave_id)
         return new_contenders
 
-    def _broadcast(self, bus_bit: BitValue, sender_name: str, field: Field):
-        bt = BitTransmission(bus_bit, time.time(), sender_name, field)
-        for q in self.bit_queues.values():
-            try:
-                q.put_nowait(bt)
-            except Exception:
-                pass
+    def _broadcast(self, bus_bit: BitValue, sender_name: str, field: Field, now: Optional[float] = None):
+        if now is None:
+            now = self.now()
+        self.rx_decoder.feed(bus_bit.value, now)
+        if self.bit_readers:
+            self.bus_ring.publish(bus_bit.value, field.value, now, sender_name)
+        if self.recorder is not None:
+            self.recorder.bit(now, bus_bit.value, field.value, sender_name)
 
     def _handle_idle(self):
         # 1) Always drain new start intents (ECU that just asked to transmit).
@@ -645,7 +1305,7 @@ class CANMaster:
         #    already in PENDING, but its intent might have been drained earlier.
         self._drain_start_intents()
 
-        now = time.time()
+        now = self.now()
 
         # 2) Contenders are ALL ECU that currently have a pending frame.
         pending_ids = [
@@ -654,21 +1314,52 @@ class CANMaster:
             if (not ecu.is_bus_off()) and ecu.has_pending_frame()
         ]
 
-        # 3) If no one is pending, nothing to do.
+        # 3) If no one is pending, nothing to do: let the loop skip to the next due time.
         if not pending_ids and not self._collecting:
+            self._idle_park = True
             return
 
-        # 4) Start or continue the gather window.
+        # 4) Bus-idle synchronisation: every ECU pending at the start of this frame
+        #    slot joins the arbitration right away (no artificial delay).
+        #    The optional gather window only absorbs thread jitter in real-time mode.
+        if self.gather_window_s > 0:
+            contenders = self._gather_window(pending_ids, now)
+            if contenders is None:
+                return
+        else:
+            contenders = pending_ids
+
+        # 5) Start arbitration with every contender of this slot.
+        self._contenders = list(dict.fromkeys(contenders))
+        self._winner = None
+        self._active_senders = []
+        self._frame_ok = True
+        self._error_senders = []
+        self._fault.on_new_frame()
+
+        # Prepare all ECU for arbitration (bitstream ready).
+        for sid in self._contenders:
+            self.slaves[sid].begin_frame_if_needed()
+            self.slaves[sid].reset_for_retransmission()
+
+        names = ", ".join(self.slaves[s].name for s in self._contenders)
+        TRACE.emit(TraceLevel.FRAME, "")
+        TRACE.emit(TraceLevel.FRAME, "[MASTER] IDLE->ARBITRATION | Contenders: %s", names)
+        self.state = MasterState.ARBITRATION
+
+    def _gather_window(self, pending_ids: List[int], now: float) -> Optional[List[int]]:
+        """Legacy gather window: returns the contenders once it expires, else None."""
         if not self._collecting:
             self._collecting = True
             self._collect_deadline = now + self.gather_window_s
             self._collect_contenders = set(pending_ids)
 
             names = ", ".join(self.slaves[s].name for s in self._collect_contenders)
-            print(
-                f"[MASTER] IDLE: gather window ({self.gather_window_s:.2f}s) | Pending now: {names if names else '-'}"
+            TRACE.emit(
+                TraceLevel.FRAME,
+                "[MASTER] IDLE: gather window (%.2fs) | Pending now: %s", self.gather_window_s, names if names else '-'
             )
-            return
+            return None
 
         # Collect new contenders that became pending during the window.
         self._collect_contenders |= set(pending_ids)
@@ -676,33 +1367,16 @@ class CANMaster:
         # If (for any reason) nobody is pending anymore, stop collecting.
         if not self._collect_contenders:
             self._collecting = False
-            return
+            return None
 
         # Wait until the gather window expires.
         if now < self._collect_deadline:
-            return
+            return None
 
-        # 5) Window expired -> start arbitration with everything collected.
         contenders = list(self._collect_contenders)
         self._collecting = False
         self._collect_contenders = set()
-
-        self._contenders = list(dict.fromkeys(contenders))
-        self._winner = None
-        self._active_senders = []
-        self._frame_ok = True
-        self._error_senders = []
-        self._fault.on_new_frame()
-
-        # Prepare all ECU for arbitration (bitstream ready).
-        for sid in self._contenders:
-            self.slaves[sid].begin_frame_if_needed()
-            self.slaves[sid].reset_for_retransmission()
-
-        names = ", ".join(self.slaves[s].name for s in self._contenders)
-        print()
-        print(f"[MASTER] IDLE->ARBITRATION | Contenders: {names}")
-        self.state = MasterState.ARBITRATION
+        return contenders
 
     def _get_arbitration_bit(self, ecu: BaseECU) -> Optional[Tuple[BitValue, Field]]:
         nxt = ecu.peek_next_bit()
@@ -735,9 +1409,10 @@ class CANMaster:
         self._current_field = offered[0][2]
         bus_bit = self._fault.override_bus_bit(self._current_field, bus_bit)
 
-        # Stampa bit per bit durante arbitraggio
-        contenders_str = " | ".join([f"{self.slaves[sid].name}={int(b)}" for sid, b, _ in offered])
-        print(f"  [ARB] {self._current_field.name:12s} | {contenders_str} -> BUS={int(bus_bit)}")
+        # Traccia bit per bit durante arbitraggio (solo con livello BIT attivo)
+        if TRACE.bit:
+            contenders_str = " | ".join([f"{self.slaves[sid].name}={int(b)}" for sid, b, _ in offered])
+            TRACE.emit(TraceLevel.BIT, "  [ARB] %-12s | %s -> BUS=%s", self._current_field.name, contenders_str, int(bus_bit))
 
         self._broadcast(bus_bit, sender_name="BUS", field=self._current_field)
 
@@ -748,7 +1423,7 @@ class CANMaster:
                     losers.append(sid)
             for sid in losers:
                 ecu = self.slaves[sid]
-                print(f"  [ARB] {ecu.name} perde arbitraggio")
+                TRACE.emit(TraceLevel.FRAME, "  [ARB] %s perde arbitraggio", ecu.name)
                 ecu.reset_for_retransmission()
                 self._contenders.remove(sid)
 
@@ -761,7 +1436,7 @@ class CANMaster:
             self._active_senders = [self._winner]
             win_ecu = self.slaves[self._winner]
             win_ecu.mark_as_transmitting(True)
-            print(f"[MASTER] WINNER: {win_ecu.name} (ID=0x{win_ecu.arb_id:03X}) -> TRANSMIT")
+            TRACE.emit(TraceLevel.FRAME, "[MASTER] WINNER: %s (ID=0x%03X) -> TRANSMIT", win_ecu.name, win_ecu.arb_id)
             self.state = MasterState.TRANSMIT
             return
 
@@ -771,7 +1446,7 @@ class CANMaster:
             for sid in self._active_senders:
                 self.slaves[sid].mark_as_transmitting(True)
             names = ",".join(self.slaves[s].name for s in self._active_senders)
-            print(f"[MASTER] COLLISION! Stesso ID/RTR: {names} -> TRANSMIT (errore imminente)")
+            TRACE.emit(TraceLevel.FRAME, "[MASTER] COLLISION! Stesso ID/RTR: %s -> TRANSMIT (errore imminente)", names)
             self.state = MasterState.TRANSMIT
 
     def _handle_transmit_step(self):
@@ -782,6 +1457,11 @@ class CANMaster:
         if not self._active_senders:
             self._active_senders = [self._winner]
 
+        # Fast path: un solo trasmettitore e nessun fault -> nessuna collisione possibile
+        if len(self._active_senders) == 1 and not self._fault.is_active():
+            self._fast_forward_frame()
+            return
+
         offered: List[Tuple[int, BitValue, Field]] = []
         for sid in list(self._active_senders):
             ecu = self.slaves[sid]
@@ -806,12 +1486,13 @@ class CANMaster:
         bus_bit = BitValue.DOMINANT if any(b is BitValue.DOMINANT for _sid, b, _f in offered) else BitValue.RECESSIVE
         bus_bit = self._fault.override_bus_bit(field, bus_bit)
 
-        # Stampa bit per bit durante trasmissione
-        if len(self._active_senders) > 1:
-            senders_str = " | ".join([f"{self.slaves[sid].name}={int(b)}" for sid, b, _ in offered])
-            print(f"  [TX]  {self._current_field.name:12s} | {senders_str} -> BUS={int(bus_bit)}")
-        else:
-            print(f"  [TX]  {self._current_field.name:12s} | {self.slaves[self._winner].name}={int(bus_bit)}")
+        # Traccia bit per bit durante trasmissione
+        if TRACE.bit:
+            if len(self._active_senders) > 1:
+                senders_str = " | ".join([f"{self.slaves[sid].name}={int(b)}" for sid, b, _ in offered])
+                TRACE.emit(TraceLevel.BIT, "  [TX]  %-12s | %s -> BUS=%s", self._current_field.name, senders_str, int(bus_bit))
+            else:
+                TRACE.emit(TraceLevel.BIT, "  [TX]  %-12s | %s=%s", self._current_field.name, self.slaves[self._winner].name, int(bus_bit))
 
         self._broadcast(bus_bit, sender_name="BUS", field=field)
 
@@ -822,6 +1503,40 @@ class CANMaster:
             for sid, _b, _f in offered:
                 self.slaves[sid].advance()
 
+    def _fast_forward_frame(self):
+        """Send the rest of the winner's frame in one step.
+
+        With a single sender the bus always equals the sent bit, so bit monitoring
+        cannot fire: the remaining bits are broadcast as-is and the master goes to
+        EOF. Bit i of the remainder is stamped ``now + i * tick`` (its slot on the bus) and
+        the consumed bit-times are charged through ``_skip_ticks`` so that _handle_eof runs
+        at the same bus time as with bit-by-bit stepping.
+        """
+        ecu = self.slaves[self._winner]
+        bs = ecu._bitstream
+        if bs is None or not ecu.has_pending_frame():
+            ecu.mark_as_transmitting(False)
+            self.state = MasterState.EOF
+            return
+
+        start = ecu._cursor
+        n = len(bs.bits) - start
+        t0 = self.now()
+        for k, i in enumerate(range(start, len(bs.bits))):
+            self._broadcast(_BIT_VALUES[bs.bits[i]], sender_name="BUS", field=FIELD_BY_CODE[bs.fields[i]],
+                            now=t0 + k * self.tick)
+        ecu._cursor = len(bs.bits)
+        if n > 0:
+            self._current_field = bs.field_at(-1)
+        self._arbitration_window = False
+
+        TRACE.emit(TraceLevel.BIT, "  [TX]  FAST-FORWARD %d bit | %s (sender unico, nessuna collisione possibile)", n, ecu.name)
+
+        ecu.mark_as_transmitting(False)
+        self.clock += n
+        self._skip_ticks = n
+        self.state = MasterState.EOF
+
     def _handle_error_flag_step(self):
         """Gestisce ERROR FLAG: ACTIVE (6 bit DOM) o PASSIVE (8 bit REC)"""
         if not self._error_senders:
@@ -843,7 +1558,8 @@ class CANMaster:
             flag_type = "PASSIVE"
             senders_str = ", ".join([self.slaves[sid].name for sid in passive_senders])
         
-        print(f"  [ERR] ERROR_FLAG_{flag_type} | {senders_str} -> BUS={int(flag_bit)} (bit {7-self._error_flag_bits_left}/{'6' if flag_type=='ACTIVE' else '8'})")
+        if TRACE.bit:
+            TRACE.emit(TraceLevel.BIT, "  [ERR] ERROR_FLAG_%s | %s -> BUS=%s (bit %s/%s)", flag_type, senders_str, int(flag_bit), 7-self._error_flag_bits_left, '6' if flag_type=='ACTIVE' else '8')
         self._broadcast(flag_bit, sender_name="ERROR", field=Field.STUFF)
         
         self._error_flag_bits_left -= 1
@@ -853,7 +1569,7 @@ class CANMaster:
             for sid in passive_senders:
                 ecu = self.slaves[sid]
                 ecu.apply_success_update()
-                print(f"[MASTER] {ecu.name}: TEC={ecu.tec} (-1 per ERROR_FLAG_PASSIVE trasmesso) State={ecu.state.name}")
+                TRACE.emit(TraceLevel.ERROR, "[MASTER] %s: TEC=%s (-1 per ERROR_FLAG_PASSIVE trasmesso) State=%s", ecu.name, ecu.tec, ecu.state.name)
             
             self.state = MasterState.ERROR_DELIM
 
@@ -864,7 +1580,8 @@ class CANMaster:
             return
         
         delim_bit = BitValue.RECESSIVE
-        print(f"  [ERR] ERROR_DELIM | BUS={int(delim_bit)} (bit {9-self._error_delim_bits_left}/8)")
+        if TRACE.bit:
+            TRACE.emit(TraceLevel.BIT, "  [ERR] ERROR_DELIM | BUS=%d (bit %d/8)", int(delim_bit), 9 - self._error_delim_bits_left)
         self._broadcast(delim_bit, sender_name="ERROR_DELIM", field=Field.STUFF)
         
         self._error_delim_bits_left -= 1
@@ -877,13 +1594,16 @@ class CANMaster:
             sender0 = self.slaves[self._winner]
             req0 = sender0._pending_req
             if req0 is not None:
-                print(f"[MASTER] Frame OK: ID=0x{req0.arbitration_id:03X} data={req0.data.hex().upper()}")
+                if TRACE.frame:
+                    TRACE.emit(TraceLevel.FRAME, "[MASTER] Frame OK: ID=0x%03X data=%s", req0.arbitration_id, req0.data.hex().upper())
+                if self.recorder is not None:
+                    self.recorder.frame_ok(self.now(), req0.arbitration_id, req0.data, sender0.name)
                 
                 # CORREZIONE: TEC -= 1 dopo successo
                 for sid in (self._active_senders or [self._winner]):
                     ecu = self.slaves[sid]
                     ecu.apply_success_update()
-                    print(f"[MASTER] {ecu.name}: TEC={ecu.tec} (-1 per successo) State={ecu.state.name}")
+                    TRACE.emit(TraceLevel.FRAME, "[MASTER] %s: TEC=%s (-1 per successo) State=%s", ecu.name, ecu.tec, ecu.state.name)
                     ecu._pending_req = None
                     ecu._bitstream = None
                     ecu._cursor = 0
@@ -893,23 +1613,27 @@ class CANMaster:
                          continue
                     if ecu.rec>0:
                          ecu.rec -= 1
-                         print(f"[MASTER] {ecu.name}: REC={ecu.rec} (-1 per frame Ok ricevuto)")
+                         TRACE.emit(TraceLevel.FRAME, "[MASTER] %s: REC=%s (-1 per frame Ok ricevuto)", ecu.name, ecu.rec)
+                         self.record_tec(ecu)
 
                 if self.forward and self.hw_bus:
                     try:
                         msg = can.Message(arbitration_id=req0.arbitration_id, data=req0.data, is_extended_id=False)
                         self.hw_bus.send(msg)
                     except Exception as e:
-                        print(f"[MASTER] SocketCAN send failed: {e}")
+                        TRACE.emit(TraceLevel.ERROR, "[MASTER] SocketCAN send failed: %s", e)
         else:
             if self._error_senders:
-                print(f"[MASTER] Frame ERROR -> Retransmission")
+                TRACE.emit(TraceLevel.ERROR, "[MASTER] Frame ERROR -> Retransmission")
+                if self.recorder is not None and self._winner is not None:
+                    win = self.slaves[self._winner]
+                    self.recorder.frame_error(self.now(), win.arb_id, win.name)
                 if self.forward and self.hw_bus:
                     try:
                         msg = can.Message(arbitration_id=0, data=b"", is_error_frame=True)
                         self.hw_bus.send(msg)
                     except Exception as e:
-                        print(f"[MASTER] SocketCAN error-frame send failed: {e}")
+                        TRACE.emit(TraceLevel.ERROR, "[MASTER] SocketCAN error-frame send failed: %s", e)
 
             if self._winner is not None:
                 self.slaves[self._winner].reset_for_retransmission()
@@ -930,32 +1654,50 @@ class CANMaster:
 
 
 def main():
-    print("=" * 100)
-    print("CAN BUS SIMULATOR - DYNAMIC ARBITRATION TEST")
-    print("=" * 100)
-    print("\nConfigurazione:")
-    print("  - ECU con ID MINORE (priorita ALTA) -> periodo MAGGIORE (trasmette MENO spesso)")
-    print("  - ECU con ID MAGGIORE (priorita BASSA) -> periodo MINORE (trasmette PIU spesso)")
-    print("  - 2 ECU con STESSO ID -> generano COLLISION e incrementano TEC\n")
-    print("\nScenari testati:")
-    print("  1. ECU singola che trasmette da sola")
-    print("  2. Arbitraggio tra ECU con ID diversi")
-    print("  3. Collision tra ECU con stesso ID")
-    print("  4. ECU che vuole trasmettere mentre un'altra sta trasmettendo\n")
-    print("\nCORREZIONI IMPLEMENTATE:")
-    print("  - START_SLOT eliminato: tutte le ECU PENDING partecipano SUBITO all'arbitraggio")
-    print("  - Collision: ENTRAMBE le ECU incrementano TEC di +8")
-    print("  - ERROR FLAG ACTIVE: 6 bit DOMINANT (TEC < 128)")
-    print("  - ERROR FLAG PASSIVE: 8 bit RECESSIVE (TEC >= 128)")
-    print("  - TEC -= 1 dopo trasmissione con successo")
-    print("  - ERROR FLAG PASSIVE: +8 errore, -1 successo = +7 netto\n")
+    parser = argparse.ArgumentParser(description="CAN bus simulator (bit-level, dynamic arbitration)")
+    parser.add_argument("--realtime", action="store_true",
+                        help="wall-clock mode: one bit per time.sleep(tick) (default: virtual time)")
+    parser.add_argument("--duration", type=float, default=600.0,
+                        help="simulated seconds to run in virtual time (default: 600)")
+    parser.add_argument("--trace", default="frame,error,state",
+                        help="trace levels: bit,frame,error,state | all | none (default: frame,error,state)")
+    parser.add_argument("--trace-file", metavar="PATH",
+                        help="also record a binary trace (see can_trace.py) to PATH")
+    args = parser.parse_args()
+    TRACE.set_levels(TraceLevel.parse(args.trace))
+
+    TRACE.print("=" * 100)
+    TRACE.print("CAN BUS SIMULATOR - DYNAMIC ARBITRATION TEST")
+    TRACE.print("=" * 100)
+    TRACE.print("\nConfigurazione:")
+    TRACE.print("  - ECU con ID MINORE (priorita ALTA) -> periodo MAGGIORE (trasmette MENO spesso)")
+    TRACE.print("  - ECU con ID MAGGIORE (priorita BASSA) -> periodo MINORE (trasmette PIU spesso)")
+    TRACE.print("  - 2 ECU con STESSO ID -> generano COLLISION e incrementano TEC\n")
+    TRACE.print("\nScenari testati:")
+    TRACE.print("  1. ECU singola che trasmette da sola")
+    TRACE.print("  2. Arbitraggio tra ECU con ID diversi")
+    TRACE.print("  3. Collision tra ECU con stesso ID")
+    TRACE.print("  4. ECU che vuole trasmettere mentre un'altra sta trasmettendo\n")
+    TRACE.print("\nCORREZIONI IMPLEMENTATE:")
+    TRACE.print("  - START_SLOT eliminato: tutte le ECU PENDING partecipano SUBITO all'arbitraggio")
+    TRACE.print("  - Collision: ENTRAMBE le ECU incrementano TEC di +8")
+    TRACE.print("  - ERROR FLAG ACTIVE: 6 bit DOMINANT (TEC < 128)")
+    TRACE.print("  - ERROR FLAG PASSIVE: 8 bit RECESSIVE (TEC >= 128)")
+    TRACE.print("  - TEC -= 1 dopo trasmissione con successo")
+    TRACE.print("  - ERROR FLAG PASSIVE: +8 errore, -1 successo = +7 netto\n")
 
     master = CANMaster(
         tick_ms=0.5,
         forward_to_socketcan=False,
         can_channel="vcan0",
         fault_injector=None,
+        # real-time: le ECU partono da start() in istanti diversi (jitter wall-clock),
+        # serve una finestra per farle collidere
+        gather_window_s=0.30 if args.realtime else 0.0,
+        realtime=args.realtime,
     )
+    if args.trace_file:
+        master.open_trace_file(args.trace_file)
     master.start()
 
     # ========================================
@@ -982,13 +1724,14 @@ def main():
     # ECU_E: STESSO ID di ECU_D (0x300) -> COLLISION! -> periodo 14s, parte a 4s (con ECU_D)
     ecu_e = BaseECU("ECU_E", 5, 0x300, master, tx_period=14.0, start_delay=4.0, auto_tx=True)
 
-    print("ECU configurate:")
-    print(f"  - ECU_A: ID=0x050 (priorita ALTA)        -> TX ogni 6.0s  (start: 0.1s)")
-    print(f"  - ECU_B: ID=0x100 (priorita MEDIA-ALTA)  -> TX ogni 8.0s  (start: 2.0s)")
-    print(f"  - ECU_C: ID=0x200 (priorita MEDIA-BASSA) -> TX ogni 10.0s (start: 2.0s)")
-    print(f"  - ECU_D: ID=0x300 (priorita BASSA)       -> TX ogni 12.0s (start: 4.0s)")
-    print(f"  - ECU_E: ID=0x300 (COLLISION con D!)     -> TX ogni 14.0s (start: 4.0s)")
-    print("\n" + "=" * 100)
+    TRACE.flush()
+    TRACE.print("ECU configurate:")
+    TRACE.print(f"  - ECU_A: ID=0x050 (priorita ALTA)        -> TX ogni 6.0s  (start: 0.1s)")
+    TRACE.print(f"  - ECU_B: ID=0x100 (priorita MEDIA-ALTA)  -> TX ogni 8.0s  (start: 2.0s)")
+    TRACE.print(f"  - ECU_C: ID=0x200 (priorita MEDIA-BASSA) -> TX ogni 10.0s (start: 2.0s)")
+    TRACE.print(f"  - ECU_D: ID=0x300 (priorita BASSA)       -> TX ogni 12.0s (start: 4.0s)")
+    TRACE.print(f"  - ECU_E: ID=0x300 (COLLISION con D!)     -> TX ogni 14.0s (start: 4.0s)")
+    TRACE.print("\n" + "=" * 100)
 
     ecu_a.start()
     ecu_b.start()
@@ -996,38 +1739,46 @@ def main():
     ecu_d.start()
     ecu_e.start()
 
-    print("\nSimulazione avviata! (Ctrl+C per fermare)\n")
+    TRACE.flush()
+    TRACE.print("\nSimulazione avviata! (Ctrl+C per fermare)\n")
 
     try:
-        while True:
-            time.sleep(1.0)
+        while args.realtime or master.now() < args.duration:
+            master.run_for(1.0)
             
             # Check BUS-OFF
             if any(ecu.is_bus_off() for ecu in [ecu_a, ecu_b, ecu_c, ecu_d, ecu_e]):
-                print(f"\n{'*'*100}")
-                print(f"BUS-OFF RILEVATO!")
-                print(f"{'*'*100}")
-                print(f"  ECU_A: TEC={ecu_a.tec:3d} REC={ecu_a.rec:3d} State={ecu_a.state.name}")
-                print(f"  ECU_B: TEC={ecu_b.tec:3d} REC={ecu_b.rec:3d} State={ecu_b.state.name}")
-                print(f"  ECU_C: TEC={ecu_c.tec:3d} REC={ecu_c.rec:3d} State={ecu_c.state.name}")
-                print(f"  ECU_D: TEC={ecu_d.tec:3d} REC={ecu_d.rec:3d} State={ecu_d.state.name}")
-                print(f"  ECU_E: TEC={ecu_e.tec:3d} REC={ecu_e.rec:3d} State={ecu_e.state.name}")
-                print(f"{'*'*100}")
+                TRACE.flush()
+                TRACE.print(f"\n{'*'*100}")
+                TRACE.print(f"BUS-OFF RILEVATO!")
+                TRACE.print(f"{'*'*100}")
+                TRACE.print(f"  ECU_A: TEC={ecu_a.tec:3d} REC={ecu_a.rec:3d} State={ecu_a.state.name}")
+                TRACE.print(f"  ECU_B: TEC={ecu_b.tec:3d} REC={ecu_b.rec:3d} State={ecu_b.state.name}")
+                TRACE.print(f"  ECU_C: TEC={ecu_c.tec:3d} REC={ecu_c.rec:3d} State={ecu_c.state.name}")
+                TRACE.print(f"  ECU_D: TEC={ecu_d.tec:3d} REC={ecu_d.rec:3d} State={ecu_d.state.name}")
+                TRACE.print(f"  ECU_E: TEC={ecu_e.tec:3d} REC={ecu_e.rec:3d} State={ecu_e.state.name}")
+                TRACE.print(f"{'*'*100}")
                 break
             
     except KeyboardInterrupt:
-        print("\n\nSimulazione interrotta manualmente")
+        TRACE.flush()
+        TRACE.print("\n\nSimulazione interrotta manualmente")
 
     # Cleanup
-    print(f"\n{'='*100}")
-    print("[FINAL STATUS]")
-    print(f"{'='*100}")
-    print(f"  ECU_A: TEC={ecu_a.tec:3d} REC={ecu_a.rec:3d} State={ecu_a.state.name}")
-    print(f"  ECU_B: TEC={ecu_b.tec:3d} REC={ecu_b.rec:3d} State={ecu_b.state.name}")
-    print(f"  ECU_C: TEC={ecu_c.tec:3d} REC={ecu_c.rec:3d} State={ecu_c.state.name}")
-    print(f"  ECU_D: TEC={ecu_d.tec:3d} REC={ecu_d.rec:3d} State={ecu_d.state.name}")
-    print(f"  ECU_E: TEC={ecu_e.tec:3d} REC={ecu_e.rec:3d} State={ecu_e.state.name}")
-    print(f"{'='*100}\n")
+    TRACE.flush()
+    TRACE.print(f"\n{'='*100}")
+    TRACE.print("[FINAL STATUS]")
+    TRACE.print(f"{'='*100}")
+    TRACE.print(f"  ECU_A: TEC={ecu_a.tec:3d} REC={ecu_a.rec:3d} State={ecu_a.state.name}")
+    TRACE.print(f"  ECU_B: TEC={ecu_b.tec:3d} REC={ecu_b.rec:3d} State={ecu_b.state.name}")
+    TRACE.print(f"  ECU_C: TEC={ecu_c.tec:3d} REC={ecu_c.rec:3d} State={ecu_c.state.name}")
+    TRACE.print(f"  ECU_D: TEC={ecu_d.tec:3d} REC={ecu_d.rec:3d} State={ecu_d.state.name}")
+    TRACE.print(f"  ECU_E: TEC={ecu_e.tec:3d} REC={ecu_e.rec:3d} State={ecu_e.state.name}")
+    rx = master.rx_decoder
+    TRACE.print(f"  RX decoder: frames={rx.frames_ok} errors={rx.errors} | bit overruns={master.bit_overruns()}")
+    info = frame_cache_info()
+    TRACE.print(f"  Frame cache: hits={info.hits} misses={info.misses} size={info.currsize}/{info.maxsize}")
+    TRACE.print(f"{'='*100}\n")
 
     ecu_a.stop()
     ecu_b.stop()
@@ -1035,6 +1786,7 @@ def main():
     ecu_d.stop()
     ecu_e.stop()
     master.stop()
+    TRACE.close()
 
 
 if __name__ == "__main__":
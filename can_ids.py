@@ -0,0 +1,654 @@
+"""can_ids.py
+
+IDS del simulatore, condiviso da completo/weeping_withIDS.py e completo/canbusoffwithIDS.py:
+  - SimpleCANIDS: collisioni per ID e concentrazione sul bit di errore (finestre a bucket)
+  - TimingIDS / ClockSkewIDS: periodo e clock skew per ID sui frame OK
+  - IDSPipeline: analisi in un worker, fuori dal thread del bus
+"""
+
+from __future__ import annotations
+
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from typing import Deque, Optional
+
+from can_tracer import TRACE, TraceLevel
+
+
+class RunningHistogram:
+    """
+    Istogramma con add/remove in O(1): totale e moda mantenuti incrementalmente.
+      - moda: count-of-counts (bins[c] = chiavi con conteggio c) + conteggio massimo
+      - entropia: H = log2(N) - S/N con S = sum(c * log2(c)) ricalcolato con fsum a ogni
+        chiamata, O(chiavi distinte) (al più 64 bit per ID): niente errore float accumulato
+    """
+    __slots__ = ("counts", "total", "_bins", "_max")
+
+    def __init__(self):
+        self.counts = {}
+        self.total = 0
+        self._bins = defaultdict(dict)  # conteggio -> {chiave: None} (set ordinato per inserimento)
+        self._max = 0
+
+    @staticmethod
+    def _xlog(c: int) -> float:
+        return c * math.log2(c) if c > 1 else 0.0
+
+    def add(self, key):
+        c = self.counts.get(key, 0)
+        if c:
+            del self._bins[c][key]
+            if not self._bins[c]:
+                del self._bins[c]
+        self.counts[key] = c + 1
+        self._bins[c + 1][key] = None
+        if c + 1 > self._max:
+            self._max = c + 1
+        self.total += 1
+
+    def remove(self, key):
+        c = self.counts[key]
+        bucket = self._bins[c]
+        del bucket[key]
+        if not bucket:
+            del self._bins[c]
+            if c == self._max:
+                self._max = c - 1
+        if c > 1:
+            self.counts[key] = c - 1
+            self._bins[c - 1][key] = None
+        else:
+            del self.counts[key]
+        self.total -= 1
+
+    def mode(self):
+        """(chiave, conteggio) più frequente; a parità, la prima arrivata a quel conteggio."""
+        if not self.total:
+            return None, 0
+        return next(iter(self._bins[self._max])), self._max
+
+    def entropy(self) -> float:
+        n = self.total
+        if n <= 0:
+            return 0.0
+        s = math.fsum(self._xlog(c) for c in self.counts.values())
+        return max(0.0, math.log2(n) - s / n)
+
+
+class BucketedWindows:
+    """
+    Finestre scorrevoli multi-scala di un ID su bucket temporali a memoria fissa.
+
+    ring[e % n] = [e, {bit: c}, {offender: c}] per l'epoca e (bucket largo bucket_s), con n
+    bucket quanti ne servono alla finestra più lunga. Ogni finestra tiene i RunningHistogram
+    dei bucket che contiene e l'epoca più vecchia inclusa: quando il tempo avanza sottrae i
+    bucket scaduti (costo ammortizzato O(1) per evento e per finestra). La granularità è
+    bucket_s: una finestra w copre le ultime ceil(w/bucket_s) epoche.
+    """
+    __slots__ = ("windows_s", "spans", "ring", "head", "tails", "bits", "offs")
+
+    def __init__(self, windows_s, bucket_s: float):
+        self.windows_s = tuple(windows_s)  # crescenti
+        self.spans = [max(1, math.ceil(w / bucket_s - 1e-9)) for w in self.windows_s]
+        self.ring = [None] * self.spans[-1]
+        self.head = None
+        self.tails = [None] * len(self.spans)
+        self.bits = [RunningHistogram() for _ in self.spans]
+        self.offs = [RunningHistogram() for _ in self.spans]
+
+    def advance(self, epoch: int):
+        if self.head is not None and epoch <= self.head:
+            return
+        n = len(self.ring)
+        for i, span in enumerate(self.spans):
+            new_tail = epoch - span + 1
+            tail = self.tails[i]
+            if tail is not None and self.head is not None:
+                bits, offs = self.bits[i], self.offs[i]
+                for e in range(max(tail, self.head - n + 1), min(new_tail, self.head + 1)):
+                    slot = self.ring[e % n]
+                    if slot is None or slot[0] != e:
+                        continue
+                    for key, c in slot[1].items():
+                        for _ in range(c):
+                            bits.remove(key)
+                    for key, c in slot[2].items():
+                        for _ in range(c):
+                            offs.remove(key)
+            self.tails[i] = new_tail
+        self.head = epoch
+
+    def add(self, epoch: int, bit_idx: int, offender: str):
+        if self.head is not None and epoch < self.head:
+            epoch = self.head  # evento fuori ordine: finisce nel bucket corrente
+        self.advance(epoch)
+        n = len(self.ring)
+        slot = self.ring[epoch % n]
+        if slot is None or slot[0] != epoch:
+            slot = self.ring[epoch % n] = [epoch, {}, {}]
+        slot[1][bit_idx] = slot[1].get(bit_idx, 0) + 1
+        slot[2][offender] = slot[2].get(offender, 0) + 1
+        for bits, offs in zip(self.bits, self.offs):
+            bits.add(bit_idx)
+            offs.add(offender)
+
+    def empty(self) -> bool:
+        return self.bits[-1].total == 0
+
+
+class SimpleCANIDS:
+    """
+    IDS minimal:
+      1) collision rate per ID in finestra W
+      2) bit index concentration (mode share o entropia bassa)
+    Non assume attacker/victim a priori.
+
+    Le finestre (default 1s, 10s e window_s) sono calcolate dagli stessi bucket temporali
+    (BucketedWindows): memoria fissa per ID, e gli ID che tacciono vengono scaduti e rimossi
+    da uno sweep round-robin di pochi ID per chiamata.
+    """
+
+    def __init__(
+        self,
+        window_s: float = 30.0,          # finestra temporale
+        min_collisions: int = 6,        # N collisioni in window per trigger rate
+        mode_share_th: float = 0.75,    # >=60% collisioni sullo stesso bit
+        entropy_th: float = 2.0,        # entropia bassa => concentrato (0..~6 per 64 bit)
+        cooldown_s: float = 1.0,        # evita spam alert
+        warmup_s: float = 0.0,          # nessun alert nei primi warmup_s dal primo evento
+        only_data_field: bool = False,  # se True: ignora errori fuori dal campo DATA
+        windows_s=None,                 # finestre concorrenti (default: 1s, 10s, window_s)
+        bucket_s: float | None = None,  # larghezza bucket (default: finestra più corta / 4)
+        sweep_per_call: int = 2,        # ID scaduti/controllati per ogni observe_collision
+    ):
+        self.window_s = window_s
+        self.min_collisions = min_collisions
+        self.mode_share_th = mode_share_th
+        self.entropy_th = entropy_th
+        self.cooldown_s = cooldown_s
+        self.warmup_s = warmup_s
+        self.only_data_field = only_data_field
+        self._t0 = None  # ts del primo evento osservato (base del warmup)
+
+        if windows_s is None:
+            windows_s = [w for w in (1.0, 10.0) if w < window_s] + [window_s]
+        self.windows_s = tuple(sorted(set(float(w) for w in windows_s)))
+        self.bucket_s = float(bucket_s) if bucket_s else self.windows_s[0] / 4
+        self.sweep_per_call = sweep_per_call
+
+        # windows[arb_id] = BucketedWindows (solo ID con collisioni ancora in finestra)
+        self.windows = {}
+        self._sweep_order = deque()
+        self._last_alert_ts = {}  # per arb_id
+
+    def _epoch(self, now: float) -> int:
+        return int(now // self.bucket_s)
+
+    def _sweep(self, epoch: int):
+        """Scade qualche altro ID per chiamata; quelli senza più eventi vengono rimossi."""
+        for _ in range(min(self.sweep_per_call, len(self._sweep_order))):
+            arb_id = self._sweep_order.popleft()
+            win = self.windows.get(arb_id)
+            if win is None:
+                continue
+            win.advance(epoch)
+            if win.empty():
+                del self.windows[arb_id]
+            else:
+                self._sweep_order.append(arb_id)
+
+    def observe_collision(self, arb_id: int, bit_idx: int, offender_name: str, ts: float | None = None,
+                          field=None):
+        # confronto per nome: ogni simulatore ha il proprio enum Field
+        if self.only_data_field and field is not None and getattr(field, "name", field) != "DATA":
+            return
+        now = time.time() if ts is None else float(ts)
+        if self._t0 is None:
+            self._t0 = now
+        epoch = self._epoch(now)
+        win = self.windows.get(arb_id)
+        if win is None:
+            win = self.windows[arb_id] = BucketedWindows(self.windows_s, self.bucket_s)
+            self._sweep_order.append(arb_id)
+        win.add(epoch, int(bit_idx), str(offender_name))
+        self._sweep(epoch)
+
+    def check_alert(self, arb_id: int, ts: float | None = None):
+        now = time.time() if ts is None else float(ts)
+        win = self.windows.get(arb_id)
+        if win is None:
+            return None
+        win.advance(self._epoch(now))
+
+        if now - self._t0 < self.warmup_s:
+            return None
+
+        # cooldown anti-spam
+        last = self._last_alert_ts.get(arb_id, 0.0)
+        if now - last < self.cooldown_s:
+            return None
+
+        # dalla finestra più corta alla più lunga: la prima che scatta genera l'alert
+        for i, w in enumerate(win.windows_s):
+            bit_hist = win.bits[i]
+
+            # collision rate proxy: numero collisioni in finestra
+            n = bit_hist.total
+            if n < self.min_collisions:
+                continue
+
+            # bit concentration
+            mode_bit, mode_cnt = bit_hist.mode()
+            mode_share = mode_cnt / n
+            H = bit_hist.entropy()
+
+            # decisione: forte se mode_share alto oppure entropia bassa
+            # anche ricalcolata con fsum H può superare di qualche ulp il valore esatto
+            # (es. 5/5/5/5 su 4 bit: H esatta 2.0): confronto con tolleranza relativa
+            concentrated = (mode_share >= self.mode_share_th
+                            or H <= self.entropy_th
+                            or math.isclose(H, self.entropy_th, rel_tol=1e-12))
+            if not concentrated:
+                continue
+
+            # (opzionale) offender più frequente nella finestra
+            top_off, top_off_cnt = win.offs[i].mode()
+            top_off_share = top_off_cnt / n
+
+            self._last_alert_ts[arb_id] = now
+            return {
+                "arb_id": arb_id,
+                "window_s": w,
+                "collisions": n,
+                "mode_bit": mode_bit,
+                "mode_share": mode_share,
+                "entropy": H,
+                "top_offender": top_off,
+                "top_offender_share": top_off_share,
+                "scales": {ws: h.total for ws, h in zip(win.windows_s, win.bits)},
+            }
+        return None
+
+
+class TimingIDS:
+    """
+    Modello di timing per ID in streaming, O(1) per frame OK.
+
+    Per ogni ID: EWMA del periodo (mean) e della deviazione assoluta (dev), come lo stimatore
+    RTT di TCP. Segnala:
+      - new_id: ID mai visto che compare dopo learning_s (es. reset frame di _reduce_tec
+        sotto la vittima)
+      - early:  frame in anticipo sul periodo atteso (frame extra nello slot della vittima);
+        non sposta la fase, il prossimo frame legittimo resta in orario
+      - late:   gap molto più lungo del periodo e non multiplo (ECU silenziata / fuori fase);
+        riallinea la fase
+    Un gap vicino a k*periodo sono k-1 slot persi (arbitraggio perso, frame scartati dal master):
+    come gli slots di ClockSkewIDS, riallinea la fase senza alert.
+    Tolleranza sul gap: k_dev * dev + min(min_jitter_s, max_jitter_frac * periodo).
+    I gap anomali non aggiornano il modello.
+    """
+
+    def __init__(
+        self,
+        alpha: float = 0.125,           # peso EWMA del periodo
+        beta: float = 0.25,             # peso EWMA della deviazione
+        k_dev: float = 4.0,             # soglia: |gap - mean| > k_dev * dev + min_jitter_s
+        min_jitter_s: float = 0.02,     # jitter minimo tollerato (scheduling, attesa del bus/arbitraggio)
+        max_jitter_frac: float = 0.25,  # ...ma al più questa frazione del periodo (ID veloci)
+        min_frames: int = 4,            # gap osservati prima di giudicare il periodo di un ID
+        learning_s: float = 30.0,       # ID nuovi dopo questo tempo dal primo frame => new_id
+        cooldown_s: float = 1.0,        # evita spam alert per ID
+    ):
+        self.alpha = alpha
+        self.beta = beta
+        self.k_dev = k_dev
+        self.min_jitter_s = min_jitter_s
+        self.max_jitter_frac = max_jitter_frac
+        self.min_frames = min_frames
+        self.learning_s = learning_s
+        self.cooldown_s = cooldown_s
+        self._t0 = None
+        # state[arb_id] = [last_ts, mean, dev, n_gaps, last_alert_ts]
+        self.state = {}
+
+    def _alert(self, st, arb_id: int, reason: str, now: float, gap=None):
+        if now - st[4] < self.cooldown_s:
+            return None
+        st[4] = now
+        return {
+            "kind": "timing",
+            "arb_id": arb_id,
+            "reason": reason,
+            "gap_s": gap,
+            "period_s": st[1],
+            "jitter_s": st[2],
+        }
+
+    def observe_frame(self, arb_id: int, ts: float | None = None):
+        now = time.time() if ts is None else float(ts)
+        if self._t0 is None:
+            self._t0 = now
+
+        st = self.state.get(arb_id)
+        if st is None:
+            st = self.state[arb_id] = [now, None, 0.0, 0, float("-inf")]
+            if now - self._t0 > self.learning_s:
+                return self._alert(st, arb_id, "new_id", now)
+            return None
+
+        gap = now - st[0]
+        if st[1] is None:
+            st[0], st[1], st[3] = now, gap, 1
+            return None
+
+        err = gap - st[1]
+        tol = self.k_dev * st[2] + min(self.min_jitter_s, self.max_jitter_frac * st[1])
+        if st[3] >= self.min_frames and abs(err) > tol:
+            if err < 0:
+                return self._alert(st, arb_id, "early", now, gap)
+            st[0] = now
+            slots = round(gap / st[1])
+            if slots >= 2 and abs(gap - slots * st[1]) <= tol:
+                return None
+            return self._alert(st, arb_id, "late", now, gap)
+
+        st[0] = now
+        st[1] += self.alpha * err
+        st[2] += self.beta * (abs(err) - st[2])
+        st[3] += 1
+        return None
+
+
+class ClockSkewIDS:
+    """
+    Fingerprint del clock del trasmettitore di ogni ID (stile CIDS), O(1) per frame OK.
+
+    Dopo min_frames gap il periodo dell'ID viene fissato al valore nominale più vicino
+    (mediana dei gap arrotondata a 3 cifre significative, es. 10 ms, 6.5 s); da lì l'offset
+    accumulato O = (ts - t0) - n*T (n = slot trascorsi) cresce linearmente con lo skew del
+    clock del trasmettitore rispetto al periodo nominale. Un RLS a 2 parametri con forgetting
+    (O ~ offset + skew*t, prior debole) lo stima online. L'errore a priori, diviso per la sua
+    deviazione attesa (rumore * sqrt(1 + phi'P phi), quindi già corretto per l'incertezza dei
+    parametri), alimenta un CUSUM bilaterale: se un altro nodo (con un altro clock) trasmette
+    con quell'ID, lo skew cambia, l'errore deriva e il CUSUM supera la soglia.
+
+    La soglia h si ricava da arl0_frames (frame medi tra due falsi allarmi per ID,
+    approssimazione di Siegmund): con migliaia di ID il tasso totale di falsi allarmi è
+    n_ID * rate_frame / arl0_frames. Dopo un alert il modello riparte (nuovo t0, stesso T,
+    skew e rumore correnti) e si riadatta al nuovo clock; frame extra nello stesso slot
+    (n invariato) non aggiornano il modello: li vede TimingIDS.
+    """
+
+    def __init__(
+        self,
+        min_frames: int = 8,            # gap per fissare T / frame di warm-up dopo un restart
+        warmup_frames: int = 32,        # frame per stimare il rumore prima del primo CUSUM
+        forgetting: float = 0.995,      # lambda dell'RLS
+        cusum_k: float = 0.5,           # slack del CUSUM (in sigma)
+        cusum_h: Optional[float] = None,  # soglia del CUSUM (in sigma); None => da arl0_frames
+        arl0_frames: float = 1e7,       # frame medi tra falsi allarmi (per ID) se cusum_h è None
+        sigma_beta: float = 0.01,       # peso EWMA della varianza dell'errore normalizzato
+        min_sigma_s: float = 1e-6,      # rumore minimo assunto sull'errore
+        prior_var: float = 1e6,         # P iniziale dell'RLS (in unità di rumore^2): prior debole
+        cooldown_s: float = 1.0,        # evita spam alert per ID
+    ):
+        self.min_frames = min_frames
+        self.warmup_frames = max(warmup_frames, min_frames)
+        self.forgetting = forgetting
+        self.cusum_k = cusum_k
+        self.cusum_h = self.cusum_threshold(arl0_frames, cusum_k) if cusum_h is None else cusum_h
+        self.sigma_beta = sigma_beta
+        self.min_sigma_s = min_sigma_s
+        self.prior_var = prior_var
+        self.cooldown_s = cooldown_s
+        # state[arb_id] = [t0, last_ts, n (gap o update dal reset), gaps di apprendimento, T, slots,
+        #                  b, s, p00, p01, p11, var (errore normalizzato, s^2), n_var,
+        #                  cusum_pos, cusum_neg, last_alert_ts]
+        self.state = {}
+
+    @staticmethod
+    def cusum_threshold(arl0_frames: float, k: float) -> float:
+        """h tale che il CUSUM bilaterale su N(0,1) dia in media un falso allarme ogni arl0_frames.
+
+        Siegmund: ARL0 unilaterale = (exp(2kb) - 2kb - 1) / (2k^2), b = h + 1.166; il
+        bilaterale ne ha circa la metà.
+        """
+        lo, hi = 0.0, 100.0
+        for _ in range(100):
+            h = (lo + hi) / 2
+            b = 2 * k * (h + 1.166)
+            if (math.exp(b) - b - 1) / (2 * k * k) / 2 < arl0_frames:
+                lo = h
+            else:
+                hi = h
+        return hi
+
+    @staticmethod
+    def nominal_period(T: float) -> float:
+        """T arrotondato a 3 cifre significative (i periodi di trasmissione sono valori tondi)."""
+        q = 10.0 ** (math.floor(math.log10(T)) - 2)
+        return round(T / q) * q
+
+    def _restart(self, st, now: float):
+        """Nuova origine per l'offset accumulato; T, skew stimato e rumore restano."""
+        st[0] = now
+        st[2] = 0
+        st[5] = 0
+        st[6] = 0.0
+        st[8], st[9], st[10] = self.prior_var, 0.0, self.prior_var
+        st[13] = st[14] = 0.0
+
+    def skew_ppm(self, arb_id: int):
+        st = self.state.get(arb_id)
+        return None if st is None or st[4] is None else st[7] * 1e6
+
+    def observe_frame(self, arb_id: int, ts: float | None = None):
+        now = time.time() if ts is None else float(ts)
+        st = self.state.get(arb_id)
+        if st is None:
+            self.state[arb_id] = [now, now, 0, [], None, 0, 0.0, 0.0, 0.0, 0.0, 0.0, 0.0, 0,
+                                  0.0, 0.0, float("-inf")]
+            return None
+
+        gap = now - st[1]
+        T = st[4]
+        if T is None:
+            # apprendimento del periodo nominale (mediana: robusta a frame persi o extra)
+            st[1] = now
+            st[2] += 1
+            st[3].append(gap)
+            if st[2] >= self.min_frames:
+                median = sorted(st[3])[len(st[3]) // 2]
+                st[3] = None
+                if median <= 0:
+                    st[4] = None
+                    st[2] = 0
+                    st[3] = []
+                    return None
+                st[4] = self.nominal_period(median)
+                self._restart(st, now)
+            return None
+
+        slots = round(gap / T)
+        if slots < 1:
+            return None  # frame extra nello slot corrente
+        st[1] = now
+        st[5] += slots
+        t = now - st[0]
+        offset = t - st[5] * T
+
+        # RLS a priori: e = O - (b + s*t), phi = [1, t]
+        b, s, p00, p01, p11 = st[6], st[7], st[8], st[9], st[10]
+        e = offset - (b + s * t)
+        pp0 = p00 + p01 * t
+        pp1 = p01 + p11 * t
+        lam = self.forgetting
+        den = lam + pp0 + pp1 * t
+        k0, k1 = pp0 / den, pp1 / den
+        st[6] = b + k0 * e
+        st[7] = s + k1 * e
+        st[8] = (p00 - k0 * pp0) / lam
+        st[9] = (p01 - k0 * pp1) / lam
+        st[10] = (p11 - k1 * pp1) / lam
+        st[2] += 1
+        if st[2] <= 2:
+            return None  # servono 2 punti per offset e skew: l'errore non dice nulla
+
+        # errore normalizzato per l'incertezza dei parametri: varianza attesa = rumore^2
+        u = e / math.sqrt(den / lam)
+        if st[12] < self.warmup_frames:
+            # stima del rumore (media delle u^2) prima di abilitare il CUSUM
+            st[12] += 1
+            st[11] += (u * u - st[11]) / st[12]
+            return None
+        sigma = max(math.sqrt(st[11]), self.min_sigma_s)
+        z = u / sigma
+        if st[2] > self.min_frames:
+            st[13] = max(0.0, st[13] + z - self.cusum_k)
+            st[14] = max(0.0, st[14] - z - self.cusum_k)
+        if st[13] > self.cusum_h or st[14] > self.cusum_h:
+            direction = "skew_up" if st[13] > self.cusum_h else "skew_down"
+            alert = {
+                "kind": "skew",
+                "arb_id": arb_id,
+                "reason": direction,
+                "skew_ppm": st[7] * 1e6,
+                "skew_ci_ppm": 1.96 * sigma * math.sqrt(max(st[10], 0.0)) * 1e6,
+                "offset_s": st[6],
+                "error_s": e,
+                "sigma_s": sigma,
+            }
+            self._restart(st, now)
+            if now - st[15] < self.cooldown_s:
+                return None
+            st[15] = now
+            return alert
+
+        # rumore aggiornato con l'errore limitato a 3 sigma: un drift non gonfia la stima
+        zc = max(-3.0, min(3.0, z)) * sigma
+        st[11] += self.sigma_beta * (zc * zc - st[11])
+        return None
+
+
+def format_ids_alert(alert: dict) -> str:
+    if alert.get("kind") == "skew":
+        return (
+            f"[IDS] SKEW ALERT su ID=0x{alert['arb_id']:03X} | {alert['reason']} | "
+            f"skew={alert['skew_ppm']:.1f}±{alert['skew_ci_ppm']:.1f}ppm err={alert['error_s']*1e6:.1f}us sigma={alert['sigma_s']*1e6:.1f}us"
+        )
+    if alert.get("kind") == "timing":
+        gap = f"gap={alert['gap_s']*1000:.1f}ms " if alert["gap_s"] is not None else ""
+        period = f"period={alert['period_s']*1000:.1f}ms " if alert["period_s"] is not None else ""
+        return (
+            f"[IDS] TIMING ALERT su ID=0x{alert['arb_id']:03X} | {alert['reason']} | "
+            f"{gap}{period}jitter={alert['jitter_s']*1000:.2f}ms"
+        )
+    return (
+        f"[IDS] ALERT su ID=0x{alert['arb_id']:03X} | "
+        f"collisions={alert['collisions']} in {alert['window_s']}s | "
+        f"mode_bit={alert['mode_bit']} ({alert['mode_share']*100:.1f}%) | "
+        f"H={alert['entropy']:.2f} | top_off={alert['top_offender']} ({alert['top_offender_share']*100:.1f}%)"
+    )
+
+
+def log_ids_alert(alert: dict):
+    if TRACE.error:
+        TRACE.emit(TraceLevel.ERROR, format_ids_alert(alert))
+
+
+class IDSPipeline:
+    """
+    Porta SimpleCANIDS fuori dal percorso di arbitraggio.
+
+    Il master chiama publish() (solo un append sulla deque, atomico sotto GIL: niente lock
+    condivisi con il worker); un thread dedicato drena gli eventi, aggiorna l'IDS con il
+    timestamp originale e notifica gli alert ai subscriber (log, stop simulazione, metriche)
+    invece di terminare il processo.
+    """
+
+    def __init__(self, ids: SimpleCANIDS, idle_wait_s: float = 0.1, frame_detectors=()):
+        self.ids = ids
+        # detector sui frame OK (TimingIDS, ClockSkewIDS): observe_frame(arb_id, ts) -> alert | None
+        self.frame_detectors = list(frame_detectors)
+        self.idle_wait_s = idle_wait_s
+        self._events: Deque[tuple] = deque()
+        self._wakeup = threading.Event()
+        self._subscribers = []
+        self._thread = None
+        self._stop = False
+
+        # metriche
+        self.published = 0
+        self.processed = 0
+        self.alerts = 0
+        self.max_lag_s = 0.0  # ritardo massimo tra publish e analisi
+
+    def subscribe(self, callback):
+        """callback(alert: dict), chiamata dal worker della pipeline."""
+        self._subscribers.append(callback)
+        return callback
+
+    def publish(self, arb_id: int, bit_idx: int, offender_name: str, ts: float | None = None, field=None):
+        self._events.append((arb_id, bit_idx, offender_name, time.time() if ts is None else ts, field))
+        self.published += 1
+        self._wakeup.set()
+
+    def publish_frame(self, arb_id: int, ts: float | None = None):
+        """Frame OK per i detector di timing (ignorato se la pipeline non ne ha)."""
+        if not self.frame_detectors:
+            return
+        self._events.append((arb_id, None, None, time.time() if ts is None else ts, None))
+        self.published += 1
+        self._wakeup.set()
+
+    def start(self):
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="ids-pipeline", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Ferma il worker dopo aver processato gli eventi già pubblicati."""
+        self._stop = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
+        self.drain()
+
+    def _run(self):
+        while not self._stop:
+            self._wakeup.wait(self.idle_wait_s)
+            self._wakeup.clear()
+            self.drain()
+
+    def drain(self) -> int:
+        """Processa tutti gli eventi in coda (un solo consumer alla volta)."""
+        n = 0
+        while True:
+            try:
+                arb_id, bit_idx, offender, ts, field = self._events.popleft()
+            except IndexError:
+                return n
+            if offender is None:
+                for detector in self.frame_detectors:
+                    alert = detector.observe_frame(arb_id, ts)
+                    if alert:
+                        self._notify(alert)
+            else:
+                self.ids.observe_collision(arb_id, bit_idx, offender, ts=ts, field=field)
+                alert = self.ids.check_alert(arb_id, ts=ts)
+                if alert:
+                    self._notify(alert)
+            n += 1
+            self.processed += 1
+            self.max_lag_s = max(self.max_lag_s, time.time() - ts)
+
+    def _notify(self, alert: dict):
+        self.alerts += 1
+        for callback in list(self._subscribers):
+            try:
+                callback(alert)
+            except Exception as e:
+                TRACE.emit(TraceLevel.ERROR, "[IDS] subscriber %r failed: %s", callback, e)
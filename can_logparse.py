@@ -0,0 +1,454 @@
+"""can_logparse.py
+
+Parser in streaming dei log testuali dei simulatori (completo/*.txt, completo/alias.log,
+loggy2.txt, log/*.txt) e delle catture candump.
+
+``parse_lines``/``parse_file`` sono generatori: leggono una riga alla volta e
+producono eventi tipizzati (dataclass), quindi la memoria resta costante anche sui
+log da decine di migliaia di righe. ``map_files`` applica una funzione di riduzione
+(es. ``summarize_file``) a più file in parallelo con un process pool.
+
+    python can_logparse.py completo/log_weep.txt completo/lastlog.txt --workers 4
+"""
+
+from __future__ import annotations
+
+import argparse
+import re
+from collections import Counter, defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+
+# ---- Eventi ----
+
+@dataclass
+class LogEvent:
+    source: str
+    line_no: int
+
+
+@dataclass
+class FrameOK(LogEvent):
+    arb_id: int
+    data: bytes
+
+
+@dataclass
+class CandumpFrame(LogEvent):
+    timestamp: float
+    channel: str
+    arb_id: int
+    data: bytes
+
+
+@dataclass
+class CounterUpdate(LogEvent):
+    """``[MASTER] X: TEC=N (+8 per errore ACTIVE) State=...`` (o REC=...)."""
+    ecu: str
+    counter: str  # "TEC" | "REC"
+    value: int
+    delta: Optional[int]
+    reason: str
+    state: Optional[str]
+
+
+@dataclass
+class TxRequest(LogEvent):
+    """``[ECU_B] VUOLE TRASMETTERE (ID=0x200) TEC=N REC=N State=...``"""
+    ecu: str
+    arb_id: int
+    tec: int
+    rec: int
+    state: str
+
+
+@dataclass
+class EcuReport(LogEvent):
+    """Riga in cui una ECU riporta i propri contatori (log per-ECU di log/*.txt, loggy2.txt,
+    STATUS / FINAL STATUS): ``[ECU_X] TX id=0x.. data=.. (state=.., TEC=..)``,
+    ``Rilevato ERROR_FLAG ... → TEC=..``, ``Richiedo TX data=..``, ``ECU_A: TEC=  0, REC=  0, ...``."""
+    ecu: str
+    kind: str  # tx | tx_request | tx_success | error_flag | error | stop | status
+    tec: Optional[int]
+    rec: Optional[int]
+    state: Optional[str]
+    arb_id: Optional[int] = None
+    data: Optional[bytes] = None
+
+
+@dataclass
+class Collision(LogEvent):
+    ecus: Tuple[str, ...]
+
+
+@dataclass
+class BitError(LogEvent):
+    detector: str
+    offender: str
+
+
+@dataclass
+class ErrorFlag(LogEvent):
+    passive: bool
+
+
+@dataclass
+class IDSAlert(LogEvent):
+    arb_id: int
+    collisions: int
+    window_s: float
+    mode_bit: int
+    mode_share: float
+    entropy: float
+    top_offender: str
+    top_offender_share: float
+
+
+@dataclass
+class DetectorAlert(LogEvent):
+    """``[IDS] TIMING ALERT su ID=..`` / ``[IDS] SKEW ALERT su ID=..`` (detector per-frame)."""
+    kind: str  # timing | skew
+    arb_id: int
+    reason: str
+    values: Dict[str, float] = field(default_factory=dict)  # gap/period/jitter (ms), skew (ppm), err/sigma (us)
+
+
+@dataclass
+class AttackerEvent(LogEvent):
+    """Qualsiasi riga ``[ATTACKER...]``; ``kind`` e ``values`` per quelle note."""
+    kind: str  # attack | skip | cleanup | sniff | sniffed | victim | bus_off | error_passive | phase | info
+    message: str
+    values: Dict[str, float] = field(default_factory=dict)
+
+
+@dataclass
+class BusOff(LogEvent):
+    ecu: str
+    tec: int
+
+
+@dataclass
+class AttackOutcome(LogEvent):
+    success: bool
+    victim: Optional[str] = None
+
+
+# ---- Pattern ----
+
+_HEX = r"0x[0-9A-Fa-f]+"
+
+_RE_FRAME_OK = re.compile(r"\[MASTER\] Frame OK: ID=(" + _HEX + r") data=([0-9A-Fa-f]*)")
+_RE_COUNTER = re.compile(
+    r"\[MASTER\] (\S+): (TEC|REC)=(\d+)(?: REC=(\d+))?(?: \(([+-]\d+) ([^)]*)\))?(?: State=(\w+))?"
+)
+_RE_COLLISION = re.compile(r"\[MASTER\] COLLISION! Stesso ID(?:/RTR)?(?: tra)?: ([^-]+?)(?: ->.*)?$")
+_RE_BIT_ERROR = re.compile(r"\[MASTER\] BIT ERROR(?: \(PASSIVE\))? rilevato da (\S+) \(offender=([^)]*)\)")
+_RE_ERROR_FLAG = re.compile(r"\[MASTER\] Sending ERROR FLAG (ACTIVE|PASSIVE)")
+_RE_TX_REQUEST = re.compile(
+    r"\[(\S+)\] VUOLE TRASMETTERE \(ID=(" + _HEX + r")\) TEC=(\d+) REC=(\d+) State=(\w+)"
+)
+_RE_BUS_OFF = re.compile(r"\[(\S+?)\] \*\*\* ENTERED BUS-OFF STATE \*\*\* \(TEC=(\d+)\)")
+_RE_IDS_ALERT = re.compile(
+    r"\[IDS\] ALERT su ID=(" + _HEX + r") \| collisions=(\d+) in ([\d.]+)s \| "
+    r"mode_bit=(-?\d+) \(([\d.]+)%\) \| H=([\d.]+) \| top_off=(\S+) \(([\d.]+)%\)"
+)
+_RE_DETECTOR_ALERT = re.compile(r"\[IDS\] (TIMING|SKEW) ALERT su ID=(" + _HEX + r") \| (\w+)(.*)$")
+_RE_CANDUMP = re.compile(r"^\((\d+(?:\.\d+)?)\)\s+(\S+)\s+([0-9A-Fa-f]{1,8})#([0-9A-Fa-f]*)")
+_RE_VICTIM_BUS_OFF = re.compile(r"Victim (\S+) \(ID=" + _HEX + r"\) is in BUS-OFF state")
+
+_RE_VCAN_DATA = re.compile(r"\[MASTER\] → \S+ DATA id=(" + _HEX + r") data=([0-9A-Fa-f]*)")
+_RE_VCAN_ERROR = re.compile(r"\[MASTER\] → \S+ ERROR_FLAG ERROR_(ACTIVE|PASSIVE)")
+
+# righe delle ECU con i propri contatori
+_RE_ECU_LINE = re.compile(r"^\[([^\]\s]+)\] (.*)$")
+_RE_ECU_TEC = re.compile(r"TEC(?:=\s*| dopo errore: )(\d+)")
+_RE_ECU_REC = re.compile(r"REC=\s*(\d+)")
+_RE_ECU_STATE = re.compile(r"state(?:=| \w+→)(\w+)")
+_RE_ECU_ID = re.compile(r"\b(?:id|ID)=(" + _HEX + r")")
+_RE_ECU_DATA = re.compile(r"\bdata=([0-9A-Fa-f]+)")
+_RE_STATUS = re.compile(r"^(\w+): TEC=\s*(\d+), REC=\s*(\d+), state=(\w+)$")
+_RE_FINAL_STATUS = re.compile(r"^\[(\S+)\s*\] ID=(" + _HEX + r") \| TEC=\s*(\d+) REC=\s*(\d+) \| (\w+)")
+_RE_ECU_BIT_ERROR = re.compile(r"BIT ERROR(?: su (\w+))?:")
+_RE_ECU_ATTACK = re.compile(r"ATTACK: TX_V=([0-9A-Fa-f]+) → TX_A=([0-9A-Fa-f]+)")
+_ECU_KINDS = (
+    ("Richiedo TX", "tx_request"),
+    ("SUCCESS", "tx_success"),
+    ("ERROR_FLAG", "error_flag"),
+    ("TEC dopo errore", "error"),
+    ("Arrestata", "stop"),
+    ("TX id=", "tx"),
+)
+
+_RE_NUMBERS = re.compile(r"(\w+)=(" + _HEX + r"|-?\d+(?:\.\d+)?)")
+_ATTACKER_KINDS = (
+    ("ATTACK #", "attack"),
+    ("(attacco)", "attack"),
+    ("Skip attack", "skip"),
+    ("TEC cleanup", "cleanup"),
+    ("COOLDOWN", "cleanup"),
+    ("Sniffed ", "sniffed"),
+    ("Selected victim", "victim"),
+    ("ENTERED BUS-OFF", "bus_off"),
+    ("ERROR-PASSIVE", "error_passive"),
+    ("PHASE ", "phase"),
+)
+
+
+def _num(v: str) -> float:
+    return int(v, 16) if v.startswith("0x") else float(v)
+
+
+def _parse_master(line: str, src: str, n: int):
+    m = _RE_FRAME_OK.search(line)
+    if m:
+        return FrameOK(src, n, int(m.group(1), 16), bytes.fromhex(m.group(2)))
+    m = _RE_COUNTER.search(line)
+    if m:
+        ecu, counter, value, rec, delta, reason, state = m.groups()
+        ev = CounterUpdate(src, n, ecu, counter, int(value), int(delta) if delta else None, reason or "", state)
+        if rec is not None:
+            # formato "TEC=.. REC=.." (trace binaria riconvertita): due aggiornamenti in uno
+            return [ev, CounterUpdate(src, n, ecu, "REC", int(rec), None, reason or "", state)]
+        return ev
+    m = _RE_BIT_ERROR.search(line)
+    if m:
+        return BitError(src, n, m.group(1), m.group(2))
+    m = _RE_ERROR_FLAG.search(line)
+    if m:
+        return ErrorFlag(src, n, m.group(1) == "PASSIVE")
+    m = _RE_COLLISION.search(line)
+    if m:
+        return Collision(src, n, tuple(s.strip() for s in re.split(r"[,]", m.group(1)) if s.strip()))
+    m = _RE_VCAN_DATA.search(line)
+    if m:
+        return FrameOK(src, n, int(m.group(1), 16), bytes.fromhex(m.group(2)))
+    m = _RE_VCAN_ERROR.search(line)
+    if m:
+        return ErrorFlag(src, n, m.group(1) == "PASSIVE")
+    return None
+
+
+def _parse_ecu(line: str, src: str, n: int):
+    """``[NAME] ...`` scritta da una ECU: contatori, BIT ERROR, attacco; None se non nota."""
+    m = _RE_FINAL_STATUS.match(line)
+    if m:
+        return EcuReport(src, n, m.group(1), "status", int(m.group(3)), int(m.group(4)), m.group(5),
+                         int(m.group(2), 16))
+    m = _RE_ECU_LINE.match(line)
+    if not m:
+        return None
+    ecu, msg = m.groups()
+    b = _RE_ECU_BIT_ERROR.match(msg)
+    if b:
+        return BitError(src, n, ecu, b.group(1) or "rx_conflict")
+    if _RE_ECU_ATTACK.search(msg):
+        return AttackerEvent(src, n, "attack", msg)
+    kind = next((k for key, k in _ECU_KINDS if key in msg), None)
+    if kind is None:
+        return None
+    tec = _RE_ECU_TEC.search(msg)
+    rec = _RE_ECU_REC.search(msg)
+    if tec is None and rec is None:
+        return None
+    state = _RE_ECU_STATE.search(msg)
+    arb_id = _RE_ECU_ID.search(msg)
+    data = _RE_ECU_DATA.search(msg)
+    return EcuReport(src, n, ecu, kind,
+                     int(tec.group(1)) if tec else None,
+                     int(rec.group(1)) if rec else None,
+                     state.group(1) if state else None,
+                     int(arb_id.group(1), 16) if arb_id else None,
+                     bytes.fromhex(data.group(1)) if data and len(data.group(1)) % 2 == 0 else None)
+
+
+def _parse_attacker(line: str, src: str, n: int) -> LogEvent:
+    msg = line.split("]", 1)[1].strip()
+    if line.startswith("[ATTACKER SNIFF"):
+        kind = "sniff"
+    else:
+        kind = next((k for key, k in _ATTACKER_KINDS if key in msg), "info")
+    values: Dict[str, float] = {}
+    for key, val in _RE_NUMBERS.findall(msg):
+        values[key] = _num(val)
+    m = re.search(r"ATTACK #(\d+) on victim (" + _HEX + ")", msg)
+    if m:
+        values["attack"] = int(m.group(1))
+        values["victim"] = int(m.group(2), 16)
+    return AttackerEvent(src, n, kind, msg, values)
+
+
+def parse_lines(lines: Iterable[str], source: str = "<lines>") -> Iterator[LogEvent]:
+    """Yield typed events from log lines; unknown lines are skipped."""
+    for n, raw in enumerate(lines, 1):
+        line = raw.strip()
+        if not line:
+            continue
+        c = line[0]
+        ev = None
+        if c == "(":
+            m = _RE_CANDUMP.match(line)
+            if m:
+                ev = CandumpFrame(source, n, float(m.group(1)), m.group(2), int(m.group(3), 16),
+                                  bytes.fromhex(m.group(4)))
+        elif c == "[":
+            if line.startswith("[MASTER]"):
+                ev = _parse_master(line, source, n)
+            elif line.startswith("[ATTACKER"):
+                # l'ECU attaccante dei log per-ECU riporta i contatori come le altre
+                ev = _parse_ecu(line, source, n) or _parse_attacker(line, source, n)
+            elif line.startswith("[IDS]"):
+                m = _RE_IDS_ALERT.search(line)
+                if m:
+                    g = m.groups()
+                    ev = IDSAlert(source, n, int(g[0], 16), int(g[1]), float(g[2]), int(g[3]),
+                                  float(g[4]) / 100.0, float(g[5]), g[6], float(g[7]) / 100.0)
+                else:
+                    m = _RE_DETECTOR_ALERT.search(line)
+                    if m:
+                        values = {k: _num(v) for k, v in _RE_NUMBERS.findall(m.group(4))}
+                        ev = DetectorAlert(source, n, m.group(1).lower(), int(m.group(2), 16), m.group(3), values)
+            else:
+                m = _RE_TX_REQUEST.match(line)
+                if m:
+                    ev = TxRequest(source, n, m.group(1), int(m.group(2), 16), int(m.group(3)),
+                                   int(m.group(4)), m.group(5))
+                else:
+                    m = _RE_BUS_OFF.match(line)
+                    if m:
+                        ev = BusOff(source, n, m.group(1), int(m.group(2)))
+                    else:
+                        ev = _parse_ecu(line, source, n)
+        elif "ATTACK SUCCESSFUL" in line:
+            ev = AttackOutcome(source, n, True)
+        elif "ATTACK FAILED" in line:
+            ev = AttackOutcome(source, n, False)
+        else:
+            m = _RE_VICTIM_BUS_OFF.search(line)
+            if m:
+                ev = AttackOutcome(source, n, True, m.group(1))
+            else:
+                m = _RE_STATUS.match(line)
+                if m:
+                    ev = EcuReport(source, n, m.group(1), "status", int(m.group(2)), int(m.group(3)), m.group(4))
+
+        if ev is None:
+            continue
+        if isinstance(ev, list):
+            yield from ev
+        else:
+            yield ev
+
+
+def parse_file(path: str) -> Iterator[LogEvent]:
+    with open(path, "r", encoding="utf-8", errors="replace") as fh:
+        yield from parse_lines(fh, source=path)
+
+
+def parse_files(paths: Iterable[str]) -> Iterator[LogEvent]:
+    """Events of several files, one after the other (sequential, constant memory)."""
+    for path in paths:
+        yield from parse_file(path)
+
+
+# ---- Riduzioni ----
+
+def tec_trajectories(events: Iterable[LogEvent]) -> Dict[str, List[Tuple[int, int]]]:
+    """ECU -> [(line_no, TEC)] from TEC updates and TX requests."""
+    out: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    for ev in events:
+        if isinstance(ev, CounterUpdate) and ev.counter == "TEC":
+            out[ev.ecu].append((ev.line_no, ev.value))
+        elif isinstance(ev, TxRequest):
+            out[ev.ecu].append((ev.line_no, ev.tec))
+        elif isinstance(ev, EcuReport) and ev.tec is not None:
+            out[ev.ecu].append((ev.line_no, ev.tec))
+    return dict(out)
+
+
+def summarize_file(path: str) -> dict:
+    """One pass over a log: frame counts, TEC trajectories, alerts, attacks, outcome."""
+    frames: Counter = Counter()
+    tec: Dict[str, List[Tuple[int, int]]] = defaultdict(list)
+    kinds: Counter = Counter()
+    alerts = 0
+    detector_alerts: Counter = Counter()
+    attacks = 0
+    bus_off: List[str] = []
+    outcome: Optional[bool] = None
+    last = 0
+    lines = 0
+
+    def counted(fh):
+        nonlocal lines
+        for lines, line in enumerate(fh, 1):
+            yield line
+
+    with open(path, "r", encoding="utf-8", errors="replace") as fh:
+        for ev in parse_lines(counted(fh), source=path):
+            last = ev.line_no
+            kinds[type(ev).__name__] += 1
+            if isinstance(ev, (FrameOK, CandumpFrame)):
+                frames[ev.arb_id] += 1
+            elif isinstance(ev, CounterUpdate) and ev.counter == "TEC":
+                tec[ev.ecu].append((ev.line_no, ev.value))
+            elif isinstance(ev, TxRequest):
+                tec[ev.ecu].append((ev.line_no, ev.tec))
+            elif isinstance(ev, EcuReport):
+                if ev.tec is not None:
+                    tec[ev.ecu].append((ev.line_no, ev.tec))
+                if ev.kind == "tx" and ev.arb_id is not None:
+                    frames[ev.arb_id] += 1
+                if ev.state == "BUS_OFF" and ev.ecu not in bus_off:
+                    bus_off.append(ev.ecu)
+            elif isinstance(ev, IDSAlert):
+                alerts += 1
+            elif isinstance(ev, DetectorAlert):
+                detector_alerts[ev.kind] += 1
+            elif isinstance(ev, AttackerEvent) and ev.kind == "attack":
+                attacks += 1
+            elif isinstance(ev, BusOff) and ev.ecu not in bus_off:
+                bus_off.append(ev.ecu)
+            elif isinstance(ev, AttackOutcome):
+                outcome = ev.success if outcome is None else (outcome or ev.success)
+    return {
+        "path": path,
+        "lines": lines,
+        "last_event_line": last,
+        "events": dict(kinds),
+        "frames_by_id": dict(frames),
+        "tec": dict(tec),
+        "ids_alerts": alerts,
+        "detector_alerts": dict(detector_alerts),
+        "attacks": attacks,
+        "bus_off": bus_off,
+        "attack_success": outcome,
+    }
+
+
+def map_files(func: Callable[[str], object], paths: List[str], workers: Optional[int] = None) -> List[object]:
+    """Run ``func(path)`` for every file in a process pool (results in input order)."""
+    if workers == 1 or len(paths) <= 1:
+        return [func(p) for p in paths]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(func, paths))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Parse simulator text logs / candump captures")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--workers", type=int, default=None, help="process pool size (default: CPU count)")
+    args = parser.parse_args()
+
+    for s in map_files(summarize_file, args.paths, args.workers):
+        print(f"== {s['path']}")
+        print(f"  events: {sum(s['events'].values())} in {s['lines']} lines {s['events']}")
+        print(f"  frames by ID: " + ", ".join(f"0x{k:03X}={v}" for k, v in sorted(s["frames_by_id"].items())))
+        for ecu, traj in sorted(s["tec"].items()):
+            print(f"  {ecu:10s} TEC max={max(t for _, t in traj):3d} last={traj[-1][1]:3d} ({len(traj)} updates)")
+        print(f"  attacks: {s['attacks']} | IDS alerts: {s['ids_alerts']} (timing/skew: {s['detector_alerts'] or '-'}) | bus-off: {s['bus_off'] or '-'} | attack success: {s['attack_success']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,356 @@
+"""can_trace.py
+
+Trace binaria del simulatore CAN: record a dimensione fissa (32 byte) + indice sidecar.
+
+File ``<name>.cantrace``:
+    header 16 byte (magic, versione, record size) seguito dai record in ordine di tempo.
+File ``<name>.cantrace.idx``:
+    una riga JSON (nomi ECU, offset delle sezioni) seguita da array uint32 di numeri
+    di record: inizio di ogni bucket temporale, frame per arbitration ID, snapshot
+    TEC/REC per ECU.
+
+Il writer usa solo la stdlib; il reader mappa il file in memoria (mmap + numpy) e
+risponde alle query senza leggere tutto il file. ``python can_trace.py trace.cantrace``
+riconverte la trace nel formato testuale dei log.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import mmap
+import struct
+from array import array
+from typing import Dict, Iterator, List, Optional
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except Exception:
+    NUMPY_AVAILABLE = False
+
+
+MAGIC = b"CANTRC\x00\x01"
+VERSION = 1
+HEADER = struct.Struct("<8sII")
+
+# t, kind, value, node, arb_id, field, tec, rec, data
+RECORD = struct.Struct("<dBBHHBxHH8s4x")
+RECORD_SIZE = RECORD.size  # 32
+
+NO_NODE = 0xFFFF
+
+assert array("I").itemsize == 4
+
+# kind
+BIT = 1
+FRAME_OK = 2
+FRAME_ERROR = 3
+ERROR_FLAG = 4
+TEC_REC = 5
+
+KIND_NAMES = {BIT: "BIT", FRAME_OK: "FRAME_OK", FRAME_ERROR: "FRAME_ERROR", ERROR_FLAG: "ERROR_FLAG", TEC_REC: "TEC_REC"}
+
+# value per ERROR_FLAG
+FLAG_ACTIVE = 0
+FLAG_PASSIVE = 1
+
+# value per TEC_REC (stesso ordine di NodeState)
+STATE_NAMES = ("ERROR_ACTIVE", "ERROR_PASSIVE", "BUS_OFF")
+
+# codici di Field.value nei simulatori (Field è un Enum con auto() che parte da 1)
+FIELD_NAMES = (
+    None, "SOF", "ID", "RTR", "IDE", "R0", "DLC", "DATA", "CRC",
+    "CRC_DELIM", "ACK_SLOT", "ACK_DELIM", "EOF", "INTERMISSION", "STUFF",
+)
+
+if NUMPY_AVAILABLE:
+    RECORD_DTYPE = np.dtype([
+        ("t", "<f8"), ("kind", "u1"), ("value", "u1"), ("node", "<u2"), ("arb_id", "<u2"),
+        ("field", "u1"), ("_pad0", "u1"), ("tec", "<u2"), ("rec", "<u2"), ("data", "S8"), ("_pad1", "V4"),
+    ])
+    assert RECORD_DTYPE.itemsize == RECORD_SIZE
+
+
+def index_path(path: str) -> str:
+    return path + ".idx"
+
+
+class TraceFileWriter:
+    """Append-only writer of fixed-size trace records.
+
+    Records are packed into a buffer and written in blocks of ``flush_every``; the
+    index (time buckets, per-ID frames, per-ECU TEC snapshots) is built on the fly
+    and saved next to the trace by ``close()``.
+    """
+
+    def __init__(self, path: str, *, time_bucket_s: float = 1.0, flush_every: int = 4096):
+        self.path = path
+        self.time_bucket_s = float(time_bucket_s)
+        self.flush_every = flush_every
+        self._fh = open(path, "wb")
+        self._fh.write(HEADER.pack(MAGIC, VERSION, RECORD_SIZE))
+        self._buf = bytearray()
+        self._pending = 0
+        self.count = 0
+
+        self._nodes: Dict[str, int] = {}
+        self._t0: Optional[float] = None
+        self._buckets = array("I")  # record di inizio di ogni bucket
+        self._by_id: Dict[int, array] = {}
+        self._by_node: Dict[int, array] = {}
+        self._closed = False
+
+    def node_index(self, name: str) -> int:
+        idx = self._nodes.get(name)
+        if idx is None:
+            idx = self._nodes[name] = len(self._nodes)
+        return idx
+
+    def _append(self, t: float, kind: int, value: int = 0, node: int = NO_NODE, arb_id: int = 0,
+                field: int = 0, tec: int = 0, rec: int = 0, data: bytes = b""):
+        n = self.count
+        if self._t0 is None:
+            self._t0 = t
+        bucket = int((t - self._t0) / self.time_bucket_s)
+        while len(self._buckets) <= bucket:
+            self._buckets.append(n)
+
+        self._buf += RECORD.pack(t, kind, value, node, arb_id, field, tec, rec, data)
+        self.count = n + 1
+        self._pending += 1
+        if self._pending >= self.flush_every:
+            self.flush()
+        return n
+
+    # ---- record tipizzati ----
+
+    def bit(self, t: float, bit: int, field_code: int, sender: str = "BUS"):
+        self._append(t, BIT, bit, self.node_index(sender), field=field_code)
+
+    def frame_ok(self, t: float, arb_id: int, data: bytes, sender: str):
+        n = self._append(t, FRAME_OK, len(data), self.node_index(sender), arb_id, data=data)
+        self._by_id.setdefault(arb_id, array("I")).append(n)
+
+    def frame_error(self, t: float, arb_id: int, sender: str):
+        n = self._append(t, FRAME_ERROR, 0, self.node_index(sender), arb_id)
+        self._by_id.setdefault(arb_id, array("I")).append(n)
+
+    def error_flag(self, t: float, passive: bool, offender: str):
+        self._append(t, ERROR_FLAG, FLAG_PASSIVE if passive else FLAG_ACTIVE, self.node_index(offender))
+
+    def tec_rec(self, t: float, ecu: str, tec: int, rec: int, state_code: int):
+        node = self.node_index(ecu)
+        n = self._append(t, TEC_REC, state_code, node, tec=min(tec, 0xFFFF), rec=min(rec, 0xFFFF))
+        self._by_node.setdefault(node, array("I")).append(n)
+
+    # ---- I/O ----
+
+    def flush(self):
+        if self._buf:
+            self._fh.write(self._buf)
+            self._buf = bytearray()
+        self._pending = 0
+        self._fh.flush()
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self.flush()
+        self._fh.close()
+        self._write_index()
+
+    def _write_index(self):
+        sections: List[array] = []
+        offset = 0
+
+        def section(arr: array) -> List[int]:
+            nonlocal offset
+            sections.append(arr)
+            loc = [offset, len(arr)]
+            offset += len(arr) * 4
+            return loc
+
+        meta = {
+            "version": VERSION,
+            "records": self.count,
+            "t0": self._t0 if self._t0 is not None else 0.0,
+            "time_bucket_s": self.time_bucket_s,
+            "nodes": sorted(self._nodes, key=self._nodes.get),
+            "time_index": section(self._buckets),
+            "id_index": {str(k): section(v) for k, v in sorted(self._by_id.items())},
+            "node_index": {str(k): section(v) for k, v in sorted(self._by_node.items())},
+        }
+        with open(index_path(self.path), "wb") as fh:
+            fh.write(json.dumps(meta).encode() + b"\n")
+            for arr in sections:
+                fh.write(arr.tobytes())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+
+class TraceFileReader:
+    """Memory-mapped reader: ``records`` is a zero-copy numpy view over the file."""
+
+    def __init__(self, path: str):
+        if not NUMPY_AVAILABLE:
+            raise RuntimeError("TraceFileReader requires numpy")
+        self.path = path
+        self._fh = open(path, "rb")
+        self._mm = mmap.mmap(self._fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, rsize = HEADER.unpack_from(self._mm, 0)
+        if magic != MAGIC or rsize != RECORD_SIZE:
+            raise ValueError(f"{path}: not a CAN trace (magic={magic!r}, record={rsize})")
+        n = (len(self._mm) - HEADER.size) // RECORD_SIZE
+        self.records = np.frombuffer(self._mm, dtype=RECORD_DTYPE, count=n, offset=HEADER.size)
+
+        with open(index_path(path), "rb") as fh:
+            head = fh.readline()
+            self._idx_base = len(head)
+        self.meta = json.loads(head)
+        self._idx_fh = open(index_path(path), "rb")
+        self._idx_mm = mmap.mmap(self._idx_fh.fileno(), 0, access=mmap.ACCESS_READ)
+        self.nodes: List[str] = self.meta["nodes"]
+        self._node_by_name = {name: i for i, name in enumerate(self.nodes)}
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def close(self):
+        # le view numpy devono sparire prima di chiudere le mmap
+        self.records = None
+        for mm in (self._mm, self._idx_mm):
+            try:
+                mm.close()
+            except BufferError:
+                pass  # risultati di query ancora vivi: la mmap si chiude col GC
+        self._fh.close()
+        self._idx_fh.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_exc):
+        self.close()
+
+    def _section(self, loc) -> "np.ndarray":
+        offset, count = loc
+        return np.frombuffer(self._idx_mm, dtype="<u4", count=count, offset=self._idx_base + offset)
+
+    def _record_range(self, t1: Optional[float], t2: Optional[float]):
+        """[lo, hi) dei record con t1 <= t <= t2, usando i bucket per restringere la ricerca."""
+        recs = self.records
+        n = len(recs)
+        buckets = self._section(self.meta["time_index"])
+        t0 = self.meta["t0"]
+        bs = self.meta["time_bucket_s"]
+
+        def bounds(t, side):
+            b = int((t - t0) // bs)
+            if b < 0:
+                return 0
+            if b >= len(buckets):
+                return n
+            lo = int(buckets[b])
+            hi = int(buckets[b + 1]) if b + 1 < len(buckets) else n
+            return lo + int(np.searchsorted(recs["t"][lo:hi], t, side=side))
+
+        lo = 0 if t1 is None else bounds(t1, "left")
+        hi = n if t2 is None else bounds(t2, "right")
+        return lo, max(lo, hi)
+
+    def between(self, t1: Optional[float] = None, t2: Optional[float] = None) -> "np.ndarray":
+        lo, hi = self._record_range(t1, t2)
+        return self.records[lo:hi]
+
+    def frames(self, arb_id: Optional[int] = None, t1: Optional[float] = None, t2: Optional[float] = None,
+               *, include_errors: bool = False) -> "np.ndarray":
+        """Frame records (OK, optionally errors) of ``arb_id`` between ``t1`` and ``t2``."""
+        kinds = (FRAME_OK, FRAME_ERROR) if include_errors else (FRAME_OK,)
+        if arb_id is None:
+            sel = self.between(t1, t2)
+            return sel[np.isin(sel["kind"], kinds)]
+        loc = self.meta["id_index"].get(str(arb_id & 0x7FF))
+        if loc is None:
+            return self.records[:0]
+        rows = self.records[self._section(loc)]
+        mask = np.isin(rows["kind"], kinds)
+        if t1 is not None:
+            mask &= rows["t"] >= t1
+        if t2 is not None:
+            mask &= rows["t"] <= t2
+        return rows[mask]
+
+    def tec_trajectory(self, ecu_name: str) -> "np.ndarray":
+        """TEC/REC snapshots of one ECU (fields ``t``, ``tec``, ``rec``, ``value`` = state)."""
+        node = self._node_by_name.get(ecu_name)
+        loc = None if node is None else self.meta["node_index"].get(str(node))
+        if loc is None:
+            return self.records[:0]
+        return self.records[self._section(loc)]
+
+    # ---- conversione in testo ----
+
+    def format_record(self, r) -> str:
+        kind = int(r["kind"])
+        node = int(r["node"])
+        name = self.nodes[node] if node != NO_NODE and node < len(self.nodes) else "?"
+        if kind == BIT:
+            field = FIELD_NAMES[int(r["field"])] or "?"
+            return f"  [TX]  {field:12s} | {name}={int(r['value'])}"
+        if kind == FRAME_OK:
+            data = bytes(r["data"]).ljust(8, b"\0")[: int(r["value"])]
+            return f"[MASTER] Frame OK: ID=0x{int(r['arb_id']):03X} data={data.hex().upper()}"
+        if kind == FRAME_ERROR:
+            return "[MASTER] Frame ERROR -> Retransmission"
+        if kind == ERROR_FLAG:
+            if int(r["value"]) == FLAG_PASSIVE:
+                return f"[MASTER] Sending ERROR FLAG PASSIVE (8 recessive bits) | {name}"
+            return f"[MASTER] Sending ERROR FLAG ACTIVE (6 dominant bits) | {name}"
+        if kind == TEC_REC:
+            state = STATE_NAMES[int(r["value"])] if int(r["value"]) < len(STATE_NAMES) else "?"
+            return f"[MASTER] {name}: TEC={int(r['tec'])} REC={int(r['rec'])} State={state}"
+        return f"[?] kind={kind}"
+
+    def iter_text(self, rows: Optional["np.ndarray"] = None, *, bits: bool = True) -> Iterator[str]:
+        rows = self.records if rows is None else rows
+        for r in rows:
+            if not bits and int(r["kind"]) == BIT:
+                continue
+            yield self.format_record(r)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Query / convert a binary CAN trace")
+    parser.add_argument("trace")
+    parser.add_argument("--id", type=lambda s: int(s, 0), help="only frames of this arbitration ID")
+    parser.add_argument("--ecu", help="TEC/REC trajectory of this ECU")
+    parser.add_argument("--from", dest="t1", type=float)
+    parser.add_argument("--to", dest="t2", type=float)
+    parser.add_argument("--no-bits", action="store_true", help="skip bit records in the text dump")
+    args = parser.parse_args()
+
+    with TraceFileReader(args.trace) as reader:
+        if args.ecu:
+            rows = reader.tec_trajectory(args.ecu)
+            if args.t1 is not None:
+                rows = rows[rows["t"] >= args.t1]
+            if args.t2 is not None:
+                rows = rows[rows["t"] <= args.t2]
+        elif args.id is not None:
+            rows = reader.frames(args.id, args.t1, args.t2, include_errors=True)
+        else:
+            rows = reader.between(args.t1, args.t2)
+        if args.no_bits:
+            rows = rows[rows["kind"] != BIT]
+        for r, line in zip(rows, reader.iter_text(rows)):
+            print(f"{float(r['t']):.6f} {line}")
+
+
+if __name__ == "__main__":
+    main()
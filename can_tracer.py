@@ -0,0 +1,119 @@
+"""can_tracer.py
+
+Tracing a livelli condiviso da can_bus.py e completo/weeping_withIDS.py: sostituisce i
+print per-bit con record (msg, args) formattati da un writer in background.
+"""
+
+from __future__ import annotations
+
+import atexit
+import sys
+import threading
+from collections import deque
+from enum import IntFlag
+from typing import Deque, Optional, Tuple
+
+
+class TraceLevel(IntFlag):
+    BIT = 1  # un record per bit sul bus ([ARB], [TX], [ERR])
+    FRAME = 2  # arbitraggio, frame OK, sniffing, TEC/REC dopo successo
+    ERROR = 4  # bit error, error flag, TEC/REC dopo errore, alert IDS
+    STATE = 8  # start/stop, stato ECU, status periodico, fasi dell'attaccante
+
+    @classmethod
+    def parse(cls, spec: str) -> "TraceLevel":
+        """'frame,error' -> FRAME|ERROR; 'all' / 'none' accettati."""
+        spec = spec.strip().lower()
+        if spec == "all":
+            return cls.BIT | cls.FRAME | cls.ERROR | cls.STATE
+        levels = cls(0)
+        for name in filter(None, (p.strip() for p in spec.split(","))):
+            if name != "none":
+                levels |= cls[name.upper()]
+        return levels
+
+
+DEFAULT_TRACE_LEVELS = TraceLevel.FRAME | TraceLevel.ERROR | TraceLevel.STATE
+
+
+class Tracer:
+    """Levelled trace sink with a ring buffer and a background writer.
+
+    A disabled level costs one bitmask test and no formatting; hot paths check the
+    ``bit``/``frame``/... flags before building their arguments. Enabled records are
+    stored as (msg, args) and formatted (``msg % args``) by the writer, which flushes
+    them in batches every ``flush_interval`` seconds. When the ring is full the
+    producer flushes inline, so records are never dropped.
+    """
+
+    def __init__(self, levels: TraceLevel = DEFAULT_TRACE_LEVELS, stream=None,
+                 capacity: int = 65536, flush_interval: float = 0.05):
+        self.stream = stream
+        self.capacity = capacity
+        self.flush_interval = flush_interval
+        self._ring: Deque[Tuple[str, tuple]] = deque()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+        self.set_levels(levels)
+
+    def set_levels(self, levels: TraceLevel):
+        self.levels = TraceLevel(levels)
+        self.bit = bool(self.levels & TraceLevel.BIT)
+        self.frame = bool(self.levels & TraceLevel.FRAME)
+        self.error = bool(self.levels & TraceLevel.ERROR)
+        self.state = bool(self.levels & TraceLevel.STATE)
+
+    def enabled(self, level: TraceLevel) -> bool:
+        return bool(self.levels & level)
+
+    def emit(self, level: TraceLevel, msg: str, *args):
+        if not self.levels & level:
+            return
+        self._ring.append((msg, args))
+        if self._writer is None:
+            self._start_writer()
+        if len(self._ring) >= self.capacity:
+            self.flush()
+
+    def _start_writer(self):
+        with self._flush_lock:
+            if self._writer is not None or self._closed:
+                return
+            self._writer = threading.Thread(target=self._writer_loop, daemon=True)
+            self._writer.start()
+
+    def _writer_loop(self):
+        while not self._closed:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self.flush()
+
+    def flush(self):
+        with self._flush_lock:
+            ring = self._ring
+            n = len(ring)
+            if not n:
+                return
+            lines = []
+            for _ in range(n):
+                msg, args = ring.popleft()
+                lines.append(msg % args if args else msg)
+            stream = self.stream or sys.stdout
+            stream.write("\n".join(lines) + "\n")
+            stream.flush()
+
+    def print(self, *values, sep: str = " "):
+        """Unfiltered line (banner, final status) written in order with the queued records."""
+        self._ring.append((sep.join(map(str, values)), ()))
+        self.flush()
+
+    def close(self):
+        self._closed = True
+        self._wake.set()
+        self.flush()
+
+
+TRACE = Tracer()
+atexit.register(TRACE.flush)
@@ -18,12 +18,10 @@ import time
 import threading
 import queue
 import random
-from collections import deque, Counter, defaultdict
-import math
 import sys
 from dataclasses import dataclass
 from enum import Enum, auto
-from typing import Deque, Dict, List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 try:
     import can  # python-can
@@ -34,6 +32,10 @@ import os
 import socket
 import struct
 
+# IDS condiviso con weeping_withIDS.py (can_ids.py nella root del repo)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from can_ids import IDSPipeline, SimpleCANIDS, format_ids_alert
+
 CAN_ERR_FLAG = 0x20000000
 CAN_ERR_PROT = 0x00000008  # error class "protocol violation" (va bene per "bit monitoring")
 
@@ -483,102 +485,9 @@ class BaseECU:
             if bt is None:
                 continue
 
-class SimpleCANIDS:
-    """
-    IDS minimal:
-      1) collision rate per ID in finestra W
-      2) bit index concentration (mode share o entropia bassa)
-    Non assume attacker/victim a priori.
-    """
-
-    def __init__(
-        self,
-        window_s: float = 30.0,          # finestra temporale
-        min_collisions: int = 6,        # N collisioni in window per trigger rate
-        mode_share_th: float = 0.75,    # >=60% collisioni sullo stesso bit
-        entropy_th: float = 2.0,        # entropia bassa => concentrato (0..~6 per 64 bit)
-        cooldown_s: float = 1.0         # evita spam alert
-    ):
-        self.window_s = window_s
-        self.min_collisions = min_collisions
-        self.mode_share_th = mode_share_th
-        self.entropy_th = entropy_th
-        self.cooldown_s = cooldown_s
-
-        # events[arb_id] = deque of (ts, bit_idx, offender_name)
-        self.events = defaultdict(deque)
-        self._last_alert_ts = {}  # per arb_id
-
-    def _prune(self, arb_id: int, now: float):
-        dq = self.events[arb_id]
-        cutoff = now - self.window_s
-        while dq and dq[0][0] < cutoff:
-            dq.popleft()
-
-    @staticmethod
-    def _entropy(counts: Counter) -> float:
-        total = sum(counts.values())
-        if total <= 0:
-            return 0.0
-        H = 0.0
-        for c in counts.values():
-            p = c / total
-            H -= p * math.log(p + 1e-12, 2)
-        return H
-
-    def observe_collision(self, arb_id: int, bit_idx: int, offender_name: str, ts: float | None = None):
-        now = time.time() if ts is None else float(ts)
-        dq = self.events[arb_id]
-        dq.append((now, int(bit_idx), str(offender_name)))
-        self._prune(arb_id, now)
-
-    def check_alert(self, arb_id: int, ts: float | None = None):
-        now = time.time() if ts is None else float(ts)
-        self._prune(arb_id, now)
-        dq = self.events.get(arb_id)
-        if not dq:
-            return None
-
-        # collision rate proxy: numero collisioni in finestra
-        n = len(dq)
-        if n < self.min_collisions:
-            return None
-
-        # bit concentration
-        bits = [b for _, b, _ in dq]
-        bit_counts = Counter(bits)
-        mode_bit, mode_cnt = bit_counts.most_common(1)[0]
-        mode_share = mode_cnt / n
-        H = self._entropy(bit_counts)
-
-        # cooldown anti-spam
-        last = self._last_alert_ts.get(arb_id, 0.0)
-        if now - last < self.cooldown_s:
-            return None
-
-        # decisione: forte se mode_share alto oppure entropia bassa
-        concentrated = (mode_share >= self.mode_share_th) or (H <= self.entropy_th)
-        if not concentrated:
-            return None
-
-        # (opzionale) offender più frequente nella finestra
-        offenders = [o for _, _, o in dq]
-        off_counts = Counter(offenders)
-        top_off, top_off_cnt = off_counts.most_common(1)[0]
-        top_off_share = top_off_cnt / n
-
-        self._last_alert_ts[arb_id] = now
-        return {
-            "arb_id": arb_id,
-            "window_s": self.window_s,
-            "collisions": n,
-            "mode_bit": mode_bit,
-            "mode_share": mode_share,
-            "entropy": H,
-            "top_offender": top_off,
-            "top_offender_share": top_off_share,
-        }
 
+def print_ids_alert(alert: dict):
+    print(format_ids_alert(alert))
 
 
 class CANMaster:
@@ -646,7 +555,11 @@ class CANMaster:
             warmup_s=15.0,
             only_data_field=True,   # conta solo errori in DATA
         )
-        self.ids_stop_on_alert = True  # se True: termina la simulazione quando scatta
+        self.ids_stop_on_alert = True  # se True: ferma il master quando scatta
+        self.ids_alerted = threading.Event()
+        self.ids_pipeline = IDSPipeline(self.ids)
+        self.ids_pipeline.subscribe(print_ids_alert)
+        self.ids_pipeline.subscribe(self._on_ids_alert)
         self._err_active_sent = False 
 
     def register_slave(self, ecu: BaseECU):
@@ -667,14 +580,22 @@ class CANMaster:
 
     def start(self):
         print("[MASTER] START")
+        self.ids_pipeline.start()
         self._thread.start()
         self._status_thread.start()
 
     def stop(self):
         self._stop = True
         self._thread.join(timeout=2)
+        self.ids_pipeline.stop()
         print("[MASTER] STOP")
 
+    def _on_ids_alert(self, alert: dict):
+        """Subscriber della pipeline IDS (thread del worker): segnala e, se richiesto, ferma il bus."""
+        self.ids_alerted.set()
+        if self.ids_stop_on_alert:
+            self._stop = True
+
     def _status_loop(self):
         """Thread separato per stampare lo stato periodicamente."""
         while not self._stop:
@@ -739,19 +660,7 @@ class CANMaster:
                 arb_id = self.slaves[self._winner].arb_id
 
             bit_idx = int(getattr(sender, "_cursor", -1))
-            self.ids.observe_collision(arb_id=arb_id, bit_idx=bit_idx, offender_name=sender.name, field=self._current_field)
-            alert = self.ids.check_alert(arb_id)
-            if alert:
-                print(
-                    f"[IDS] 🚨 ALERT su ID=0x{alert['arb_id']:03X} | "
-                    f"collisions={alert['collisions']} in {alert['window_s']}s | "
-                    f"mode_bit={alert['mode_bit']} ({alert['mode_share']*100:.1f}%) | "
-                    f"top_off={alert['top_offender']} ({alert['top_offender_share']*100:.1f}%)"
-                )
-                if self.ids_stop_on_alert:
-                    sys.stdout.flush()
-                    sys.stderr.flush()
-                    os._exit(0)
+            self.ids_pipeline.publish(arb_id, bit_idx, sender.name, field=self._current_field)
             return
 
         # -------------------------------
@@ -764,19 +673,7 @@ class CANMaster:
             arb_id = self.slaves[self._winner].arb_id
 
         bit_idx = int(getattr(sender, "_cursor", -1))
-        self.ids.observe_collision(arb_id=arb_id, bit_idx=bit_idx, offender_name=sender.name, field=self._current_field)
-        alert = self.ids.check_alert(arb_id)
-        if alert:
-            print(
-                f"[IDS] 🚨 ALERT su ID=0x{alert['arb_id']:03X} | "
-                f"collisions={alert['collisions']} in {alert['window_s']}s | "
-                f"mode_bit={alert['mode_bit']} ({alert['mode_share']*100:.1f}%) | "
-                f"top_off={alert['top_offender']} ({alert['top_offender_share']*100:.1f}%)"
-            )
-            if self.ids_stop_on_alert:
-                sys.stdout.flush()
-                sys.stderr.flush()
-                os._exit(0)
+        self.ids_pipeline.publish(arb_id, bit_idx, sender.name, field=self._current_field)
         if self._sockcan is not None and not getattr(self, "_err_active_sent", False):
             sockcan_send_data(self._sockcan, 0x7FF, b"\x00" * 6)
             self._err_active_sent = True
@@ -1236,6 +1133,10 @@ def main():
     try:
         while True:
             time.sleep(1.0)
+
+            if master.ids_alerted.is_set():
+                print(f"\n[IDS] Simulazione fermata dall'IDS (alert)")
+                break
             
             # Check BUS-OFF
             if any(ecu.is_bus_off() for ecu in [ecu_a, ecu_b, ecu_c, ecu_d, ecu_e]):
@@ -5,15 +5,25 @@ Weeping CAN Attack Simulator con analisi bit-level e reinforcement learning
 import threading
 import time
 import random
-from collections import defaultdict
+import functools
+import os
+import sys
+import re
+import copy
+from collections import Counter, defaultdict, deque
 import numpy as np
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.multioutput import MultiOutputClassifier
 import can
 from enum import Enum, auto
-from typing import List, Optional, Tuple
+from typing import Deque, Iterator, List, Optional, Tuple
 from dataclasses import dataclass
 
+# moduli condivisi nella root del repo (can_tracer.py, can_ids.py)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir))
+from can_tracer import TRACE, TraceLevel  # tracing a livelli condiviso con can_bus.py
+from can_ids import ClockSkewIDS, IDSPipeline, SimpleCANIDS, TimingIDS, format_ids_alert, log_ids_alert
+
 # --- Bit Value ---
 class BitValue(Enum):
     DOMINANT = 0
@@ -58,147 +68,403 @@ class BitTransmission:
     field: Field
 
 
-def _crc15_can(bits: List[int]) -> int:
-    """Compute CRC-15/CAN over a bit stream."""
-    poly = 0x4599
+# --- Lookup tables (rappresentazione compatta: bit 0/1 e Field.value in bytearray) ---
+_BIT_VALUES: Tuple[BitValue, BitValue] = (BitValue.DOMINANT, BitValue.RECESSIVE)
+FIELD_BY_CODE = {f.value: f for f in Field}
+
+_STUFFED_FIELD_CODES = frozenset(
+    f.value for f in (Field.SOF, Field.ID, Field.RTR, Field.IDE, Field.R0, Field.DLC, Field.DATA, Field.CRC)
+)
+# Campi in cui un recessivo letto dominante è perdita di arbitraggio (non bit error)
+_ARB_FIELD_CODES = frozenset((Field.SOF.value, Field.ID.value, Field.RTR.value))
+
+# MSB-first bits of every byte / 11-bit ID / 4-bit DLC
+_BYTE_BITS: Tuple[bytes, ...] = tuple(bytes((v >> i) & 1 for i in range(7, -1, -1)) for v in range(256))
+_ID_BITS: Tuple[bytes, ...] = tuple(bytes((v >> i) & 1 for i in range(10, -1, -1)) for v in range(0x800))
+_DLC_BITS: Tuple[bytes, ...] = tuple(bytes((v >> i) & 1 for i in range(3, -1, -1)) for v in range(16))
+
+# Tail after CRC: CRC_DELIM, ACK_SLOT, ACK_DELIM, 7x EOF, 3x INTERMISSION (all recessive, never stuffed)
+_TAIL_BITS = bytes([1] * 13)
+_TAIL_FIELDS = bytes(
+    [Field.CRC_DELIM.value, Field.ACK_SLOT.value, Field.ACK_DELIM.value]
+    + [Field.EOF.value] * 7
+    + [Field.INTERMISSION.value] * 3
+)
+_HEAD_FIELDS = bytes(
+    [Field.SOF.value] + [Field.ID.value] * 11 + [Field.RTR.value, Field.IDE.value, Field.R0.value] + [Field.DLC.value] * 4
+)
+_CRC_FIELDS = bytes([Field.CRC.value] * 15)
+
+_CRC15_POLY = 0x4599
+
+
+def _crc15_can_bitwise(bits) -> int:
+    """Compute CRC-15/CAN over a bit stream (bit-serial reference)."""
     crc = 0
     for b in bits:
         msb = (crc >> 14) & 1
         crc = ((crc << 1) & 0x7FFF) | (b & 1)
         if msb:
-            crc ^= poly
+            crc ^= _CRC15_POLY
     return crc & 0x7FFF
 
 
+def _build_crc15_table() -> Tuple[int, ...]:
+    # T[h] = contributo dei top-8 bit del registro dopo 8 shift (h * x^15 mod P)
+    table = []
+    for h in range(256):
+        crc = h << 7
+        for _ in range(8):
+            msb = (crc >> 14) & 1
+            crc = (crc << 1) & 0x7FFF
+            if msb:
+                crc ^= _CRC15_POLY
+        table.append(crc)
+    return tuple(table)
+
+
+_CRC15_TABLE = _build_crc15_table()
+
+
+def _crc15_can(bits) -> int:
+    """Compute CRC-15/CAN over a bit stream (table-driven, 8 bits per step)."""
+    n = len(bits)
+    head = n % 8
+    crc = _crc15_can_bitwise(bits[:head])
+    table = _CRC15_TABLE
+    for i in range(head, n, 8):
+        byte = (
+            (bits[i] << 7) | (bits[i + 1] << 6) | (bits[i + 2] << 5) | (bits[i + 3] << 4)
+            | (bits[i + 4] << 3) | (bits[i + 5] << 2) | (bits[i + 6] << 1) | bits[i + 7]
+        )
+        crc = (((crc & 0x7F) << 8) ^ table[crc >> 7] ^ byte) & 0x7FFF
+    return crc
+
+
 class CANBitStream:
-    """Build a *stuffed* CAN base frame bit stream and per-bit field labels."""
+    """Build a *stuffed* CAN base frame bit stream and per-bit field labels.
+
+    ``bits`` holds 0/1 (DOMINANT/RECESSIVE) and ``fields`` the ``Field.value`` codes,
+    both as ``bytearray`` (``np.frombuffer(bs.bits, np.uint8)`` gives a zero-copy view).
+    """
 
     def __init__(self, arbitration_id: int, data: bytes, r0: BitValue = BitValue.RECESSIVE):
         self.arb_id = arbitration_id & 0x7FF
-        self.data = data[:8]
+        self.data = bytes(data[:8])
         self.r0 = r0
 
-        self.bits: List[BitValue] = []
-        self.fields: List[Field] = []
+        self.bits = bytearray()
+        self.fields = bytearray()
         self._build()
 
-    def _push(self, bit: BitValue, field: Field):
-        self.bits.append(bit)
-        self.fields.append(field)
-
-    def _build_unstuffed_payload_bits(self) -> Tuple[List[BitValue], List[Field]]:
-        bits: List[BitValue] = []
-        fields: List[Field] = []
-
-        def push(bit: BitValue, field: Field):
-            bits.append(bit)
-            fields.append(field)
+    def __len__(self) -> int:
+        return len(self.bits)
 
-        # SOF
-        push(BitValue.DOMINANT, Field.SOF)
+    def bit_at(self, idx: int) -> BitValue:
+        return _BIT_VALUES[self.bits[idx]]
 
-        # 11-bit ID (MSB first)
-        for i in range(10, -1, -1):
-            push(BitValue.from_int((self.arb_id >> i) & 1), Field.ID)
+    def field_at(self, idx: int) -> Field:
+        return FIELD_BY_CODE[self.fields[idx]]
 
-        # Control field (base frame)
-        push(BitValue.DOMINANT, Field.RTR)
-        push(BitValue.DOMINANT, Field.IDE)
-        push(self.r0, Field.R0)
-
-        # DLC 4 bits
+    def _build_unstuffed_payload_bits(self) -> Tuple[bytearray, bytearray]:
         dlc = len(self.data)
-        for i in range(3, -1, -1):
-            push(BitValue.from_int((dlc >> i) & 1), Field.DLC)
+
+        # SOF, 11-bit ID (MSB first), RTR, IDE, R0, DLC
+        bits = bytearray(b"\x00")
+        bits += _ID_BITS[self.arb_id]
+        bits += bytes((0, 0, int(self.r0)))
+        bits += _DLC_BITS[dlc]
+        fields = bytearray(_HEAD_FIELDS)
 
         # DATA bytes
         for byte in self.data:
-            for i in range(7, -1, -1):
-                push(BitValue.from_int((byte >> i) & 1), Field.DATA)
+            bits += _BYTE_BITS[byte]
+        fields += bytes([Field.DATA.value]) * (8 * dlc)
 
         # CRC
-        crc_input = [int(b) for b in bits]
-        crc = _crc15_can(crc_input)
-        for i in range(14, -1, -1):
-            push(BitValue.from_int((crc >> i) & 1), Field.CRC)
-
-        # CRC delimiter
-        push(BitValue.RECESSIVE, Field.CRC_DELIM)
-        # ACK slot
-        push(BitValue.RECESSIVE, Field.ACK_SLOT)
-        push(BitValue.RECESSIVE, Field.ACK_DELIM)
-        # EOF 7 recessive
-        for _ in range(7):
-            push(BitValue.RECESSIVE, Field.EOF)
-        # Intermission 3 recessive
-        for _ in range(3):
-            push(BitValue.RECESSIVE, Field.INTERMISSION)
+        crc = _crc15_can(bits)
+        bits += _BYTE_BITS[crc >> 8][1:] + _BYTE_BITS[crc & 0xFF]
+        fields += _CRC_FIELDS
+
+        # CRC delimiter, ACK slot/delimiter, EOF, intermission
+        bits += _TAIL_BITS
+        fields += _TAIL_FIELDS
 
         return bits, fields
 
     @staticmethod
-    def _apply_bit_stuffing(
-        bits: List[BitValue], fields: List[Field]
-    ) -> Tuple[List[BitValue], List[Field]]:
+    def _apply_bit_stuffing(bits: bytearray, fields: bytearray) -> Tuple[bytearray, bytearray]:
         """Stuff from SOF through end of CRC sequence (inclusive)."""
-        out_bits: List[BitValue] = []
-        out_fields: List[Field] = []
+        out_bits = bytearray()
+        out_fields = bytearray()
+        stuff_code = Field.STUFF.value
 
-        run_val: Optional[BitValue] = None
+        run_val = -1
         run_len = 0
 
-        def should_stuff(idx: int) -> bool:
-            return fields[idx] in {
-                Field.SOF,
-                Field.ID,
-                Field.RTR,
-                Field.IDE,
-                Field.R0,
-                Field.DLC,
-                Field.DATA,
-                Field.CRC,
-            }
-
-        for idx, (b, f) in enumerate(zip(bits, fields)):
+        for b, f in zip(bits, fields):
             out_bits.append(b)
             out_fields.append(f)
 
-            if not should_stuff(idx):
-                run_val = None
+            if f not in _STUFFED_FIELD_CODES:
+                run_val = -1
                 run_len = 0
                 continue
 
-            if run_val is None:
+            if b == run_val:
+                run_len += 1
+                if run_len == 5:
+                    # lo stuff bit apre la run successiva
+                    run_val = b ^ 1
+                    out_bits.append(run_val)
+                    out_fields.append(stuff_code)
+                    run_len = 1
+            else:
                 run_val = b
                 run_len = 1
-            else:
-                if b == run_val:
-                    run_len += 1
-                    if run_len == 5:
-                        stuffed = BitValue.RECESSIVE if run_val is BitValue.DOMINANT else BitValue.DOMINANT
-                        out_bits.append(stuffed)
-                        out_fields.append(Field.STUFF)
-                        run_val = stuffed
-                        run_len = 1
-                else:
-                    run_val = b
-                    run_len = 1
 
         return out_bits, out_fields
 
     def _build(self):
         raw_bits, raw_fields = self._build_unstuffed_payload_bits()
-        stuffed_bits, stuffed_fields = self._apply_bit_stuffing(raw_bits, raw_fields)
-        self.bits = stuffed_bits
-        self.fields = stuffed_fields
+        self.bits, self.fields = self._apply_bit_stuffing(raw_bits, raw_fields)
+
+
+FRAME_CACHE_SIZE = 4096
+
+
+@functools.lru_cache(maxsize=FRAME_CACHE_SIZE)
+def _encode_frame_cached(arb_id: int, data: bytes, r0: int) -> CANBitStream:
+    return CANBitStream(arb_id, data, r0=_BIT_VALUES[r0])
+
+
+def encode_frame(arbitration_id: int, data: bytes, r0: BitValue = BitValue.RECESSIVE) -> CANBitStream:
+    """Encoded frame from a bounded LRU cache keyed by (arb_id, data, r0).
+
+    The cache is shared by the master and every ECU; the returned stream must be
+    treated as read-only (cursors live in the ECU, not in the stream).
+    """
+    return _encode_frame_cached(arbitration_id & 0x7FF, bytes(data[:8]), int(r0))
+
+
+def frame_cache_info():
+    """Hit/miss counters of the encoding cache (functools ``CacheInfo``)."""
+    return _encode_frame_cached.cache_info()
+
+
+# --- Batch encoder (attacker scoring, sweep Monte Carlo, valutazione IDS su trace) ---
+_HEAD_LEN = 19        # SOF + ID(11) + RTR + IDE + R0 + DLC(4)
+_MAX_RAW_LEN = _HEAD_LEN + 64 + 15 + len(_TAIL_BITS)
+_MAX_STUFFED_LEN = _MAX_RAW_LEN + (_HEAD_LEN + 64 + 15 - 1) // 4
+_CRC15_TABLE_NP = np.array(_CRC15_TABLE, dtype=np.int32)
+
+
+@dataclass
+class EncodedBatch:
+    bits: np.ndarray      # (n, L) uint8 bit stuffati, padding recessivo (1)
+    fields: np.ndarray    # (n, L) uint8 Field.value, padding 0
+    lengths: np.ndarray   # (n,) lunghezza stuffata di ogni riga
+    data_pos: np.ndarray  # (n, 64) int16: posizione stuffata del bit DATA k, -1 se assente
+
+
+def encode_batch(ids, payloads, r0=BitValue.RECESSIVE) -> EncodedBatch:
+    """Codifica n frame in una sola passata vettoriale (stesso risultato di CANBitStream).
+
+    ids: sequenza/array di n ID; payloads: lista di bytes (DLC 0..8) oppure array (n, dlc) uint8;
+    r0: BitValue/int comune oppure array (n,) di 0/1.
+    Il bit stuffing è una scansione sulle ~100 colonne, vettoriale sulle righe.
+    """
+    ids = np.asarray(ids, dtype=np.int64) & 0x7FF
+    n = len(ids)
+    if isinstance(payloads, np.ndarray):
+        k = min(8, payloads.shape[1])
+        data = np.zeros((n, 8), dtype=np.uint8)
+        data[:, :k] = payloads[:, :k]
+        dlc = np.full(n, k, dtype=np.int64)
+    else:
+        joined = [bytes(p[:8]) for p in payloads]
+        dlc = np.array([len(p) for p in joined], dtype=np.int64)
+        data = np.frombuffer(b"".join(p.ljust(8, b"\x00") for p in joined), dtype=np.uint8).reshape(n, 8)
+    r0 = np.broadcast_to(np.asarray(r0 if isinstance(r0, np.ndarray) else int(r0), dtype=np.uint8), (n,))
+    rows = np.arange(n)
+
+    # --- bit non stuffati (layout per riga: head | DATA(8*dlc) | CRC(15) | tail(13)) ---
+    raw = np.ones((n, _MAX_RAW_LEN), dtype=np.uint8)
+    raw_f = np.zeros((n, _MAX_RAW_LEN), dtype=np.uint8)
+    raw[:, 0] = 0
+    raw[:, 1:12] = (ids[:, None] >> np.arange(10, -1, -1)) & 1
+    raw[:, 12] = 0
+    raw[:, 13] = 0
+    raw[:, 14] = r0
+    raw[:, 15:19] = (dlc[:, None] >> np.arange(3, -1, -1)) & 1
+    raw_f[:, :_HEAD_LEN] = np.frombuffer(_HEAD_FIELDS, dtype=np.uint8)
+    data_bits = np.unpackbits(data, axis=1)
+    data_cols = np.arange(64)
+    has_data = data_cols[None, :] < (8 * dlc)[:, None]
+    raw[:, _HEAD_LEN:_HEAD_LEN + 64] = np.where(has_data, data_bits, 1)
+    raw_f[:, _HEAD_LEN:_HEAD_LEN + 64] = np.where(has_data, Field.DATA.value, 0)
+
+    # --- CRC-15 table-driven, vettoriale: 3 bit seriali poi un byte per passo ---
+    crc = np.zeros(n, dtype=np.int32)
+    for c in range(3):
+        msb = (crc >> 14) & 1
+        crc = ((crc << 1) & 0x7FFF) | raw[:, c]
+        crc ^= msb * _CRC15_POLY
+    msg_bytes = np.packbits(raw[:, 3:_HEAD_LEN + 64], axis=1).astype(np.int32)  # 2 byte header + 8 DATA
+    n_bytes = 2 + dlc
+    for k in range(10):
+        upd = (crc & 0x7F) << 8 ^ _CRC15_TABLE_NP[crc >> 7] ^ msg_bytes[:, k]
+        crc = np.where(k < n_bytes, upd & 0x7FFF, crc)
+
+    crc_start = _HEAD_LEN + 8 * dlc
+    crc_cols = crc_start[:, None] + np.arange(15)
+    raw[rows[:, None], crc_cols] = (crc[:, None] >> np.arange(14, -1, -1)) & 1
+    raw_f[rows[:, None], crc_cols] = Field.CRC.value
+    tail_cols = crc_start[:, None] + 15 + np.arange(len(_TAIL_BITS))
+    raw[rows[:, None], tail_cols] = 1
+    raw_f[rows[:, None], tail_cols] = np.frombuffer(_TAIL_FIELDS, dtype=np.uint8)
+    raw_len = crc_start + 15 + len(_TAIL_BITS)
+    stuff_end = crc_start + 15
+
+    # --- bit stuffing: scansione per colonna sullo stato delle run (vedi CANBitStream._apply_bit_stuffing),
+    #     poi un unico scatter dei bit nelle posizioni stuffate ---
+    n_cols = _HEAD_LEN + 64 + 15
+    raw_t = np.ascontiguousarray(raw[:, :n_cols].T)
+    need_t = np.zeros((_MAX_RAW_LEN, n), dtype=np.uint8)
+    run_val = np.full(n, 2, dtype=np.uint8)
+    run_len = np.zeros(n, dtype=np.uint8)
+    for c in range(n_cols):
+        b = raw_t[c]
+        run_len *= b == run_val
+        run_len += 1
+        need = need_t[c]
+        np.equal(run_len, 5, out=need, casting="unsafe")
+        run_len -= 4 * need          # lo stuff bit apre la run successiva (lunghezza 1)
+        np.bitwise_xor(b, need, out=run_val)
+    # oltre la fine del CRC non si stuffa: le run calcolate lì vengono scartate
+    stuffed_after = need_t.T.astype(bool) & (np.arange(_MAX_RAW_LEN)[None, :] < stuff_end[:, None])
+
+    n_stuff = np.cumsum(stuffed_after, axis=1, dtype=np.int16)
+    pos = np.arange(_MAX_RAW_LEN, dtype=np.int16)[None, :] + n_stuff - stuffed_after
+
+    # Le colonne oltre raw_len valgono già padding (1 / campo 0): scatter senza maschera,
+    # le posizioni di una riga sono strettamente crescenti e non si sovrappongono.
+    out = np.ones((n, _MAX_STUFFED_LEN), dtype=np.uint8)
+    out_f = np.zeros((n, _MAX_STUFFED_LEN), dtype=np.uint8)
+    np.put_along_axis(out, pos, raw, axis=1)
+    np.put_along_axis(out_f, pos, raw_f, axis=1)
+    s_rows, s_cols = np.nonzero(stuffed_after)
+    out[s_rows, pos[s_rows, s_cols] + 1] = raw[s_rows, s_cols] ^ 1
+    out_f[s_rows, pos[s_rows, s_cols] + 1] = Field.STUFF.value
+
+    data_pos = np.where(has_data, pos[:, _HEAD_LEN:_HEAD_LEN + 64], -1).astype(np.int16)
+    lengths = raw_len + n_stuff[:, -1]
+
+    return EncodedBatch(bits=out, fields=out_f, lengths=lengths, data_pos=data_pos)
 
 
 def bytes_to_bits(data: bytes) -> List[int]:
-    bits = []
-    for byte in data:
-        for i in range(7, -1, -1):
-            bits.append((byte >> i) & 1)
-    return bits
+    return list(b"".join(_BYTE_BITS[byte] for byte in data))
+
+
+_ARB_FIELD_CODES_NP = np.array(sorted(_ARB_FIELD_CODES), dtype=np.uint8)
+
+
+@dataclass
+class ArbitrationResult:
+    bits: np.ndarray        # (n, L) bit stuffati, padding recessivo
+    fields: np.ndarray      # (n, L) Field.value
+    bus: np.ndarray         # (L,) livello del bus: wired-AND dei nodi ancora attivi
+    lost_at: np.ndarray     # (n,) colonna di perdita arbitraggio, -1 se non perde
+    survivors: List[int]    # stesso ID/RTR del vincitore (len > 1 => collisione)
+    error_col: int          # primo bit error fuori arbitraggio tra i survivors, -1 se nessuno
+    error_nodes: List[int]  # survivors che mettono recessivo e leggono dominante in error_col
+
+
+def wired_and_arbitrate(streams: List[CANBitStream]) -> ArbitrationResult:
+    """Arbitraggio + bit monitoring vettoriali su una matrice (contendenti x bit).
+
+    La riga lessicograficamente minima è quella che sopravvive sul bus (wired-AND).
+    Per ogni nodo la prima colonna in cui differisce da lei è quella in cui mette
+    recessivo e legge dominante: se cade in SOF/ID/RTR è perdita di arbitraggio,
+    altrimenti (stesso ID) è un bit error. Il costo per contendente è un passaggio
+    vettoriale, indipendente dal numero di bit simulati in Python.
+    """
+    n = len(streams)
+    L = max(len(bs.bits) for bs in streams)
+    bits = np.ones((n, L), dtype=np.uint8)
+    fields = np.full((n, L), Field.INTERMISSION.value, dtype=np.uint8)
+    for r, bs in enumerate(streams):
+        m = len(bs.bits)
+        bits[r, :m] = np.frombuffer(bytes(bs.bits), dtype=np.uint8)
+        fields[r, :m] = np.frombuffer(bytes(bs.fields), dtype=np.uint8)
+
+    # riga minima (a parità vince l'indice più basso: lexsort è stabile)
+    w = int(np.lexsort(bits[:, ::-1].T)[0])
+    diff = bits != bits[w]
+    has_diff = diff.any(axis=1)
+    first = np.where(has_diff, diff.argmax(axis=1), L)
+
+    field_at_first = fields[w, np.minimum(first, L - 1)]
+    lost = has_diff & np.isin(field_at_first, _ARB_FIELD_CODES_NP)
+    lost_at = np.where(lost, first, -1)
+    survivors = np.flatnonzero(~lost)
+
+    error_col = -1
+    error_nodes: List[int] = []
+    if len(survivors) > 1:
+        e = int(first[survivors].min())
+        if e < L:
+            error_col = e
+            error_nodes = [int(i) for i in survivors[first[survivors] == e]]
+
+    # bus per colonna: un nodo smette di trasmettere dopo aver perso l'arbitraggio
+    cols = np.arange(L)
+    still_tx = (lost_at[:, None] < 0) | (cols[None, :] <= lost_at[:, None])
+    bus = np.where(still_tx, bits, 1).min(axis=0)
+
+    return ArbitrationResult(
+        bits=bits,
+        fields=fields,
+        bus=bus,
+        lost_at=lost_at,
+        survivors=[int(i) for i in survivors],
+        error_col=error_col,
+        error_nodes=error_nodes,
+    )
+
+
+class PendingSignal:
+    """
+    Notifica "frame in coda" di una ECU, pubblicata da CANBusMaster.submit_transmission.
+
+    seq conta gli enqueue: chi osserva legge seq e poi wait(seq) si sveglia esattamente al
+    successivo (Condition propria, il lock del master non viene toccato). In alternativa si
+    registrano callback(ecu, arb_id, ts), chiamate nel thread che accoda il frame.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._callbacks = []
+        self.seq = 0
+        self.last_ts: Optional[float] = None
+
+    def subscribe(self, callback):
+        self._callbacks.append(callback)
+
+    def publish(self, ecu, arb_id: int, ts: float):
+        with self._cond:
+            self.seq += 1
+            self.last_ts = ts
+            self._cond.notify_all()
+        for callback in self._callbacks:
+            callback(ecu, arb_id, ts)
+
+    def wait(self, seq: int, timeout: Optional[float] = None) -> int:
+        """Aspetta un enqueue successivo a seq (o il timeout) e ritorna il seq corrente."""
+        with self._cond:
+            self._cond.wait_for(lambda: self.seq != seq, timeout)
+            return self.seq
 
 
 # --- CAN Bus Master ---
@@ -207,30 +473,68 @@ class CANBusMaster:
     Simulatore semplificato:
     - arbitra frame tra più ECU
     - gestisce collisioni (stesso ID) e invia error flag active anche su vcan0
+    - sincronizzazione a bus idle: tutte le ECU pending all'inizio dello slot
+      partecipano all'arbitraggio, senza finestra di raccolta artificiale
     """
     def __init__(self, use_vcan: bool = False):
         self.ecus = {}
         self.pending = []
         self.lock = threading.Lock()
+        # Il master dorme finché il bus è idle e nessuno è pending (niente polling)
+        self._bus_idle = threading.Condition(self.lock)
+        # _synced[ecu] = frame che partono sul SOF della prossima trasmissione di ecu
+        self._synced = defaultdict(list)
+        # _pending_signals[ecu] = PendingSignal pubblicato a ogni suo enqueue (solo se qualcuno osserva)
+        self._pending_signals = {}
+        # IDS asincrono: il master pubblica le collisioni, l'analisi gira nel worker della pipeline
+        self.ids_pipeline: Optional["IDSPipeline"] = None
         self._stop = False
         self._thread = None
-        self.collect_window = 0.002
         self.use_vcan = use_vcan
         self.vcan_bus = None
         if self.use_vcan:
             try:
                 self.vcan_bus = can.interface.Bus(channel='vcan0', interface='socketcan')
-                print("[MASTER] Connected to vcan0")
+                TRACE.emit(TraceLevel.STATE, "[MASTER] Connected to vcan0")
             except Exception as e:
-                print(f"[MASTER] Error connecting to vcan0: {e}")
+                TRACE.emit(TraceLevel.STATE, "[MASTER] Error connecting to vcan0: %s", e)
                 self.vcan_bus = None
 
     def register_ecu(self, ecu):
         self.ecus[ecu.slave_id] = ecu
 
-    def submit_transmission(self, ecu, data: bytes, arb_id: int, r0: BitValue = BitValue.RECESSIVE):
-        with self.lock:
+    def pending_signal(self, ecu) -> PendingSignal:
+        """PendingSignal di ecu: si sveglia a ogni suo frame accodato in pending."""
+        return self._pending_signals.setdefault(ecu, PendingSignal())
+
+    def subscribe_pending(self, ecu, callback):
+        """callback(ecu, arb_id, ts) a ogni frame di ecu accodato in pending."""
+        self.pending_signal(ecu).subscribe(callback)
+
+    def submit_transmission(self, ecu, data: bytes, arb_id: int, r0: BitValue = BitValue.RECESSIVE,
+                            sync_with=None):
+        """Accoda una trasmissione per il prossimo slot.
+
+        sync_with: se indicato, il frame resta "armato" e parte nello stesso slot della
+        prossima trasmissione di quella ECU (hard-sync sul suo SOF, come in WeepingCAN).
+        Un nuovo frame armato sostituisce quello precedente della stessa ECU; i frame armati
+        su/da un'ECU in bus-off e quelli ancora armati allo stop vengono scartati.
+        """
+        with self._bus_idle:
+            if sync_with is not None:
+                if self._stop or ecu.is_bus_off() or sync_with.is_bus_off():
+                    return
+                armed = self._synced[sync_with]
+                armed[:] = [f for f in armed if f[0] is not ecu]
+                armed.append((ecu, data, arb_id, r0))
+                return
             self.pending.append((ecu, data, arb_id, r0))
+            self.pending.extend(self._synced.pop(ecu, ()))
+            self._bus_idle.notify()
+        # fuori dal lock del master: gli osservatori non competono con l'arbitraggio
+        signal = self._pending_signals.get(ecu)
+        if signal is not None:
+            signal.publish(ecu, arb_id, time.time())
 
     def start(self):
         self._thread = threading.Thread(target=self._run, daemon=True)
@@ -238,6 +542,9 @@ class CANBusMaster:
 
     def stop(self):
         self._stop = True
+        with self._bus_idle:
+            self._synced.clear()
+            self._bus_idle.notify_all()
         try:
             if self.vcan_bus is not None:
                 self.vcan_bus.shutdown()
@@ -246,14 +553,28 @@ class CANBusMaster:
 
     def _run(self):
         while not self._stop:
-            with self.lock:
-                if not self.pending:
-                    pass
-                else:
-                    contenders = self.pending[:]
-                    self.pending.clear()
-                    self._process_contenders(contenders)
-            time.sleep(self.collect_window)
+            with self._bus_idle:
+                while not self.pending and not self._stop:
+                    self._bus_idle.wait()
+                if self._stop:
+                    break
+                # Bus idle: chi è pending all'inizio dello slot entra in arbitraggio
+                contenders = self.pending[:]
+                self.pending.clear()
+                self._process_contenders(contenders)
+                for ecu in {c[0] for c in contenders}:
+                    if ecu.is_bus_off():
+                        self._drop_armed(ecu)
+
+    def _drop_armed(self, ecu):
+        """Scarta i frame armati sul SOF di ecu e quelli armati da ecu (chiamare col lock)."""
+        self._synced.pop(ecu, None)
+        for target in list(self._synced):
+            armed = [f for f in self._synced[target] if f[0] is not ecu]
+            if armed:
+                self._synced[target] = armed
+            else:
+                del self._synced[target]
 
     def _process_contenders(self, contenders):
         if len(contenders) == 1:
@@ -275,67 +596,34 @@ class CANBusMaster:
         self._transmit_frame(winner_ecu, winner_data, winner_id, winner_r0, contenders)
 
     def _perform_arbitration(self, contenders):
-        """Esegue l'arbitraggio bit-by-bit tra le ECU contendenti.
+        """Arbitraggio wired-AND vettoriale tra le ECU contendenti.
 
         contenders: List[(ecu, data, arb_id, r0)]
         """
         bitstreams = []
         for ecu, data, arb_id, r0 in contenders:
-            bs = CANBitStream(arb_id, data, r0=r0)
+            bs = encode_frame(arb_id, data, r0=r0)
             bitstreams.append((ecu, bs, arb_id, data, r0))
 
-        active = list(range(len(bitstreams)))
-        bit_idx = 0
-
-        while len(active) > 1:
-            if bit_idx >= min(len(bitstreams[i][1].bits) for i in active):
-                break
-
-            offered = []
-            for i in active:
-                ecu, bs, _, _, _ = bitstreams[i]
-                if bit_idx < len(bs.bits):
-                    bit = bs.bits[bit_idx]
-                    field = bs.fields[bit_idx]
-                    offered.append((i, ecu, bit, field))
-
-            if not offered:
-                break
-
-            bus_bit = BitValue.DOMINANT if any(bit is BitValue.DOMINANT for _, _, bit, _ in offered) else BitValue.RECESSIVE
-            field = offered[0][3]
-
-            contenders_str = " | ".join([f"{ecu.name}={int(bit)}" for _, ecu, bit, _ in offered])
-            print(f"  [ARB] {field.name:12s} | {contenders_str} -> BUS={int(bus_bit)}")
-
-            # Durante l'arbitraggio ID, chi mette recessivo perde
-            if field in {Field.SOF, Field.ID, Field.RTR}:
-                losers = []
-                for i, ecu, bit, _ in offered:
-                    if bit is BitValue.RECESSIVE and bus_bit is BitValue.DOMINANT:
-                        print(f"  [ARB] {ecu.name} perde arbitraggio")
-                        losers.append(i)
+        res = wired_and_arbitrate([bs for _, bs, _, _, _ in bitstreams])
 
-                for loser_idx in sorted(losers, reverse=True):
-                    if loser_idx in active:
-                        active.remove(loser_idx)
+        for i in np.flatnonzero(res.lost_at >= 0):
+            col = int(res.lost_at[i])
+            ecu = bitstreams[i][0]
+            field = FIELD_BY_CODE[int(res.fields[i, col])]
+            TRACE.emit(TraceLevel.FRAME, "  [ARB] %s perde arbitraggio (bit %s, %s)", ecu.name, col, field.name)
 
-            bit_idx += 1
+        # Se stesso ID, continua con i dati/controllo: collisione volontaria (attacco)
+        if len(res.survivors) > 1:
+            if TRACE.frame:
+                TRACE.emit(TraceLevel.FRAME, "[MASTER] COLLISION! Stesso ID tra: %s", ', '.join([bitstreams[i][0].name for i in res.survivors]))
+            return self._handle_collision(bitstreams, res)
 
-            # Se stesso ID, continua con i dati/controllo: collisione volontaria (attacco)
-            if field == Field.RTR and len(active) > 1:
-                print(f"[MASTER] COLLISION! Stesso ID tra: {', '.join([bitstreams[i][0].name for i in active])}")
-                return self._handle_collision(bitstreams, active, bit_idx)
-
-        if len(active) == 1:
-            winner_idx = active[0]
-            winner_ecu, _, winner_id, winner_data, winner_r0 = bitstreams[winner_idx]
-            print(f"[MASTER] WINNER: {winner_ecu.name} (ID=0x{winner_id:03X}) -> TRANSMIT")
-            return winner_ecu, winner_data, winner_id, winner_r0
-
-        return None, None, None, None
+        winner_ecu, _, winner_id, winner_data, winner_r0 = bitstreams[res.survivors[0]]
+        TRACE.emit(TraceLevel.FRAME, "[MASTER] WINNER: %s (ID=0x%03X) -> TRANSMIT", winner_ecu.name, winner_id)
+        return winner_ecu, winner_data, winner_id, winner_r0
 
-    def _handle_collision(self, bitstreams, active, start_bit_idx):
+    def _handle_collision(self, bitstreams, res):
         import sys, os
         
         """Gestisce collisione tra ECU con stesso ID (bit monitoring -> error flag).
@@ -346,67 +634,29 @@ class CANBusMaster:
         l'altra ECU (che in quel bit sta mettendo DOMINANT) continua la trasmissione del suo frame:
             offender TEC +7, vincitore TEC -1 (gestito da _transmit_frame).
         """
-        bit_idx = start_bit_idx
-        error_detected = False
-        offender_ecu = None
-
-        offered_at_error = None  # snapshot per decidere chi continua
-        bus_bit_at_error = None
+        active = res.survivors
+        bit_idx = res.error_col
 
-        while len(active) > 0 and not error_detected:
-            offered = []
-            for i in active:
-                ecu, bs, _, _, _ = bitstreams[i]
-                if bit_idx < len(bs.bits):
-                    bit = bs.bits[bit_idx]
-                    field = bs.fields[bit_idx]
-                    offered.append((i, ecu, bit, field))
-
-            if not offered:
-                break
-
-            bus_bit = BitValue.DOMINANT if any(bit is BitValue.DOMINANT for _, _, bit, _ in offered) else BitValue.RECESSIVE
-            field = offered[0][3]
-
-            contenders_str = " | ".join([f"{ecu.name}={int(bit)}" for _, ecu, bit, _ in offered])
-            print(f"  [TX]  {field.name:12s} | {contenders_str} -> BUS={int(bus_bit)}")
-
-            # Bit monitoring: se una ECU mette recessivo ma legge dominante -> ERROR
-            for _, ecu, bit, _ in offered:
-                if bit is BitValue.RECESSIVE and bus_bit is BitValue.DOMINANT:
-                    if field not in {Field.SOF, Field.ID, Field.RTR}:
-                        print(
-                            f"[MASTER] BIT ERROR rilevato da {ecu.name} (offender=bit_monitoring) -> error flag"
-                        )
-                        error_detected = True
-                        offender_ecu = ecu
-                            # ID coinvolto: prendilo da bitstreams (è uguale per tutti qui)
-                        any_idx = offered[0][0]
-                        arb_id = bitstreams[any_idx][2]   # nel tuo tuple sembra essere l'ID
-
-                        if hasattr(self, "ids") and self.ids is not None:
-                            # per ora usa bit_idx "assoluto". Se vuoi solo DATA, puoi filtrare field==Field.DATA
-                            self.ids.observe_collision(arb_id=arb_id, bit_idx=bit_idx, offender_name=ecu.name)
-
-                            alert = self.ids.check_alert(arb_id)
-                            if alert:
-                                print(
-                                    f"[IDS] ALERT su ID=0x{alert['arb_id']:03X} | "
-                                    f"collisions={alert['collisions']} in {alert['window_s']}s | "
-                                    f"mode_bit={alert['mode_bit']} ({alert['mode_share']*100:.1f}%) | "
-                                    f"H={alert['entropy']:.2f} | top_off={alert['top_offender']} ({alert['top_offender_share']*100:.1f}%)"
-                                )
-                                sys.stdout.flush()
-                                sys.stderr.flush()
-                                os._exit(0)
-                        offered_at_error = offered[:]        # snapshot
-                        bus_bit_at_error = bus_bit
-                        break
+        # Nessun bit diverso fuori arbitraggio: frame identici, nessun errore rilevato
+        if bit_idx < 0 or not res.error_nodes:
+            return None, None, None, None
 
-            bit_idx += 1
+        # Bit monitoring: il primo che mette recessivo e legge dominante rileva l'errore
+        offender_ecu = bitstreams[res.error_nodes[0]][0]
+        field = FIELD_BY_CODE[int(res.fields[active[0], bit_idx])]
+        if TRACE.bit:
+            contenders_str = " | ".join([f"{bitstreams[i][0].name}={int(res.bits[i, bit_idx])}" for i in active])
+            TRACE.emit(TraceLevel.BIT, "  [TX]  %-12s | %s -> BUS=%s (bit %s)", field.name, contenders_str, int(res.bus[bit_idx]), bit_idx)
+        TRACE.emit(
+            TraceLevel.ERROR,
+            "[MASTER] BIT ERROR rilevato da %s (offender=bit_monitoring) -> error flag", offender_ecu.name
+        )
 
-        if not (error_detected and offender_ecu):
-            return None, None, None, None
+        # ID coinvolto: prendilo da bitstreams (è uguale per tutti qui)
+        arb_id = bitstreams[active[0]][2]
+        if self.ids_pipeline is not None:
+            # bit_idx "assoluto"; SimpleCANIDS(only_data_field=True) tiene solo gli errori in DATA
+            self.ids_pipeline.publish(arb_id, bit_idx, offender_ecu.name, field=field)
 
         # 1) invio error flag coerente con lo stato dell'offender
         self._send_error_flag(offender_ecu)
@@ -419,13 +669,13 @@ class CANBusMaster:
             for ecu in involved:
                 ecu.tec += 8
                 ecu._update_state()
-                print(f"[MASTER] {ecu.name}: TEC={ecu.tec} (+8 per errore ACTIVE) State={ecu.state.name}")
+                TRACE.emit(TraceLevel.ERROR, "[MASTER] %s: TEC=%s (+8 per errore ACTIVE) State=%s", ecu.name, ecu.tec, ecu.state.name)
 
             # Listener REC
             for ecu in self.ecus.values():
                 if ecu not in involved and not ecu.is_bus_off():
                     ecu.rec += 1
-                    print(f"[MASTER] {ecu.name}: REC={ecu.rec} (+1 per errore ricevuto)")
+                    TRACE.emit(TraceLevel.ERROR, "[MASTER] %s: REC=%s (+1 per errore ricevuto)", ecu.name, ecu.rec)
 
             return None, None, None, None
 
@@ -433,16 +683,15 @@ class CANBusMaster:
         # Error Flag Passive è recessivo: chi stava dominando sul bit dell'errore continua con il suo frame.
         offender_ecu.tec += 7
         offender_ecu._update_state()
-        print(f"[MASTER] {offender_ecu.name}: TEC={offender_ecu.tec} (+7 per errore PASSIVE) State={offender_ecu.state.name}")
+        TRACE.emit(TraceLevel.ERROR, "[MASTER] %s: TEC=%s (+7 per errore PASSIVE) State=%s", offender_ecu.name, offender_ecu.tec, offender_ecu.state.name)
 
         # scegli il vincitore come ECU che sul bit dell'errore stava mettendo DOMINANT (BUS=0),
         # diversa dall'offender (che stava mettendo RECESSIVE)
         winner_idx = None
-        if offered_at_error is not None and bus_bit_at_error is BitValue.DOMINANT:
-            for i, ecu, bit, _ in offered_at_error:
-                if ecu is not offender_ecu and bit is BitValue.DOMINANT:
-                    winner_idx = i
-                    break
+        for i in active:
+            if bitstreams[i][0] is not offender_ecu and res.bits[i, bit_idx] == 0:
+                winner_idx = i
+                break
 
         # fallback (se per qualche motivo non troviamo il dominante)
         if winner_idx is None:
@@ -456,15 +705,16 @@ class CANBusMaster:
             return None, None, None, None
 
         winner_ecu, _, winner_id, winner_data, winner_r0 = bitstreams[winner_idx]
-        print(f"[MASTER] (PASSIVE FLAG) {winner_ecu.name} continua la trasmissione del frame originale")
+        TRACE.emit(TraceLevel.ERROR, "[MASTER] (PASSIVE FLAG) %s continua la trasmissione del frame originale", winner_ecu.name)
         return winner_ecu, winner_data, winner_id, winner_r0
 
     def _send_error_flag_active(self, offender_ecu):
         """Invia error flag active (6 bit dominanti)"""
-        print(f"\n[MASTER] Sending ERROR FLAG ACTIVE (6 dominant bits)")
+        TRACE.emit(TraceLevel.ERROR, "\n[MASTER] Sending ERROR FLAG ACTIVE (6 dominant bits)")
 
-        for bit_num in range(6):
-            print(f"  [ERR] ERROR_FLAG_ACTIVE | {offender_ecu.name} -> BUS=0 (bit {bit_num+1}/6)")
+        if TRACE.bit:
+            for bit_num in range(6):
+                TRACE.emit(TraceLevel.BIT, "  [ERR] ERROR_FLAG_ACTIVE | %s -> BUS=0 (bit %d/6)", offender_ecu.name, bit_num + 1)
 
         if self.use_vcan:
             try:
@@ -474,15 +724,16 @@ class CANBusMaster:
                     is_extended_id=False
                 )
                 self.vcan_bus.send(error_msg)
-                print(f"[MASTER] Error Active Flag sent to vcan0")
+                TRACE.emit(TraceLevel.ERROR, "[MASTER] Error Active Flag sent to vcan0")
             except Exception as e:
-                print(f"[MASTER] Error sending error flag to vcan0: {e}")
+                TRACE.emit(TraceLevel.ERROR, "[MASTER] Error sending error flag to vcan0: %s", e)
 
     def _send_error_flag_passive(self, offender_ecu):
         """Invia error flag passive (8 bit recessivi)."""
-        print(f"\n[MASTER] Sending ERROR FLAG PASSIVE (8 recessive bits)")
-        for bit_num in range(8):
-            print(f"  [ERR] ERROR_FLAG_PASSIVE | {offender_ecu.name} -> BUS=1 (bit {bit_num+1}/8)")
+        TRACE.emit(TraceLevel.ERROR, "\n[MASTER] Sending ERROR FLAG PASSIVE (8 recessive bits)")
+        if TRACE.bit:
+            for bit_num in range(8):
+                TRACE.emit(TraceLevel.BIT, "  [ERR] ERROR_FLAG_PASSIVE | %s -> BUS=1 (bit %d/8)", offender_ecu.name, bit_num + 1)
         # Nota: su SocketCAN non inviamo un vero error-frame; qui è solo logging.
 
     def _send_error_flag(self, offender_ecu):
@@ -494,12 +745,16 @@ class CANBusMaster:
 
     def _transmit_frame(self, winner_ecu, data, arb_id, r0, all_contenders):
         """Trasmette il frame vincente"""
-        bs = CANBitStream(arb_id, data, r0=r0)
+        bs = encode_frame(arb_id, data, r0=r0)
 
-        for bit, field in zip(bs.bits, bs.fields):
-            print(f"  [TX]  {field.name:12s} | {winner_ecu.name}={int(bit)}")
+        if TRACE.bit:
+            for bit, field in zip(bs.bits, bs.fields):
+                TRACE.emit(TraceLevel.BIT, "  [TX]  %-12s | %s=%d", FIELD_BY_CODE[field].name, winner_ecu.name, bit)
 
-        print(f"[MASTER] Frame OK: ID=0x{arb_id:03X} data={data.hex().upper()}")
+        if TRACE.frame:
+            TRACE.emit(TraceLevel.FRAME, "[MASTER] Frame OK: ID=0x%03X data=%s", arb_id, data.hex().upper())
+        if self.ids_pipeline is not None:
+            self.ids_pipeline.publish_frame(arb_id)
 
         if self.use_vcan:
             try:
@@ -510,12 +765,12 @@ class CANBusMaster:
                 )
                 self.vcan_bus.send(msg)
             except Exception as e:
-                print(f"[MASTER] Error sending to vcan0: {e}")
+                TRACE.emit(TraceLevel.ERROR, "[MASTER] Error sending to vcan0: %s", e)
 
         # TEC -= 1 per il vincitore (modello semplificato usato nel simulatore)
         winner_ecu.tec = max(0, winner_ecu.tec - 1)
         winner_ecu._update_state()
-        print(f"[MASTER] {winner_ecu.name}: TEC={winner_ecu.tec} (-1 per successo) State={winner_ecu.state.name}")
+        TRACE.emit(TraceLevel.FRAME, "[MASTER] %s: TEC=%s (-1 per successo) State=%s", winner_ecu.name, winner_ecu.tec, winner_ecu.state.name)
 
         # REC -= 1 per i listener
         for ecu in self.ecus.values():
@@ -550,7 +805,7 @@ class BaseECU:
         self.master.register_ecu(self)
 
     def start(self):
-        print(f"[{self.name}] START slave_id={self.slave_id} ID=0x{self.arb_id:03X} period={self.tx_period:.2f}s")
+        TRACE.emit(TraceLevel.STATE, "[%s] START slave_id=%s ID=0x%03X period=%.2fs", self.name, self.slave_id, self.arb_id, self.tx_period)
         self.next_tx_time = time.time() + self.start_delay
         self._tx_thread = threading.Thread(target=self._tx_loop, daemon=True)
         self._tx_thread.start()
@@ -564,11 +819,11 @@ class BaseECU:
     def _update_state(self):
         if self.tec >= 256:
             self.state = NodeState.BUS_OFF
-            print(f"[{self.name}] *** ENTERED BUS-OFF STATE *** (TEC={self.tec})")
+            TRACE.emit(TraceLevel.STATE, "[%s] *** ENTERED BUS-OFF STATE *** (TEC=%s)", self.name, self.tec)
         elif self.tec >= 128:
             if self.state != NodeState.ERROR_PASSIVE:
                 self.state = NodeState.ERROR_PASSIVE
-                print(f"[{self.name}] Entered ERROR-PASSIVE state (TEC={self.tec})")
+                TRACE.emit(TraceLevel.STATE, "[%s] Entered ERROR-PASSIVE state (TEC=%s)", self.name, self.tec)
         else:
             self.state = NodeState.ERROR_ACTIVE
 
@@ -650,118 +905,560 @@ class BaseECU:
 
             if dt <= 0:
                 data = self._build_payload()
-                print(f"[{self.name}] VUOLE TRASMETTERE (ID=0x{self.arb_id:03X}) TEC={self.tec} REC={self.rec} State={self.state.name}")
-                self.master.submit_transmission(self, data, self.arb_id, r0=BitValue.RECESSIVE)
+                TRACE.emit(TraceLevel.FRAME, "[%s] VUOLE TRASMETTERE (ID=0x%03X) TEC=%s REC=%s State=%s", self.name, self.arb_id, self.tec, self.rec, self.state.name)
 
-                # schedule senza drift (mantiene periodo costante)
+                # schedule senza drift (mantiene periodo costante); prima del submit, così chi
+                # si sveglia sul PendingSignal legge già il ciclo successivo
                 self.next_tx_time += self.tx_period
                 # se eravamo in ritardo tanto, "recupera"
                 while self.next_tx_time <= now:
                     self.next_tx_time += self.tx_period
 
+                self.master.submit_transmission(self, data, self.arb_id, r0=BitValue.RECESSIVE)
                 continue
 
             time.sleep(min(dt, 0.005))
 
-import time
-import math
-from collections import deque, Counter, defaultdict
 
-class SimpleCANIDS:
+# --- Modello bit-level dei payload (NumPy) ---
+class BitMatrixModel:
     """
-    IDS minimal:
-      1) collision rate per ID in finestra W
-      2) bit index concentration (mode share o entropia bassa)
-    Non assume attacker/victim a priori.
+    Storico dei payload di un ID come matrice uint8 impacchettata (una riga da 8 byte per
+    frame, DLC corti con padding a 0) e conteggi degli 1 per posizione di bit, aggiornati a
+    ogni frame con np.unpackbits. Probabilità, pesi e penalità d'attacco sono array da 64:
+    preparare un attacco non scansiona lo storico.
+    Lo storico è una finestra delle ultime max_rows righe: quelle che escono vengono sottratte
+    dai conteggi, e il buffer (al massimo 2 * max_rows righe) viene compattato solo quando
+    la coda arriva in fondo.
     """
+    NBITS = 64
+
+    def __init__(self, capacity: int = 256, max_rows: int = 4096):
+        self.max_rows = max(1, int(max_rows))
+        capacity = max(1, min(int(capacity), 2 * self.max_rows))
+        self.rows = np.zeros((capacity, 8), dtype=np.uint8)
+        self.lengths = np.zeros(capacity, dtype=np.int16)  # bit validi per riga (DLC * 8)
+        self._lo = 0  # prima riga della finestra nel buffer
+        self.n = 0    # righe nella finestra
+        self.num_bits = self.NBITS   # lunghezza minima nella finestra: posizioni confrontabili
+        self.max_bits = 0
+        self.ones = np.zeros(self.NBITS, dtype=np.int64)
+        self.weights = np.ones(self.NBITS)
+        self.attack_counts = np.zeros(self.NBITS, dtype=np.int64)
+        self.penalty = np.ones(self.NBITS)  # (1 + attack_counts) ** 0.70
+
+    def _evict(self, k: int):
+        """Toglie dalla finestra le k righe più vecchie."""
+        k = min(k, self.n)
+        if k <= 0:
+            return
+        lo = self._lo
+        self.ones -= np.unpackbits(self.rows[lo:lo + k], axis=1).sum(axis=0, dtype=np.int64)
+        self._lo += k
+        self.n -= k
+        if self.n:
+            lens = self.lengths[self._lo:self._lo + self.n]
+            self.num_bits, self.max_bits = int(lens.min()), int(lens.max())
+        else:
+            self.num_bits, self.max_bits = self.NBITS, 0
+
+    def _reserve(self, extra: int) -> int:
+        """Spazio per extra righe (extra <= max_rows) in coda alla finestra; ritorna dove scriverle."""
+        self._evict(self.n + extra - self.max_rows)
+        end = self._lo + self.n
+        if end + extra > len(self.rows):
+            cap = min(max(self.n + extra, 2 * len(self.rows)), 2 * self.max_rows)
+            if cap > len(self.rows):
+                rows = np.zeros((cap, 8), dtype=np.uint8)
+                lengths = np.zeros(cap, dtype=np.int16)
+            else:
+                rows, lengths = self.rows, self.lengths
+            rows[:self.n] = self.rows[self._lo:end]
+            lengths[:self.n] = self.lengths[self._lo:end]
+            rows[self.n:] = 0
+            self.rows, self.lengths = rows, lengths
+            self._lo, end = 0, self.n
+        return end
+
+    def add(self, data: bytes):
+        data = bytes(data[:8])
+        i = self._reserve(1)
+        row = self.rows[i]
+        row[:len(data)] = np.frombuffer(data, dtype=np.uint8)
+        self.lengths[i] = 8 * len(data)
+        self.ones += np.unpackbits(row)
+        self.num_bits = min(self.num_bits, 8 * len(data))
+        self.max_bits = max(self.max_bits, 8 * len(data))
+        self.n += 1
+
+    def extend(self, payloads):
+        """Aggiunta in blocco (stessa semantica di add ripetuto)."""
+        payloads = list(payloads)[-self.max_rows:]
+        m = len(payloads)
+        if not m:
+            return
+        i = self._reserve(m)
+        block = self.rows[i:i + m]
+        for j, data in enumerate(payloads):
+            data = bytes(data[:8])
+            block[j, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+            self.lengths[i + j] = 8 * len(data)
+        lens = self.lengths[i:i + m]
+        self.ones += np.unpackbits(block, axis=1).sum(axis=0, dtype=np.int64)
+        self.num_bits = min(self.num_bits, int(lens.min()))
+        self.max_bits = max(self.max_bits, int(lens.max()))
+        self.n += m
+
+    def bit_matrix(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """(m, 64) uint8 di bit delle righe [start, stop) della finestra."""
+        lo = self._lo
+        return np.unpackbits(self.rows[lo + start:lo + (self.n if stop is None else stop)], axis=1)
+
+    def row_lengths(self, start: int = 0, stop: Optional[int] = None) -> np.ndarray:
+        """Bit validi delle righe [start, stop) della finestra."""
+        lo = self._lo
+        return self.lengths[lo + start:lo + (self.n if stop is None else stop)]
 
-    def __init__(
-        self,
-        window_s: float = 30.0,          # finestra temporale
-        min_collisions: int = 6,        # N collisioni in window per trigger rate
-        mode_share_th: float = 0.75,    # >=60% collisioni sullo stesso bit
-        entropy_th: float = 2.0,        # entropia bassa => concentrato (0..~6 per 64 bit)
-        cooldown_s: float = 1.0         # evita spam alert
-    ):
-        self.window_s = window_s
-        self.min_collisions = min_collisions
-        self.mode_share_th = mode_share_th
-        self.entropy_th = entropy_th
-        self.cooldown_s = cooldown_s
-
-        # events[arb_id] = deque of (ts, bit_idx, offender_name)
-        self.events = defaultdict(deque)
-        self._last_alert_ts = {}  # per arb_id
-
-    def _prune(self, arb_id: int, now: float):
-        dq = self.events[arb_id]
-        cutoff = now - self.window_s
-        while dq and dq[0][0] < cutoff:
-            dq.popleft()
+    @property
+    def prob_1(self) -> np.ndarray:
+        """P(bit = 1) per posizione; 0.5 oltre num_bits (posizione non sempre presente)."""
+        p = np.full(self.NBITS, 0.5)
+        if self.n and self.num_bits:
+            p[:self.num_bits] = self.ones[:self.num_bits] / self.n
+        return p
+
+    @property
+    def prob_0(self) -> np.ndarray:
+        p = np.full(self.NBITS, 0.5)
+        if self.n and self.num_bits:
+            p[:self.num_bits] = (self.n - self.ones[:self.num_bits]) / self.n
+        return p
+
+    def record_attack(self, pos: int):
+        self.attack_counts[pos] += 1
+        self.penalty[pos] = (1.0 + self.attack_counts[pos]) ** 0.70
+
+    def top_k(self, candidate_mask: np.ndarray, k: int):
+        """Top-K posizioni candidate per score = prob_0 * weight / penalty (argpartition + sort dei soli K)."""
+        scores = np.where(candidate_mask, self.prob_0 * self.weights / self.penalty, -np.inf)
+        n_cand = int(np.count_nonzero(candidate_mask))
+        if n_cand == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+        k = max(1, min(int(k), n_cand))
+        kth = scores[np.argpartition(-scores, k - 1)[k - 1]]
+        # a parità di score vince la posizione più bassa (come un sort stabile sulle posizioni)
+        above = np.flatnonzero(scores > kth)
+        idx = np.concatenate([above, np.flatnonzero(scores == kth)[:k - len(above)]])
+        idx = idx[np.argsort(-scores[idx], kind="stable")]
+        return idx, scores[idx]
+
+
+class PayloadDynamics:
+    """
+    Modello in streaming della dinamica dei payload di un ID sulle ultime history_len frame.
+
+    A ogni frame aggiorna (e per il frame che esce dalla finestra, sottrae) l'istogramma dei
+    delta mod 256 di ogni byte e i conteggi dei delta candidati mod 65536 di ogni coppia di
+    byte big/little endian. Le classificazioni (byte costante / contatore, word rolling) e il
+    payload predetto sono ricalcolati in tempo costante e pronti da leggere all'attacco.
+    Stessa regola della versione a Counter: un delta vale se copre >= min_conf dei delta
+    della finestra ed è tra quelli "da contatore".
+    """
+    BYTE_DELTAS = (0, 1, 0xFF, 2, 3)
+    WORD_DELTAS = (1, 0, 0xFFFF, 2, 3)
+    _WORD_SLOT = {d: k for k, d in enumerate(WORD_DELTAS)}
+
+    def __init__(self, history_len: int = 32, min_conf: float = 0.85):
+        self.history_len = max(2, int(history_len))
+        self.min_conf = min_conf
+        self.history: Deque[bytes] = deque(maxlen=self.history_len)
+        self.byte_hist = [[0] * 256 for _ in range(8)]
+        self.word_hist = [[[0] * len(self.WORD_DELTAS) for _ in range(2)] for _ in range(7)]  # [i][be/le][slot]
+        self.n_deltas = 0
+
+        # detections correnti
+        self.byte_delta: List[Optional[int]] = [None] * 8  # delta ricorrente del byte, None se casuale
+        self.word = None  # (i, "be"|"le", conf, delta16) della word rolling migliore
+        self._prediction = bytes(8)
 
     @staticmethod
-    def _entropy(counts: Counter) -> float:
-        total = sum(counts.values())
-        if total <= 0:
-            return 0.0
-        H = 0.0
-        for c in counts.values():
-            p = c / total
-            H -= p * math.log(p + 1e-12, 2)
-        return H
-
-    def observe_collision(self, arb_id: int, bit_idx: int, offender_name: str, ts: float | None = None):
-        now = time.time() if ts is None else float(ts)
-        dq = self.events[arb_id]
-        dq.append((now, int(bit_idx), str(offender_name)))
-        self._prune(arb_id, now)
-
-    def check_alert(self, arb_id: int, ts: float | None = None):
-        now = time.time() if ts is None else float(ts)
-        self._prune(arb_id, now)
-        dq = self.events.get(arb_id)
-        if not dq:
-            return None
+    def _pad(data: bytes) -> bytes:
+        data = bytes(data[:8])
+        return data + bytes(8 - len(data)) if len(data) < 8 else data
 
-        # collision rate proxy: numero collisioni in finestra
-        n = len(dq)
-        if n < self.min_collisions:
-            return None
+    def _count(self, prev: bytes, cur: bytes, step: int):
+        for j in range(8):
+            self.byte_hist[j][(cur[j] - prev[j]) & 0xFF] += step
+        slot = self._WORD_SLOT
+        for i in range(7):
+            hist = self.word_hist[i]
+            k = slot.get((((cur[i] << 8) | cur[i + 1]) - ((prev[i] << 8) | prev[i + 1])) & 0xFFFF)
+            if k is not None:
+                hist[0][k] += step
+            k = slot.get((((cur[i + 1] << 8) | cur[i]) - ((prev[i + 1] << 8) | prev[i])) & 0xFFFF)
+            if k is not None:
+                hist[1][k] += step
+        self.n_deltas += step
+
+    def add(self, data: bytes):
+        cur = self._pad(data)
+        hist = self.history
+        if len(hist) == hist.maxlen:
+            self._count(hist[0], hist[1], -1)  # il delta più vecchio esce dalla finestra
+        if hist:
+            self._count(hist[-1], cur, +1)
+        hist.append(cur)
+        self._refresh()
+
+    def extend(self, payloads):
+        for data in payloads:
+            self.add(data)
+
+    def _refresh(self):
+        """Ricalcola detections e predizione: O(8 + 14 * 5), indipendente da history_len."""
+        last = self.history[-1]
+        n = self.n_deltas
+        if n < 1:
+            self.byte_delta = [None] * 8
+            self.word = None
+            self._prediction = last
+            return
 
-        # bit concentration
-        bits = [b for _, b, _ in dq]
-        bit_counts = Counter(bits)
-        mode_bit, mode_cnt = bit_counts.most_common(1)[0]
-        mode_share = mode_cnt / n
-        H = self._entropy(bit_counts)
+        best16 = None
+        for i in range(7):
+            for e, endian in enumerate(("be", "le")):
+                counts = self.word_hist[i][e]
+                f = max(counts)
+                conf = f / n
+                if conf >= self.min_conf and (best16 is None or conf > best16[2]):
+                    best16 = (i, endian, conf, self.WORD_DELTAS[counts.index(f)])
+        self.word = best16
 
-        # cooldown anti-spam
-        last = self._last_alert_ts.get(arb_id, 0.0)
-        if now - last < self.cooldown_s:
-            return None
+        for j in range(8):
+            counts = self.byte_hist[j]
+            self.byte_delta[j] = next((d for d in self.BYTE_DELTAS if counts[d] / n >= self.min_conf), None)
 
-        # decisione: forte se mode_share alto oppure entropia bassa
-        concentrated = (mode_share >= self.mode_share_th) or (H <= self.entropy_th)
-        if not concentrated:
-            return None
+        pred = bytearray(last)
+        blocked = ()
+        if best16 is not None:
+            i, endian, conf, delta16 = best16
+            blocked = (i, i + 1)
+            if endian == "be":
+                w_next = (((last[i] << 8) | last[i + 1]) + delta16) & 0xFFFF
+                pred[i], pred[i + 1] = (w_next >> 8) & 0xFF, w_next & 0xFF
+            else:
+                w_next = (((last[i + 1] << 8) | last[i]) + delta16) & 0xFFFF
+                pred[i], pred[i + 1] = w_next & 0xFF, (w_next >> 8) & 0xFF
+        for j in range(8):
+            if j not in blocked and self.byte_delta[j] is not None:
+                pred[j] = (last[j] + self.byte_delta[j]) & 0xFF
+        self._prediction = bytes(pred)
+
+    def byte_kind(self, j: int) -> str:
+        d = self.byte_delta[j]
+        return "random" if d is None else ("constant" if d == 0 else "counter")
+
+    def predict(self) -> Optional[bytes]:
+        """Prossimo payload previsto (None se non ho ancora visto frame)."""
+        return self._prediction if self.history else None
+
+
+def _matching_bits(predicted: bytes, actual: bytes) -> int:
+    """Bit uguali tra un payload previsto e quello osservato (8 byte, padding a zero)."""
+    diff = int.from_bytes(predicted[:8].ljust(8, b"\x00"), "big") ^ int.from_bytes(actual[:8].ljust(8, b"\x00"), "big")
+    return 64 - bin(diff).count("1")
+
+
+class LearnedPayloadPredictor:
+    """
+    Predittore appreso del prossimo payload: MultiOutputClassifier(RandomForest), input i bit
+    delle ultime `window` frame (64 * window), output i 64 bit della successiva.
+
+    Il training gira in un thread di background ogni retrain_every nuovi frame: warm start,
+    ogni RandomForest per-bit aggiunge grow_estimators alberi sui dati aggiornati (da zero
+    quando un bit cambia classi o si arriva a max_estimators). Lo stesso worker precalcola la
+    predizione per il prossimo frame: predict() legge solo la cache e non aspetta mai.
+    L'accuratezza si misura in modo prequenziale (predict() prima di add() dello stesso frame)
+    o, senza worker, con evaluate_holdout() su un modello che non ha visto i frame valutati.
+    """
+
+    def __init__(self, window: int = 4, retrain_every: int = 8, min_samples: int = 16,
+                 max_history: int = 2000, n_estimators: int = 10, grow_estimators: int = 5,
+                 max_estimators: int = 60, max_depth: int = 8, random_state: int = 0):
+        self.window = window
+        self.retrain_every = retrain_every
+        self.min_samples = max(min_samples, window + 2)
+        self.n_estimators = n_estimators
+        self.grow_estimators = grow_estimators
+        self.max_estimators = max_estimators
+        self.max_depth = max_depth
+        self.random_state = random_state
+
+        self._samples: Deque[bytes] = deque(maxlen=max_history)
+        self._added = 0          # frame totali ricevuti (anche oltre max_history)
+        self._lock = threading.Lock()  # solo per _samples/_added, mai preso da predict()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stop = False
+
+        self._model = None       # MultiOutputClassifier pubblicato (sostituito, mai modificato dopo)
+        self._trained_at = 0     # _added al momento dell'ultimo training
+        self._cached = (-1, None)  # (_added per cui vale, payload predetto)
+        self.version = 0
+
+    def reset(self):
+        with self._lock:
+            self._samples.clear()
+            self._added = 0
+        self._model = None
+        self._trained_at = 0
+        self._cached = (-1, None)
+
+    def add(self, data: bytes):
+        data = bytes(data[:8])
+        data = data + bytes(8 - len(data)) if len(data) < 8 else data
+        with self._lock:
+            self._samples.append(data)
+            self._added += 1
+        self._wakeup.set()
+
+    def extend(self, payloads):
+        for data in payloads:
+            self.add(data)
+
+    @property
+    def ready(self) -> bool:
+        return self._model is not None
+
+    def predict(self) -> Optional[bytes]:
+        """Payload previsto per il prossimo frame, se il worker l'ha già calcolato."""
+        added, payload = self._cached
+        return payload if added == self._added else None
+
+    # --- training ---
+    def _dataset(self, samples):
+        bits = np.unpackbits(np.frombuffer(b"".join(samples), dtype=np.uint8).reshape(-1, 8), axis=1)
+        w = self.window
+        X = np.concatenate([bits[k:len(bits) - w + k] for k in range(w)], axis=1)
+        y = bits[w:]
+        return X, y
+
+    def _features(self, tail) -> np.ndarray:
+        return np.unpackbits(np.frombuffer(b"".join(tail), dtype=np.uint8)).reshape(1, -1)
+
+    def _new_forest(self) -> RandomForestClassifier:
+        return RandomForestClassifier(n_estimators=self.n_estimators, max_depth=self.max_depth,
+                                      warm_start=True, random_state=self.random_state)
+
+    def fit_now(self) -> bool:
+        """Training sincrono sui campioni correnti (il worker usa lo stesso metodo)."""
+        with self._lock:
+            samples = list(self._samples)
+            added = self._added
+        if len(samples) < self.min_samples:
+            return False
+        X, y = self._dataset(samples)
+
+        model = self._model
+        if model is not None and model.estimators_[0].n_estimators + self.grow_estimators <= self.max_estimators:
+            # warm start: per ogni bit la stessa RandomForest aggiunge alberi (su una copia, il
+            # modello pubblicato resta valido per predict() finché non viene sostituito)
+            model = copy.deepcopy(model)
+            for k, est in enumerate(model.estimators_):
+                if not np.array_equal(np.unique(y[:, k]), est.classes_):
+                    est = model.estimators_[k] = self._new_forest()
+                else:
+                    est.n_estimators += self.grow_estimators
+                est.fit(X, y[:, k])
+        else:
+            model = MultiOutputClassifier(self._new_forest())
+            model.fit(X, y)
+
+        self._model = model
+        self._trained_at = added
+        self.version += 1
+        self._refresh_prediction()
+        return True
+
+    def _refresh_prediction(self):
+        model = self._model
+        with self._lock:
+            added = self._added
+            tail = list(self._samples)[-self.window:]
+        if model is None or len(tail) < self.window:
+            return
+        bits = model.predict(self._features(tail))[0].astype(np.uint8)
+        self._cached = (added, np.packbits(bits).tobytes())
+
+    def evaluate_holdout(self, history, messages) -> Tuple[int, int]:
+        """(bit corretti, bit totali) di un modello addestrato solo su history, predicendo ogni
+        messaggio dalle `window` frame precedenti. Il modello pubblicato non cambia."""
+        history = [bytes(p[:8]).ljust(8, b"\x00") for p in history]
+        seq = history[-self.window:] + [bytes(p[:8]).ljust(8, b"\x00") for p in messages]
+        if len(history) < self.min_samples or len(seq) <= self.window:
+            return 0, 0
+        X, y = self._dataset(history)
+        model = MultiOutputClassifier(self._new_forest())
+        model.fit(X, y)
+        X, y = self._dataset(seq)
+        pred = model.predict(X).astype(np.uint8)
+        return int((pred == y).sum()), int(y.size)
+
+    def start(self):
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="payload-predictor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=2.0)
+            self._thread = None
 
-        # (opzionale) offender più frequente nella finestra
-        offenders = [o for _, _, o in dq]
-        off_counts = Counter(offenders)
-        top_off, top_off_cnt = off_counts.most_common(1)[0]
-        top_off_share = top_off_cnt / n
-
-        self._last_alert_ts[arb_id] = now
-        return {
-            "arb_id": arb_id,
-            "window_s": self.window_s,
-            "collisions": n,
-            "mode_bit": mode_bit,
-            "mode_share": mode_share,
-            "entropy": H,
-            "top_offender": top_off,
-            "top_offender_share": top_off_share,
-        }
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    def _run(self):
+        while not self._stop:
+            self._wakeup.wait(0.5)
+            self._wakeup.clear()
+            if self._stop:
+                break
+            try:
+                if self._added - self._trained_at >= self.retrain_every or (self._model is None and self._added >= self.min_samples):
+                    self.fit_now()
+                elif self._cached[0] != self._added:
+                    self._refresh_prediction()
+            except Exception as e:
+                TRACE.emit(TraceLevel.ERROR, "[ATTACKER] Payload predictor training failed: %s", e)
+
+
+class AttackPayloadQueue:
+    """
+    Payload d'attacco già pronti per i prossimi `depth` cicli della vittima.
+
+    Un thread produttore costruisce le voci (indice frame vittima, payload previsto, payload
+    d'attacco, bit scelto): la prima dalla predizione corrente, le successive concatenando la
+    predizione su una copia di PayloadDynamics. A ogni frame della vittima la voce di quel
+    ciclo esce se la predizione era giusta, altrimenti la coda viene invalidata e ricostruita.
+    take() nel loop d'attacco legge solo la testa della coda; un ciclo attaccato il cui frame
+    non arriva allo sniffer (distrutto dall'error flag, la vittima non lo ritrasmette) è
+    consumato alla take() successiva.
+    Il lock protegge anche payload_model e bit_model dell'attaccante.
+    """
+
+    def __init__(self, attacker: "WeepingAttacker", depth: int = 3):
+        self.attacker = attacker
+        self.depth = max(1, int(depth))
+        self.lock = threading.Lock()  # preso anche da chi aggiorna payload_model / bit_model
+        self._entries: Deque[tuple] = deque()
+        self._seen = 0           # indice del prossimo ciclo della vittima
+        self._taken = -1         # ultimo indice già usato per un attacco
+        self._lost = 0           # cicli consumati senza frame dall'ultimo frame osservato
+        self._chain = None       # PayloadDynamics dopo l'ultima voce in coda
+        self._next = 0           # indice della prossima voce da costruire
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._stop = False
+
+        self.hits = 0            # attacchi serviti dalla coda
+        self.misses = 0          # attacchi senza voce pronta (payload calcolato nel loop)
+        self.invalidations = 0
+
+    def _invalidate(self):
+        self._entries.clear()
+        self._chain = None
+
+    def _drop_stale(self):
+        while self._entries and self._entries[0][0] < self._seen:
+            self._entries.popleft()
+
+    def observe(self, data: bytes):
+        """Nuovo frame della vittima; chiamare con self.lock preso, dopo aver aggiornato payload_model."""
+        data = PayloadDynamics._pad(data)
+        self._drop_stale()
+        if self._entries:
+            if self._entries[0][1] == data:
+                self._entries.popleft()
+            else:
+                self.invalidations += 1
+                self._invalidate()
+        self._seen += 1
+        self._lost = 0
+        self._wakeup.set()
+
+    def take(self) -> Optional[Tuple[bytes, int]]:
+        """(payload, bit scelto) per il prossimo ciclo della vittima, None se non è pronto.
+        Il ciclo conta come attaccato anche se la voce non c'è (payload calcolato dal chiamante)."""
+        with self.lock:
+            if self._taken == self._seen:
+                # l'ultimo ciclo attaccato non è mai stato osservato: frame distrutto
+                self._seen += 1
+                self._lost += 1
+                self._drop_stale()
+                if not self._entries:
+                    self._chain = None
+                self._wakeup.set()
+            self._taken = self._seen
+            head = self._entries[0] if self._entries else None
+            if head is None or head[0] != self._seen:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return head[2], head[3]
+
+    def _fill(self):
+        attacker = self.attacker
+        while not self._stop:
+            with self.lock:
+                # il modello appreso predice il frame dopo l'ultimo osservato, non dopo un ciclo perso
+                learned = (attacker.learned_predictor.predict()
+                           if attacker.use_learned_predictor and not self._lost else None)
+                if (learned is not None and self._entries and self._entries[0][0] == self._seen
+                        and self._entries[0][1] != learned):
+                    # il modello appreso ha aggiornato la predizione del prossimo ciclo
+                    self._invalidate()
+                if len(self._entries) >= self.depth:
+                    return
+                if self._chain is None:
+                    self._chain = copy.deepcopy(attacker.payload_model)
+                    for _ in range(self._lost):
+                        lost = self._chain.predict()
+                        if lost is not None:
+                            self._chain.add(lost)
+                    self._next = self._seen
+                    predicted = learned if learned is not None else self._chain.predict()
+                else:
+                    predicted = self._chain.predict()
+                payload, pos = attacker._attack_bits_for(predicted)
+                self._entries.append((self._next, predicted, payload, pos))
+                self._next += 1
+                if predicted is not None:
+                    self._chain.add(predicted)
+
+    def start(self):
+        self._stop = False
+        self._thread = threading.Thread(target=self._run, name="attack-payloads", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop = True
+        self._wakeup.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+
+    def _run(self):
+        while not self._stop:
+            try:
+                self._fill()
+            except Exception as e:
+                TRACE.emit(TraceLevel.ERROR, "[ATTACKER] Attack payload producer failed: %s", e)
+            # timeout: raccoglie anche le predizioni del modello appreso calcolate nel frattempo
+            self._wakeup.wait(0.05)
+            self._wakeup.clear()
 
 
 # --- Weeping Attacker ---
@@ -792,14 +1489,28 @@ class WeepingAttacker:
         self.victim_id = None
         self.victim_ecu = None
         self.victim_messages = []
-        self.victim_bit_probabilities = []
+        # modelli bit-level per ID, aggiornati durante lo sniffing; bit_model = quello della vittima
+        self.bit_models = {}
+        self.bit_model: Optional[BitMatrixModel] = None
+        # dinamica dei payload della vittima (contatori / costanti / word rolling) per la predizione
+        self.payload_history_len = 32
+        self.payload_model = PayloadDynamics(self.payload_history_len)
+        # predittore appreso (RF in background); usato al posto dell'euristica se più accurato
+        self.learned_predictor = LearnedPayloadPredictor()
+        self.use_learned_predictor = False
+        # accuratezza prequenziale in fase 2 (predizione fatta prima di vedere il frame):
+        # bit corretti / totali dell'euristica su tutti i frame, e [appreso, euristica, totali]
+        # sui frame per cui anche il predittore appreso aveva già una predizione
+        self._heuristic_hits = [0, 0]
+        self._paired_hits = [0, 0, 0]
         self.avg_interval = None
         self.last_victim_time = None
         self.next_attack_time = None
 
         # --- Anti flood / anti self-collision ---
-        self._last_attacked_cycle_ts = None
-        self._pending_cycle_ts = None
+        # cicli vittima = PendingSignal.seq della vittima (un attacco armato per ciclo)
+        self._last_attacked_cycle = None
+        self._pending_cycle = None
 
         # Attack params
         # R0 non deve essere la leva dell'attacco (per WeepingCAN lavoriamo nel DATA field),
@@ -818,7 +1529,9 @@ class WeepingAttacker:
         self.attack_eps_explore = 0.20    # 20% esplorazione uniforme sui top-K
         self.attack_softmax_temp = 0.60   # temperatura softmax (più bassa = più greedy)
 
-        self._bit_attack_counts = [0] * 64  # anti-sticking: penalizza bit già usati spesso
+        # payload d'attacco precalcolati per i prossimi cicli della vittima
+        self.attack_queue = AttackPayloadQueue(self, depth=3)
+
 
         self._thread = None
         self._vcan_listener_thread = None
@@ -829,9 +1542,9 @@ class WeepingAttacker:
         if self.master.use_vcan:
             try:
                 self.sniff_bus = can.interface.Bus(channel='vcan0', interface='socketcan')
-                print("[ATTACKER] Connected dedicated sniff socket to vcan0")
+                TRACE.emit(TraceLevel.STATE, "[ATTACKER] Connected dedicated sniff socket to vcan0")
             except Exception as e:
-                print(f"[ATTACKER] Error connecting dedicated sniff socket to vcan0: {e}")
+                TRACE.emit(TraceLevel.STATE, "[ATTACKER] Error connecting dedicated sniff socket to vcan0: %s", e)
                 self.sniff_bus = None
 
         self.master.register_ecu(self)
@@ -844,9 +1557,13 @@ class WeepingAttacker:
         self._vcan_listener_thread = threading.Thread(target=self._vcan_listener, daemon=True)
         self._vcan_listener_thread.start()
 
+        self.learned_predictor.start()
+
     def stop(self):
         self.running = False
         self._stop = True
+        self.attack_queue.stop()
+        self.learned_predictor.stop()
         try:
             if self.sniff_bus is not None:
                 self.sniff_bus.shutdown()
@@ -859,11 +1576,11 @@ class WeepingAttacker:
     def _update_state(self):
         if self.tec >= 256:
             self.state = NodeState.BUS_OFF
-            print(f"[ATTACKER] *** ENTERED BUS-OFF STATE *** (TEC={self.tec})")
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] *** ENTERED BUS-OFF STATE *** (TEC=%s)", self.tec)
         elif self.tec >= 128:
             if self.state != NodeState.ERROR_PASSIVE:
                 self.state = NodeState.ERROR_PASSIVE
-                print(f"[ATTACKER] Entered ERROR-PASSIVE state (TEC={self.tec})")
+                TRACE.emit(TraceLevel.STATE, "[ATTACKER] Entered ERROR-PASSIVE state (TEC=%s)", self.tec)
         else:
             self.state = NodeState.ERROR_ACTIVE
 
@@ -881,121 +1598,151 @@ class WeepingAttacker:
         if not self.master.use_vcan or self.sniff_bus is None:
             return
 
-        print("[ATTACKER] Started vcan0 listener")
+        TRACE.emit(TraceLevel.STATE, "[ATTACKER] Started vcan0 listener")
 
         while not self._stop:
             try:
                 msg = self.sniff_bus.recv(timeout=1.0)
+                if msg:
+                    self.on_sniffed_frame(msg.arbitration_id, bytes(msg.data), time.time())
+            except Exception:
+                pass
 
-                # Live victim timing update (se arrivano frame reali su vcan0)
-                if msg and self.victim_id is not None and msg.arbitration_id == self.victim_id:
-                    self.last_victim_time = time.time()
-
-                if msg and self.attack_state == "sniffing_1":
-                    frame_data = bytes(msg.data)
-                    frame_bits = bytes_to_bits(frame_data)
-
-                    ts = time.time()
-                    self.sniffed_data_1[msg.arbitration_id].append({
-                        'data': frame_data,
-                        'bits': frame_bits,
-                        'timestamp': ts
-                    })
+    def on_sniffed_frame(self, arb_id: int, frame_data: bytes, ts: float):
+        """Pipeline di sniffing: usata dal listener vcan0 (ts = wall-clock) e dal replay (ts registrato)."""
+        # Live victim timing update (se arrivano frame reali su vcan0)
+        if self.victim_id is not None and arb_id == self.victim_id:
+            self.last_victim_time = ts
+
+        if self.attack_state == "sniffing_1":
+            self.sniffed_data_1[arb_id].append({
+                'data': frame_data,
+                'bits': bytes_to_bits(frame_data),
+                'timestamp': ts
+            })
 
-                    self.seen_ids.add(msg.arbitration_id)
+            model = self.bit_models.get(arb_id)
+            if model is None:
+                model = self.bit_models[arb_id] = BitMatrixModel()
+            model.add(frame_data)
 
-                    if self.min_sniffed_id is None or msg.arbitration_id < self.min_sniffed_id:
-                        self.min_sniffed_id = msg.arbitration_id
+            self.seen_ids.add(arb_id)
 
-                    data_hex = ' '.join([f'{b:02X}' for b in frame_data])
-                    print(f"[ATTACKER SNIFF-1] ID=0x{msg.arbitration_id:03X} Data=[{data_hex}]")
+            if self.min_sniffed_id is None or arb_id < self.min_sniffed_id:
+                self.min_sniffed_id = arb_id
 
-                elif msg and self.attack_state == "sniffing_2" and msg.arbitration_id == self.victim_id:
-                    frame_data = bytes(msg.data)
-                    frame_bits = bytes_to_bits(frame_data)
+            if TRACE.frame:
+                data_hex = ' '.join([f'{b:02X}' for b in frame_data])
+                TRACE.emit(TraceLevel.FRAME, "[ATTACKER SNIFF-1] ID=0x%03X Data=[%s]", arb_id, data_hex)
 
-                    self.sniffed_data_2[msg.arbitration_id].append({
-                        'data': frame_data,
-                        'bits': frame_bits,
-                        'timestamp': time.time()
-                    })
+        elif self.attack_state == "sniffing_2" and arb_id == self.victim_id:
+            self.sniffed_data_2[arb_id].append({
+                'data': frame_data,
+                'bits': bytes_to_bits(frame_data),
+                'timestamp': ts
+            })
 
-                    data_hex = ' '.join([f'{b:02X}' for b in frame_data])
-                    print(f"[ATTACKER SNIFF-2] ID=0x{msg.arbitration_id:03X} Data=[{data_hex}]")
-
-            except Exception:
-                pass
+            # accuratezza prequenziale: entrambi i predittori prima di vedere questo frame
+            predicted = self.payload_model.predict()
+            learned = self.learned_predictor.predict()
+            if predicted is not None:
+                heur_ok = _matching_bits(predicted, frame_data)
+                self._heuristic_hits[0] += heur_ok
+                self._heuristic_hits[1] += 64
+                if learned is not None:
+                    self._paired_hits[0] += _matching_bits(learned, frame_data)
+                    self._paired_hits[1] += heur_ok
+                    self._paired_hits[2] += 64
+            self.payload_model.add(frame_data)
+            self.learned_predictor.add(frame_data)
+
+            if TRACE.frame:
+                data_hex = ' '.join([f'{b:02X}' for b in frame_data])
+                TRACE.emit(TraceLevel.FRAME, "[ATTACKER SNIFF-2] ID=0x%03X Data=[%s]", arb_id, data_hex)
+
+        elif self.attack_state == "attacking" and arb_id == self.victim_id and self.bit_model is not None:
+            # frame della vittima arrivati a buon fine durante l'attacco: i modelli continuano a imparare
+            with self.attack_queue.lock:
+                self.bit_model.add(frame_data)
+                self.payload_model.add(frame_data)
+                self.attack_queue.observe(frame_data)
+            self.learned_predictor.add(frame_data)
 
     def _run(self):
         # Phase 1: Sniffing (Training)
-        print(f"\n{'='*100}")
-        print(f"[ATTACKER] PHASE 1: SNIFFING (Training) for {self.sniff_duration_1} seconds...")
-        print(f"{'='*100}\n")
+        TRACE.emit(TraceLevel.STATE, "\n%s", '='*100)
+        TRACE.emit(TraceLevel.STATE, "[ATTACKER] PHASE 1: SNIFFING (Training) for %s seconds...", self.sniff_duration_1)
+        TRACE.emit(TraceLevel.STATE, "%s\n", '='*100)
 
         sniff_start = time.time()
         while time.time() - sniff_start < self.sniff_duration_1:
             time.sleep(5)
             if len(self.sniffed_data_1) > 0:
                 total_msgs = sum(len(msgs) for msgs in self.sniffed_data_1.values())
-                print(f"[ATTACKER] Sniffed {total_msgs} messages from {len(self.sniffed_data_1)} different IDs")
+                TRACE.emit(TraceLevel.STATE, "[ATTACKER] Sniffed %s messages from %s different IDs", total_msgs, len(self.sniffed_data_1))
 
         # Phase 2: Analysis
-        print(f"\n{'='*100}")
-        print(f"[ATTACKER] PHASE 2: ANALYZING sniffed data...")
-        print(f"{'='*100}\n")
-
-        self.attack_state = "analyzing"
-        self._select_victim()
-
-        if self.victim_id is None:
-            print("[ATTACKER] No suitable victim found. Aborting.")
-            self.running = False
-            return
-
-        if len(self.victim_messages) < 2:
-            print(f"[ATTACKER] Not enough messages from victim (found {len(self.victim_messages)}). Aborting.")
-            self.running = False
-            return
+        TRACE.emit(TraceLevel.STATE, "\n%s", '='*100)
+        TRACE.emit(TraceLevel.STATE, "[ATTACKER] PHASE 2: ANALYZING sniffed data...")
+        TRACE.emit(TraceLevel.STATE, "%s\n", '='*100)
 
-        self._analyze_victim_bits()
-
-        if not self.victim_bit_probabilities:
-            print("[ATTACKER] Analysis failed. Aborting.")
+        if not self._analysis_phase():
             self.running = False
             return
 
         # Phase 3: Sniffing 2 (Reinforcement)
-        print(f"\n{'='*100}")
-        print(f"[ATTACKER] PHASE 3: SNIFFING (Reinforcement) for {self.sniff_duration_2} seconds...")
-        print(f"{'='*100}\n")
+        TRACE.emit(TraceLevel.STATE, "\n%s", '='*100)
+        TRACE.emit(TraceLevel.STATE, "[ATTACKER] PHASE 3: SNIFFING (Reinforcement) for %s seconds...", self.sniff_duration_2)
+        TRACE.emit(TraceLevel.STATE, "%s\n", '='*100)
 
         self.attack_state = "sniffing_2"
         sniff_start_2 = time.time()
         while time.time() - sniff_start_2 < self.sniff_duration_2:
             time.sleep(2)
             if self.victim_id in self.sniffed_data_2:
-                print(f"[ATTACKER] Collected {len(self.sniffed_data_2[self.victim_id])} reinforcement messages")
+                TRACE.emit(TraceLevel.STATE, "[ATTACKER] Collected %s reinforcement messages", len(self.sniffed_data_2[self.victim_id]))
 
         # Phase 4: Reinforcement Learning
-        print(f"\n{'='*100}")
-        print(f"[ATTACKER] PHASE 4: REINFORCEMENT LEARNING...")
-        print(f"{'='*100}\n")
+        TRACE.emit(TraceLevel.STATE, "\n%s", '='*100)
+        TRACE.emit(TraceLevel.STATE, "[ATTACKER] PHASE 4: REINFORCEMENT LEARNING...")
+        TRACE.emit(TraceLevel.STATE, "%s\n", '='*100)
 
         self.attack_state = "reinforcement"
         self._reinforcement_learning()
 
         # Phase 5: Attack
-        print(f"\n{'='*100}")
-        print(f"[ATTACKER]  ATTACCO INIZIATO! ")
-        print(f"[ATTACKER] Target: ID=0x{self.victim_id:03X}")
+        TRACE.emit(TraceLevel.STATE, "\n%s", '='*100)
+        TRACE.emit(TraceLevel.STATE, "[ATTACKER]  ATTACCO INIZIATO! ")
+        TRACE.emit(TraceLevel.STATE, "[ATTACKER] Target: ID=0x%03X", self.victim_id)
         if self.avg_interval is not None:
-            print(f"[ATTACKER] Average interval: {self.avg_interval:.3f}s")
-        print(f"[ATTACKER] Strategy: send SAME ID + R0=0 (dominant) to force bit-monitoring error on R0")
-        print(f"{'='*100}\n")
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] Average interval: %.3fs", self.avg_interval)
+        TRACE.emit(TraceLevel.STATE, "[ATTACKER] Strategy: send SAME ID + R0=0 (dominant) to force bit-monitoring error on R0")
+        TRACE.emit(TraceLevel.STATE, "%s\n", '='*100)
 
         self.attack_state = "attacking"
+        self.attack_queue.start()
         self._attack_loop()
 
+    def _analysis_phase(self) -> bool:
+        """Phase 2: victim selection + bit analysis. False if the attack must be aborted."""
+        self.attack_state = "analyzing"
+        self._select_victim()
+
+        if self.victim_id is None:
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] No suitable victim found. Aborting.")
+            return False
+
+        if len(self.victim_messages) < 2:
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] Not enough messages from victim (found %s). Aborting.", len(self.victim_messages))
+            return False
+
+        self._analyze_victim_bits()
+
+        if self.bit_model is None or not self.bit_model.num_bits:
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] Analysis failed. Aborting.")
+            return False
+        return True
+
     def _estimate_interval(self, timestamps):
         """Stima robusta dell'intervallo di trasmissione usando mediana + filtro outlier."""
         if not timestamps or len(timestamps) < 2:
@@ -1015,7 +1762,7 @@ class WeepingAttacker:
     def _select_victim(self):
         """Seleziona la vittima (ID che trasmette più frequentemente)."""
         if not self.sniffed_data_1:
-            print("[ATTACKER] No data sniffed during phase 1")
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] No data sniffed during phase 1")
             return
 
         self.victim_id = max(self.sniffed_data_1, key=lambda k: len(self.sniffed_data_1[k]))
@@ -1028,14 +1775,14 @@ class WeepingAttacker:
                 self.victim_ecu = ecu
                 break
 
-        print(f"[ATTACKER] Selected victim: ID=0x{self.victim_id:03X}")
-        print(f"[ATTACKER] Total messages: {len(self.victim_messages)}")
+        TRACE.emit(TraceLevel.STATE, "[ATTACKER] Selected victim: ID=0x%03X", self.victim_id)
+        TRACE.emit(TraceLevel.STATE, "[ATTACKER] Total messages: %s", len(self.victim_messages))
 
         # FIX timing: se abbiamo il riferimento della ECU nel simulatore, usiamo direttamente il suo tx_period
         if self.victim_ecu is not None:
             self.avg_interval = float(self.victim_ecu.tx_period)
             self.next_attack_time = float(getattr(self.victim_ecu, "next_tx_time", time.time() + self.avg_interval))
-            print(f"[ATTACKER] Using VICTIM tx_period (ground truth): {self.avg_interval:.3f}s")
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] Using VICTIM tx_period (ground truth): %.3fs", self.avg_interval)
             return
 
         # fallback: stima da vcan sniffing
@@ -1046,137 +1793,144 @@ class WeepingAttacker:
             self.next_attack_time = (self.last_victim_time + self.avg_interval) if (self.last_victim_time is not None and self.avg_interval is not None) else None
 
             if self.avg_interval is not None:
-                print(f"[ATTACKER] Average transmission interval: {self.avg_interval:.3f}s (robust)")
+                TRACE.emit(TraceLevel.STATE, "[ATTACKER] Average transmission interval: %.3fs (robust)", self.avg_interval)
             else:
-                print("[ATTACKER] Could not estimate interval")
+                TRACE.emit(TraceLevel.STATE, "[ATTACKER] Could not estimate interval")
         else:
-            print(f"[ATTACKER] Only {len(self.victim_messages)} message(s) found for victim")
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] Only %s message(s) found for victim", len(self.victim_messages))
             self.victim_id = None
 
     def _analyze_victim_bits(self):
         """Analizza i bit dei messaggi della vittima e calcola le probabilità."""
         if not self.victim_messages:
-            print("[ATTACKER] No victim messages to analyze")
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] No victim messages to analyze")
             return
 
-        print(f"\n[ATTACKER] Analyzing bit patterns of victim {hex(self.victim_id)}...")
-
-        all_bits = [msg['bits'] for msg in self.victim_messages]
+        TRACE.emit(TraceLevel.STATE, "\n[ATTACKER] Analyzing bit patterns of victim %s...", hex(self.victim_id))
 
-        if not all(len(bits) == len(all_bits[0]) for bits in all_bits):
-            print("[ATTACKER] ⚠️ Messages have different lengths, using minimum length")
-            min_len = min(len(bits) for bits in all_bits)
-            all_bits = [bits[:min_len] for bits in all_bits]
+        # il modello è già aggiornato frame per frame durante lo sniffing
+        model = self.bit_models.get(self.victim_id)
+        if model is None:
+            model = BitMatrixModel()
+            model.extend([msg['data'] for msg in self.victim_messages])
+        self.bit_model = model
+        self.payload_model = PayloadDynamics(self.payload_history_len)
+        self.payload_model.extend(msg['data'] for msg in self.victim_messages[-self.payload_history_len:])
+        self.learned_predictor.reset()
+        self.learned_predictor.extend(msg['data'] for msg in self.victim_messages)
 
-        num_bits = len(all_bits[0])
+        if model.num_bits != model.max_bits:
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] ⚠️ Messages have different lengths, using minimum length")
 
-        self.victim_bit_probabilities = []
-        for bit_pos in range(num_bits):
-            bit_values = [bits[bit_pos] for bits in all_bits]
-            prob_zero = sum(1 for b in bit_values if b == 0) / len(bit_values)
-            prob_one = 1 - prob_zero
-            self.victim_bit_probabilities.append({
-                'position': bit_pos,
-                'prob_0': prob_zero,
-                'prob_1': prob_one
-            })
+        num_bits = model.num_bits
+        if not num_bits:
+            return
 
-        print(f"\n[ATTACKER] Bit probability analysis (top 10 most predictable):")
-        print(f"{'='*80}")
+        TRACE.emit(TraceLevel.STATE, "\n[ATTACKER] Bit probability analysis (top 10 most predictable):")
+        TRACE.emit(TraceLevel.STATE, "%s", '='*80)
 
-        sorted_probs = sorted(
-            self.victim_bit_probabilities,
-            key=lambda x: max(x['prob_0'], x['prob_1']),
-            reverse=True
-        )
+        p0 = model.prob_0[:num_bits]
+        p1 = model.prob_1[:num_bits]
+        top = np.argsort(-np.maximum(p0, p1), kind="stable")[:10]
 
-        for prob in sorted_probs[:10]:
-            byte_idx = prob['position'] // 8
-            bit_idx = 7 - (prob['position'] % 8)
+        for pos in top:
+            pos = int(pos)
+            byte_idx = pos // 8
+            bit_idx = 7 - (pos % 8)
 
-            if prob['prob_0'] > prob['prob_1']:
-                print(f"  Bit {prob['position']:2d} (Byte {byte_idx}, Bit {bit_idx}): "
-                      f"{prob['prob_0']*100:.1f}% sempre 0 (DOMINANT)")
+            if p0[pos] > p1[pos]:
+                TRACE.emit(TraceLevel.STATE, "  Bit %2d (Byte %s, Bit %s): %.1f%% sempre 0 (DOMINANT)", pos, byte_idx, bit_idx, p0[pos]*100)
             else:
-                print(f"  Bit {prob['position']:2d} (Byte {byte_idx}, Bit {bit_idx}): "
-                      f"{prob['prob_1']*100:.1f}% sempre 1 (RECESSIVE)")
+                TRACE.emit(TraceLevel.STATE, "  Bit %2d (Byte %s, Bit %s): %.1f%% sempre 1 (RECESSIVE)", pos, byte_idx, bit_idx, p1[pos]*100)
 
-        print(f"{'='*80}\n")
+        TRACE.emit(TraceLevel.STATE, "%s\n", '='*80)
 
     def _reinforcement_learning(self):
         """Reinforcement learning: verifica predizioni e aggiusta probabilità."""
         if self.victim_id not in self.sniffed_data_2 or len(self.sniffed_data_2[self.victim_id]) == 0:
-            print("[ATTACKER]  No reinforcement data collected. Skipping reinforcement.")
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER]  No reinforcement data collected. Skipping reinforcement.")
             return
 
         reinforcement_messages = self.sniffed_data_2[self.victim_id]
 
-        print(f"[ATTACKER] Verifying predictions on {len(reinforcement_messages)} messages...")
+        TRACE.emit(TraceLevel.STATE, "[ATTACKER] Verifying predictions on %s messages...", len(reinforcement_messages))
+
+        model = self.bit_model
+        history = [msg['data'] for msg in self.victim_messages]
+        phase2 = [msg['data'] for msg in reinforcement_messages]
 
-        correct_predictions = 0
-        total_bits = 0
+        # predizione dal modello di fase 1 (prima di aver visto questi frame)
+        num_bits = model.num_bits if model.n else 0
+        predicted = (model.prob_1 >= 0.5).astype(np.uint8)  # 0 solo se prob_0 > prob_1
 
-        for msg in reinforcement_messages:
-            bits = msg['bits']
-            for prob in self.victim_bit_probabilities:
-                pos = prob['position']
-                if pos < len(bits):
-                    predicted = 0 if prob['prob_0'] > prob['prob_1'] else 1
-                    actual = bits[pos]
-                    if predicted == actual:
-                        correct_predictions += 1
-                    total_bits += 1
+        checked = BitMatrixModel(capacity=len(phase2), max_rows=len(phase2))
+        checked.extend(phase2)
+        actual = checked.bit_matrix()
+        valid = np.arange(BitMatrixModel.NBITS)[None, :] < np.minimum(checked.row_lengths(), num_bits)[:, None]
+        total_bits = int(valid.sum())
+        correct_predictions = int(((actual == predicted[None, :]) & valid).sum())
+        model.extend(phase2)  # da qui il modello include anche la fase 2
 
         if total_bits > 0:
             accuracy = correct_predictions / total_bits * 100
-            print(f"[ATTACKER] Prediction accuracy: {accuracy:.2f}%")
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] Prediction accuracy: %.2f%%", accuracy)
+        else:
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] No bits to verify.")
+
+        # Predittori sequenziali sugli stessi messaggi: euristica (delta) vs RandomForest, entrambi
+        # valutati solo su frame non ancora visti. Con il worker attivo: punteggio prequenziale
+        # sui frame di fase 2 per cui entrambi avevano una predizione; senza worker (replay):
+        # modello addestrato sulla sola fase 1 contro l'euristica su tutta la fase 2.
+        heur_ok, heur_tot = self._heuristic_hits
+        if heur_tot:
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] Sequential (delta) predictor accuracy: %.2f%%", heur_ok / heur_tot * 100)
+        learn_ok, paired_heur_ok, learn_tot = self._paired_hits
+        if learn_tot:
+            scope = f"prequential, {learn_tot // 64} frames"
+            baseline = paired_heur_ok / learn_tot
         else:
-            print("[ATTACKER] No bits to verify.")
+            learn_ok, learn_tot = self.learned_predictor.evaluate_holdout(history, phase2)
+            scope = "trained on phase 1 only"
+            baseline = heur_ok / heur_tot if heur_tot else 0.0
+        if learn_tot:
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] Learned (RandomForest) predictor accuracy: %.2f%% (%s)", learn_ok / learn_tot * 100, scope)
+            self.use_learned_predictor = learn_ok / learn_tot > baseline
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] Attack payloads from %s predictor", 'learned' if self.use_learned_predictor else 'sequential')
+        else:
+            TRACE.emit(TraceLevel.STATE, "[ATTACKER] Learned predictor not trained yet")
 
     def _wait_for_victim_transmission(self) -> bool:
         """Aspetta fino al momento in cui la vittima sta per trasmettere."""
         lead = 0.0005
 
         # Se abbiamo riferimento ECU, usa next_tx_time (ground truth) con guard-rail.
+        # Niente polling: si dorme sul PendingSignal della vittima, che sveglia l'attacker
+        # esattamente quando la vittima accoda il frame (ciclo concluso).
         if self.victim_ecu is not None:
+            signal = self.master.pending_signal(self.victim_ecu)
             while self.running and not self.is_bus_off():
                 if self.victim_ecu.is_bus_off():
                     return False
 
+                cycle = signal.seq
+                # anti-doppio attacco: già armato per questo ciclo, aspetta che la vittima lo consumi
+                if self._last_attacked_cycle == cycle:
+                    signal.wait(cycle, timeout=0.5)
+                    continue
+
                 now = time.time()
                 nxt = float(getattr(self.victim_ecu, "next_tx_time", now + 0.01))
                 dt = nxt - now
-                cycle_ts = nxt
 
-                # quando siamo nella finestra: NON basta il tempo, vogliamo che la vittima sia davvero pending nel master
+                # quando siamo nella finestra: il frame d'attacco viene armato sul prossimo
+                # SOF della vittima (submit_transmission(sync_with=victim_ecu)), quindi non
+                # serve più vederla pending nel master.
                 if dt <= lead:
-                    # anti-doppio attacco: soglia realistica (1ms, non 1e-6)
-                    if self._last_attacked_cycle_ts is not None and abs(cycle_ts - self._last_attacked_cycle_ts) < 1e-3:
-                        time.sleep(0.001)
-                        continue
-
-                    # aspetta che la vittima abbia effettivamente enqueue-ato la tx
-                    deadline = nxt + 0.02  # 20ms di margine (puoi ridurre)
-                    while self.running and time.time() < deadline and not self.is_bus_off():
-                        try:
-                            with self.master.lock:
-                                victim_pending = any(
-                                    (ecu is self.victim_ecu and arb_id == self.victim_id)
-                                    for (ecu, _data, arb_id, _r0) in self.master.pending
-                                )
-                        except Exception:
-                            victim_pending = False
-
-                        if victim_pending:
-                            self._pending_cycle_ts = cycle_ts
-                            return True
-
-                        time.sleep(0.0002)  # 0.2ms: yield leggero
-
-                    # se non l’abbiamo vista pending, comunque esci (meglio skip che partire “prima”)
-                    return False
+                    self._pending_cycle = cycle
+                    return True
 
-                time.sleep(min(max(0.0, dt - lead), 0.01))
+                # fino all'apertura della finestra; un enqueue anticipato della vittima sveglia subito
+                signal.wait(cycle, timeout=min(dt - lead, 0.5))
             return False
 
         # fallback su next_attack_time
@@ -1251,7 +2005,7 @@ class WeepingAttacker:
             gap = 0.05
 
         for _ in range(num_messages):
-            if self.victim_ecu is not None and self.victim_ecu.get_time_until_tx() <= (self.master.collect_window * 2.5 + gap):
+            if self.victim_ecu is not None and self.victim_ecu.get_time_until_tx() <= gap:
                 break
 
             reset_id = pick_next_id()
@@ -1259,219 +2013,81 @@ class WeepingAttacker:
             self.master.submit_transmission(self, reset_data, reset_id, r0=BitValue.RECESSIVE)
             time.sleep(gap)
 
-    def _bits_to_bytes_msb(self, bits, nbytes=8):
-        """Converte lista di bit (0/1) in bytes (MSB-first per byte)."""
-        out = bytearray(nbytes)
-        nb = min(len(bits), nbytes * 8)
-        for pos in range(nb):
-            if bits[pos]:
-                b = pos // 8
-                k = 7 - (pos % 8)
-                out[b] |= (1 << k)
-        return bytes(out)
-
-    def _get_recent_victim_payloads(self, max_n=32):
-        """
-        Estrae gli ultimi max_n payload della vittima dai messaggi sniffati.
-        Usa msg['data'] se c'è, altrimenti ricostruisce da msg['bits'].
-        """
-        msgs = []
-        if hasattr(self, "victim_messages") and self.victim_messages:
-            msgs = self.victim_messages
-        # fallback: se vuoi includere reinforcement
-        if hasattr(self, "sniffed_data_2") and self.victim_id in self.sniffed_data_2:
-            msgs = msgs + self.sniffed_data_2[self.victim_id]
-
-        payloads = []
-        for m in msgs[-max_n:]:
-            if isinstance(m, dict) and 'data' in m and m['data'] is not None:
-                d = m['data']
-                if isinstance(d, (bytes, bytearray)) and len(d) >= 8:
-                    payloads.append(bytes(d[:8]))
-                    continue
-            if isinstance(m, dict) and 'bits' in m and m['bits'] is not None:
-                payloads.append(self._bits_to_bytes_msb(m['bits'], nbytes=8))
-
-        # tieni solo validi
-        payloads = [p for p in payloads if isinstance(p, (bytes, bytearray)) and len(p) == 8]
-        return payloads
-
     def _learn_next_payload_from_history(self, payloads):
-        from collections import Counter
         """
         Predice il prossimo payload in modo GENERICO (learning):
         - se un byte ha un delta ricorrente (mod 256), applica quel delta
         - altrimenti lo lascia uguale all'ultimo visto
         - se trova una coppia 16-bit con delta ricorrente (mod 65536), la tratta come contatore 16-bit
+        Versione one-shot di PayloadDynamics (l'attacco legge self.payload_model, già aggiornato).
         """
+        payloads = list(payloads)
         if not payloads:
             return bytes([0]*8)
-
-        last = payloads[-1]
-        n = len(payloads)
-        if n < 2:
-            return bytes(last)
-
-        # 1) prova a scoprire se c'è un contatore 16-bit (big endian o little endian)
-        best16 = None  # (i, endian, confidence)
-        for i in range(7):
-            # big endian word = b[i]<<8 | b[i+1]
-            deltas_be = []
-            deltas_le = []
-            for t in range(1, n):
-                w0_be = (payloads[t-1][i] << 8) | payloads[t-1][i+1]
-                w1_be = (payloads[t][i] << 8) | payloads[t][i+1]
-                deltas_be.append((w1_be - w0_be) & 0xFFFF)
-
-                w0_le = (payloads[t-1][i+1] << 8) | payloads[t-1][i]
-                w1_le = (payloads[t][i+1] << 8) | payloads[t][i]
-                deltas_le.append((w1_le - w0_le) & 0xFFFF)
-
-            c_be = Counter(deltas_be)
-            c_le = Counter(deltas_le)
-            (d_be, f_be) = c_be.most_common(1)[0]
-            (d_le, f_le) = c_le.most_common(1)[0]
-            conf_be = f_be / max(1, len(deltas_be))
-            conf_le = f_le / max(1, len(deltas_le))
-
-            # soglia: deve essere molto consistente
-            if conf_be >= 0.85 and d_be in (1, 0, 0xFFFF, 2, 3):
-                cand = (i, "be", conf_be, d_be)
-                if best16 is None or cand[2] > best16[2]:
-                    best16 = cand
-            if conf_le >= 0.85 and d_le in (1, 0, 0xFFFF, 2, 3):
-                cand = (i, "le", conf_le, d_le)
-                if best16 is None or cand[2] > best16[2]:
-                    best16 = cand
-
-        # 2) predizione byte-by-byte con delta ricorrente (mod 256)
-        pred = bytearray(last)
-
-        # se ho un 16-bit forte, applicalo e poi evito di sovrascrivere quei 2 byte
-        blocked = set()
-        if best16 is not None:
-            i, endian, conf, delta16 = best16
-            blocked.add(i); blocked.add(i+1)
-            if endian == "be":
-                w = (last[i] << 8) | last[i+1]
-                w_next = (w + delta16) & 0xFFFF
-                pred[i] = (w_next >> 8) & 0xFF
-                pred[i+1] = w_next & 0xFF
-            else:
-                w = (last[i+1] << 8) | last[i]
-                w_next = (w + delta16) & 0xFFFF
-                pred[i] = w_next & 0xFF
-                pred[i+1] = (w_next >> 8) & 0xFF
-
-        for j in range(8):
-            if j in blocked:
-                continue
-            deltas = []
-            for t in range(1, n):
-                deltas.append((payloads[t][j] - payloads[t-1][j]) & 0xFF)
-            c = Counter(deltas)
-            d, f = c.most_common(1)[0]
-            conf = f / max(1, len(deltas))
-
-            # se delta è molto consistente, applicalo (counter-like)
-            if conf >= 0.85 and d in (0, 1, 0xFF, 2, 3):
-                pred[j] = (last[j] + d) & 0xFF
-            else:
-                pred[j] = last[j]  # default: persistenza
-
-        return bytes(pred)
+        model = PayloadDynamics(history_len=len(payloads))
+        model.extend(payloads)
+        return model.predict()
 
     def _create_attack_message(self) -> bytes:
         """Crea il payload d'attacco (DATA 8 byte) con predizione SEQUENZIALE (learned) + flip solo bit target."""
+        # ===== 1) Predizione SEQUENZIALE (learned) del prossimo payload =====
+        # predittore appreso solo se già calcolato per l'ultimo frame (cache, nessuna attesa)
+        predicted_payload = self.learned_predictor.predict() if self.use_learned_predictor else None
+        if predicted_payload is None:
+            predicted_payload = self.payload_model.predict()
+
+        payload, chosen_pos = self._attack_bits_for(predicted_payload)
+        if chosen_pos >= 0:
+            self.bit_model.record_attack(chosen_pos)
+        return payload
+
+    def _attack_bits_for(self, predicted_payload: Optional[bytes]) -> Tuple[bytes, int]:
+        """Payload d'attacco per un payload previsto: (DATA 8 byte, bit flippato o -1).
+        Non registra l'attacco nel modello (lo fa chi lo trasmette)."""
         import math
         import random
 
-        # Default probabilità se non ho info
-        probs0 = [0.5] * 64
-        probs1 = [0.5] * 64
-        weights = [1.0] * 64
+        model = self.bit_model
+        if model is None:
+            # Default probabilità se non ho info
+            model = self.bit_model = BitMatrixModel()
+        probs0 = model.prob_0
+        probs1 = model.prob_1
 
-        if self.victim_bit_probabilities:
-            for d in self.victim_bit_probabilities:
-                try:
-                    pos = int(d.get('position', 0))
-                except Exception:
-                    continue
-                if 0 <= pos < 64:
-                    p0 = float(d.get('prob_0', 0.5))
-                    p1 = float(d.get('prob_1', 0.5))
-                    s = p0 + p1
-                    if s > 0:
-                        p0, p1 = p0 / s, p1 / s
-                    probs0[pos] = max(0.0, min(1.0, p0))
-                    probs1[pos] = max(0.0, min(1.0, p1))
-                    try:
-                        weights[pos] = max(0.01, float(d.get('weight', 1.0)))
-                    except Exception:
-                        weights[pos] = 1.0
-
-        # ===== 1) Predizione SEQUENZIALE (learned) del prossimo payload =====
-        payload_hist = self._get_recent_victim_payloads(max_n=32)
-        if not payload_hist:
+        if predicted_payload is None:
             # fallback: se non ho history, usa MAP come prima
-            predicted_bits = [0 if probs0[i] >= probs1[i] else 1 for i in range(64)]
+            predicted_bits = (probs0 < probs1).astype(np.uint8)
         else:
-            predicted_payload = self._learn_next_payload_from_history(payload_hist)
-            predicted_bits = []
-            for b in range(8):
-                for k in range(7, -1, -1):
-                    predicted_bits.append(1 if (predicted_payload[b] >> k) & 1 else 0)
-
-        # ===== 2) Selezione candidati (identica alla tua) =====
-        candidates = []
-        for i in range(64):
-            if predicted_bits[i] == 0:
-                base = probs0[i] * weights[i]
-                penalty = (1.0 + self._bit_attack_counts[i]) ** 0.70
-                score = base / penalty
-                candidates.append((i, score))
-
-        if not candidates:
-            return bytes([0] * 8)
-
-        candidates.sort(key=lambda x: x[1], reverse=True)
-        topk = candidates[: max(1, int(self.attack_topk_bits))]
+            predicted_bits = np.unpackbits(np.frombuffer(predicted_payload, dtype=np.uint8))
+
+        # ===== 2) Selezione candidati: top-K tra i bit predetti dominanti =====
+        topk, scores = model.top_k(predicted_bits == 0, self.attack_topk_bits)
+        if not len(topk):
+            return bytes([0] * 8), -1
 
         # ===== 3) Scelta randomizzata (identica alla tua) =====
         if random.random() < float(self.attack_eps_explore):
-            chosen_pos = random.choice([p for p, _ in topk])
+            chosen_pos = int(random.choice(topk))
         else:
             temp = max(1e-3, float(self.attack_softmax_temp))
-            scores = [s for _, s in topk]
-            mx = max(scores)
+            mx = scores[0]
             expw = [math.exp((s - mx) / temp) for s in scores]
             tot = sum(expw)
             r = random.random() * tot
             acc = 0.0
-            chosen_pos = topk[-1][0]
-            for (pos, _), w in zip(topk, expw):
+            chosen_pos = int(topk[-1])
+            for pos, w in zip(topk, expw):
                 acc += w
                 if acc >= r:
-                    chosen_pos = pos
+                    chosen_pos = int(pos)
                     break
 
         # ===== 4) Flip SOLO del bit scelto (0 -> 1) =====
+        predicted_bits = predicted_bits.copy()
         predicted_bits[chosen_pos] = 1
-        self._bit_attack_counts[chosen_pos] += 1
-
-        byte_idx = chosen_pos // 8
-        bit_idx = 7 - (chosen_pos % 8)
-        conf0 = probs0[chosen_pos] * 100.0
 
         # Pack bits -> 8 bytes (MSB-first)
-        payload = bytearray(8)
-        for pos in range(64):
-            if predicted_bits[pos]:
-                b = pos // 8
-                k = 7 - (pos % 8)
-                payload[b] |= (1 << k)
-
-        return bytes(payload)
+        return np.packbits(predicted_bits).tobytes(), chosen_pos
 
     def _attack_loop(self):
         """Loop attacco con gestione TEC:
@@ -1489,7 +2105,7 @@ class WeepingAttacker:
 
             # Se TEC è troppo alto: cooldown (non attaccare finché non scendi)
             if self.tec >= self.tec_hard_limit:
-                print(f"[ATTACKER]  COOLDOWN: TEC={self.tec} >= {self.tec_hard_limit}, stop attack e ripulisco...")
+                TRACE.emit(TraceLevel.STATE, "[ATTACKER]  COOLDOWN: TEC=%s >= %s, stop attack e ripulisco...", self.tec, self.tec_hard_limit)
                 # prova a scendere verso tec_target (best effort, _reduce_tec può interrompersi per non disturbare la vittima)
                 while self.running and not self.is_bus_off() and self.tec > self.tec_target:
                     self._reduce_tec(num_messages=self.max_reset_per_round)
@@ -1502,14 +2118,14 @@ class WeepingAttacker:
             if not self.running:
                 break
             if not ok: 
-                print("[ATTACKER] Desync: victim not pending, skip this cycle")
+                TRACE.emit(TraceLevel.STATE, "[ATTACKER] Desync: victim not pending, skip this cycle")
                 time.sleep(0.001)
                 continue 
 
             # marca ciclo (anti multi-submit nello stesso ciclo)
-            if self._pending_cycle_ts is not None:
-                self._last_attacked_cycle_ts = self._pending_cycle_ts
-                self._pending_cycle_ts = None
+            if self._pending_cycle is not None:
+                self._last_attacked_cycle = self._pending_cycle
+                self._pending_cycle = None
 
             # Probabilità di attacco dipendente dal TEC (se TEC sale, attacca meno)
             # Probabilità di attacco dipendente dal TEC (mai 1.0)
@@ -1526,7 +2142,7 @@ class WeepingAttacker:
             do_attack = (random.random() < p_attack)
 
             if not do_attack:
-                print(f"[ATTACKER]  Skip attack this cycle (TEC={self.tec}, p_attack={p_attack:.2f}) -> ripulisco TEC")
+                TRACE.emit(TraceLevel.STATE, "[ATTACKER]  Skip attack this cycle (TEC=%s, p_attack=%.2f) -> ripulisco TEC", self.tec, p_attack)
                 if self.tec > 0:
                     self._reduce_tec(num_messages=min(self.max_reset_per_round, 3))
                 time.sleep(0.01)
@@ -1534,10 +2150,19 @@ class WeepingAttacker:
 
             # --- ATTACK ---
             attack_count += 1
-            attack_data = self._create_attack_message()
+            ready = self.attack_queue.take()
+            with self.attack_queue.lock:
+                if ready is not None:
+                    attack_data, chosen_pos = ready
+                    if chosen_pos >= 0:
+                        self.bit_model.record_attack(chosen_pos)
+                else:
+                    attack_data = self._create_attack_message()
 
-            # Stesso ID, R0 recessive (l'attacco è nel DATA bit)
-            self.master.submit_transmission(self, attack_data, self.victim_id, r0=self.attack_r0)
+            # Stesso ID, R0 recessive (l'attacco è nel DATA bit).
+            # Con la vittima nota il frame parte nello stesso slot della sua prossima trasmissione.
+            self.master.submit_transmission(self, attack_data, self.victim_id, r0=self.attack_r0,
+                                            sync_with=self.victim_ecu)
 
             # Dai tempo al master di processare collisione
             time.sleep(0.05)
@@ -1556,20 +2181,204 @@ class WeepingAttacker:
                 else:
                     n_reset = self.max_reset_per_round  # 16
 
-                print(f"[ATTACKER]  Post-attack TEC cleanup: TEC={self.tec} -> send up to {n_reset} reset frames")
+                TRACE.emit(TraceLevel.STATE, "[ATTACKER]  Post-attack TEC cleanup: TEC=%s -> send up to %s reset frames", self.tec, n_reset)
                 if n_reset > 0:
                     self._reduce_tec(num_messages=n_reset)
 
             time.sleep(0.01)
 
 
+# --- Replay da capture candump (valutazione offline di attacker e IDS) ---
+_CANDUMP_RE = re.compile(r"^\((\d+(?:\.\d+)?)\)\s+(\S+)\s+([0-9A-Fa-f]{1,8})#([0-9A-Fa-f]*)")
+
+
+@dataclass
+class ReplayStats:
+    frames: int = 0            # frame consegnati allo sniffer
+    markers: int = 0           # error frame marker (0x7E0 / 0x7FF) saltati
+    collisions: int = 0        # coppie stesso ID entro collision_gap_s
+    alerts: list = None        # alert SimpleCANIDS (dict di check_alert)
+    capture_s: float = 0.0     # durata della capture (tempo virtuale)
+    elapsed_s: float = 0.0     # tempo reale impiegato dal replay
+
+
+class CandumpReplay:
+    """
+    Rigioca una capture candump (`(ts) vcan0 ID#DATA`) nella pipeline di sniffing
+    del WeepingAttacker e in SimpleCANIDS, usando i timestamp registrati come tempo
+    virtuale. Di default va alla massima velocità; con realtime=True rispetta i gap
+    della capture (scalati da speed).
+
+    Due frame con lo stesso ID entro collision_gap_s sono una collisione (vittima +
+    copia dell'attacker): nessuno dei due arriva allo sniffer, come sul bus reale, e
+    il bit d'errore viene ricostruito con wired_and_arbitrate per l'IDS.
+    """
+
+    def __init__(self, path: str, realtime: bool = False, speed: float = 1.0,
+                 marker_ids=(0x7E0, 0x7FF), collision_gap_s: float = 0.005):
+        self.path = path
+        self.realtime = realtime
+        self.speed = speed
+        self.marker_ids = frozenset(marker_ids)
+        self.collision_gap_s = collision_gap_s
+
+    def frames(self) -> Iterator[Tuple[float, int, bytes]]:
+        """(ts, arb_id, data) in ordine di capture, una riga alla volta."""
+        with open(self.path, "r", encoding="utf-8", errors="replace") as fh:
+            for line in fh:
+                m = _CANDUMP_RE.match(line)
+                if m:
+                    yield float(m.group(1)), int(m.group(3), 16), bytes.fromhex(m.group(4))
+
+    @staticmethod
+    def _collision_bit(arb_id: int, first: bytes, second: bytes) -> Tuple[int, str]:
+        """Bit d'errore (indice assoluto nel frame stuffato) e offender della collisione."""
+        res = wired_and_arbitrate([encode_frame(arb_id, first), encode_frame(arb_id, second)])
+        if res.error_col < 0 or not res.error_nodes:
+            return -1, ""
+        return res.error_col, ("first", "second")[res.error_nodes[0]]
+
+    def run(self, attacker: Optional["WeepingAttacker"] = None,
+            ids: Optional[SimpleCANIDS] = None, frame_detectors=()) -> ReplayStats:
+        stats = ReplayStats(alerts=[])
+        wall0 = time.perf_counter()
+        t0 = None
+        end_1 = end_2 = None
+        pending = None  # (ts, arb_id, data): lookahead di un frame per riconoscere le collisioni
+
+        if attacker is not None:
+            attacker.attack_state = "sniffing_1"
+            TRACE.emit(TraceLevel.STATE, "[REPLAY] Phase 1: sniffing %s (%ss virtual)", self.path, attacker.sniff_duration_1)
+
+        def deliver(frame):
+            ts, arb_id, data = frame
+            stats.frames += 1
+            for detector in frame_detectors:
+                alert = detector.observe_frame(arb_id, ts)
+                if alert:
+                    alert["ts"] = ts
+                    stats.alerts.append(alert)
+                    log_ids_alert(alert)
+            if attacker is not None:
+                attacker.on_sniffed_frame(arb_id, data, ts)
+
+        def advance_phase(ts: float):
+            nonlocal end_1, end_2
+            if end_1 is not None and ts >= end_1:
+                end_1 = None
+                if attacker._analysis_phase():
+                    attacker.attack_state = "sniffing_2"
+                    TRACE.emit(TraceLevel.STATE, "[REPLAY] Phase 3: sniffing victim 0x%03X (%ss virtual)", attacker.victim_id, attacker.sniff_duration_2)
+                else:
+                    attacker.attack_state = "aborted"
+                    end_2 = None
+            if end_2 is not None and ts >= end_2:
+                end_2 = None
+                attacker.attack_state = "reinforcement"
+                attacker._reinforcement_learning()
+
+        for frame in self.frames():
+            ts, arb_id, data = frame
+            if t0 is None:
+                t0 = ts
+                if attacker is not None:
+                    end_1 = t0 + attacker.sniff_duration_1
+                    end_2 = end_1 + attacker.sniff_duration_2
+            stats.capture_s = ts - t0
+
+            if self.realtime:
+                delay = (ts - t0) / self.speed - (time.perf_counter() - wall0)
+                if delay > 0:
+                    time.sleep(delay)
+
+            if attacker is not None:
+                advance_phase(ts)
+
+            if arb_id in self.marker_ids:
+                stats.markers += 1
+                continue
+
+            if pending is not None and pending[1] == arb_id and ts - pending[0] <= self.collision_gap_s:
+                stats.collisions += 1
+                bit_idx, offender = self._collision_bit(arb_id, pending[2], data)
+                pending = None
+                if ids is not None and bit_idx >= 0:
+                    ids.observe_collision(arb_id, bit_idx, offender, ts=ts)
+                    alert = ids.check_alert(arb_id, ts=ts)
+                    if alert:
+                        alert["ts"] = ts
+                        stats.alerts.append(alert)
+                        log_ids_alert(alert)
+                continue
+
+            if pending is not None:
+                deliver(pending)
+            pending = frame
+
+        if pending is not None:
+            deliver(pending)
+        if attacker is not None and t0 is not None:
+            # capture più corta delle fasi: chiudi comunque analisi/reinforcement
+            advance_phase(float("inf"))
+
+        stats.elapsed_s = time.perf_counter() - wall0
+        return stats
+
+
 # --- Main ---
 def main():
-    print("="*100)
-    print("WEEPING CAN ATTACK SIMULATOR - BIT-LEVEL ANALYSIS + REINFORCEMENT LEARNING")
-    print("="*100)
+    import argparse
+    parser = argparse.ArgumentParser(description="Weeping CAN attack simulator")
+    parser.add_argument("--trace", default="frame,error,state",
+                        help="trace levels: bit,frame,error,state | all | none (default: frame,error,state)")
+    parser.add_argument("--replay", metavar="CANDUMP",
+                        help="rigioca una capture candump nell'attacker e nell'IDS invece di simulare")
+    parser.add_argument("--realtime", action="store_true",
+                        help="con --replay, rispetta i gap della capture invece di andare a massima velocità")
+    parser.add_argument("--speed", type=float, default=1.0,
+                        help="con --replay --realtime, fattore di accelerazione (default: 1.0)")
+    parser.add_argument("--monitor", metavar="CHANNEL",
+                        help="solo IDS di timing/skew su un'interfaccia socketcan live (es. vcan0)")
+    parser.add_argument("--skew-check", metavar="TRIALS", type=int,
+                        help="prova randomizzata di ClockSkewIDS: falsi allarmi (benigno) e ritardo di detection (skew iniettato)")
+    parser.add_argument("--entropy-check", metavar="TRIALS", type=int,
+                        help="regressione di SimpleCANIDS: collisioni equiripartite sul bordo di entropy_th in una finestra longeva")
+    args = parser.parse_args()
+    TRACE.set_levels(TraceLevel.parse(args.trace))
+
+    if args.replay:
+        replay_main(args)
+        return
+    if args.monitor:
+        monitor_main(args)
+        return
+    if args.skew_check:
+        skew_check_main(args)
+        return
+    if args.entropy_check:
+        entropy_check_main(args)
+        return
+
+    TRACE.print("="*100)
+    TRACE.print("WEEPING CAN ATTACK SIMULATOR - BIT-LEVEL ANALYSIS + REINFORCEMENT LEARNING")
+    TRACE.print("="*100)
 
     master = CANBusMaster(use_vcan=True)
+
+    # IDS asincrono: log di tutti gli alert, stop della simulazione solo al primo alert di
+    # collisioni (timing/skew sono indizi, non bastano a fermare la simulazione)
+    ids_alert = threading.Event()
+    pipeline = IDSPipeline(SimpleCANIDS(), frame_detectors=(TimingIDS(), ClockSkewIDS()))
+    pipeline.subscribe(log_ids_alert)
+
+    def stop_on_collision_alert(alert: dict):
+        if alert.get("kind", "collision") == "collision":
+            ids_alert.set()
+
+    pipeline.subscribe(stop_on_collision_alert)
+    master.ids_pipeline = pipeline
+    pipeline.start()
+
     master.start()
 
     # Create ECUs
@@ -1591,7 +2400,8 @@ def main():
     for ecu in ecus:
         ecu.start()
 
-    print("\n=== Simulation running ===\n")
+    TRACE.flush()
+    TRACE.print("\n=== Simulation running ===\n")
 
     victim_ecu = None
 
@@ -1604,53 +2414,226 @@ def main():
                 for ecu in ecus:
                     if ecu.arb_id == attacker.victim_id:
                         victim_ecu = ecu
-                        print(f"\n[MAIN] Victim identified: {victim_ecu.name} (ID={hex(victim_ecu.arb_id)})")
+                        TRACE.flush()
+                        TRACE.print(f"\n[MAIN] Victim identified: {victim_ecu.name} (ID={hex(victim_ecu.arb_id)})")
                         break
 
             # Check victim bus-off
             if victim_ecu and victim_ecu.is_bus_off():
-                print(f"\n{'='*100}")
-                print(f" ATTACK SUCCESSFUL! ")
-                print(f"Victim {victim_ecu.name} (ID={hex(victim_ecu.arb_id)}) is in BUS-OFF state")
-                print(f"{'='*100}\n")
+                TRACE.flush()
+                TRACE.print(f"\n{'='*100}")
+                TRACE.print(f" ATTACK SUCCESSFUL! ")
+                TRACE.print(f"Victim {victim_ecu.name} (ID={hex(victim_ecu.arb_id)}) is in BUS-OFF state")
+                TRACE.print(f"{'='*100}\n")
+                break
+
+            # Check IDS
+            if ids_alert.is_set():
+                TRACE.flush()
+                TRACE.print(f"\n{'='*100}")
+                TRACE.print(f" ATTACK DETECTED BY IDS! ")
+                TRACE.print(f"Simulation stopped on first IDS alert")
+                TRACE.print(f"{'='*100}\n")
                 break
 
             # Check attacker bus-off
             if attacker.is_bus_off():
-                print(f"\n{'='*100}")
-                print(f" ATTACK FAILED! ")
-                print(f"Attacker went BUS-OFF before victim")
-                print(f"{'='*100}\n")
+                TRACE.flush()
+                TRACE.print(f"\n{'='*100}")
+                TRACE.print(f" ATTACK FAILED! ")
+                TRACE.print(f"Attacker went BUS-OFF before victim")
+                TRACE.print(f"{'='*100}\n")
                 break
 
     except KeyboardInterrupt:
-        print("\n=== Simulation interrupted ===")
+        TRACE.flush()
+        TRACE.print("\n=== Simulation interrupted ===")
 
     # STAMPA FINALE TEC/REC
-    print(f"\n{'='*100}")
-    print("FINAL STATUS - TEC/REC of all ECUs")
-    print(f"{'='*100}")
+    TRACE.flush()
+    TRACE.print(f"\n{'='*100}")
+    TRACE.print("FINAL STATUS - TEC/REC of all ECUs")
+    TRACE.print(f"{'='*100}")
 
     for ecu in ecus:
-        print(
+        TRACE.print(
             f"  [{ecu.name:8s}] ID=0x{ecu.arb_id:03X} | TEC={ecu.tec:3d} "
             f"REC={ecu.rec:3d} | {ecu.state.name:13s}"
         )
 
-    print(
+    TRACE.print(
         f"  [{attacker.name:8s}] ID=0x{attacker.arb_id:03X} | TEC={attacker.tec:3d} "
         f"REC={attacker.rec:3d} | {attacker.state.name:13s}"
     )
 
-    print(f"{'='*100}\n")
+    info = frame_cache_info()
+    TRACE.print(f"  Frame cache: hits={info.hits} misses={info.misses} size={info.currsize}/{info.maxsize}")
+    TRACE.print(f"  IDS: events={pipeline.published} processed={pipeline.processed} "
+          f"alerts={pipeline.alerts} max_lag={pipeline.max_lag_s*1000:.2f}ms")
+    queue = attacker.attack_queue
+    TRACE.print(f"  Attack payloads: precomputed={queue.hits} computed_inline={queue.misses} "
+          f"invalidations={queue.invalidations}")
+
+    TRACE.print(f"{'='*100}\n")
 
     # Stop all
     attacker.stop()
     for ecu in ecus:
         ecu.stop()
     master.stop()
+    pipeline.stop()
+    TRACE.close()
+
+    TRACE.print("\n=== Simulation ended ===")
+
+
+def replay_main(args):
+    attacker = WeepingAttacker(CANBusMaster(use_vcan=False), sniff_duration_1=150, sniff_duration_2=30)
+    ids = SimpleCANIDS()
+    detectors = (TimingIDS(), ClockSkewIDS())
+    stats = CandumpReplay(args.replay, realtime=args.realtime, speed=args.speed).run(attacker, ids, detectors)
+
+    TRACE.flush()
+    TRACE.print(f"\n{'='*100}")
+    TRACE.print(f"REPLAY SUMMARY - {args.replay}")
+    TRACE.print(f"{'='*100}")
+    TRACE.print(f"  Capture: {stats.capture_s:.1f}s virtual in {stats.elapsed_s*1000:.1f}ms | "
+          f"frames={stats.frames} markers={stats.markers} collisions={stats.collisions}")
+    if attacker.victim_id is not None:
+        interval = f"{attacker.avg_interval:.3f}s" if attacker.avg_interval is not None else "n/a"
+        TRACE.print(f"  Victim: ID=0x{attacker.victim_id:03X} | messages={len(attacker.victim_messages)} | "
+              f"interval={interval} | reinforcement={len(attacker.sniffed_data_2.get(attacker.victim_id, []))}")
+    else:
+        TRACE.print("  Victim: none")
+    kinds = Counter(a.get("kind", "collision") for a in stats.alerts)
+    TRACE.print(f"  IDS alerts: {len(stats.alerts)} (" + " ".join(f"{k}={v}" for k, v in sorted(kinds.items())) + ")")
+    for alert in stats.alerts[:10]:
+        TRACE.print(f"    ts={alert['ts']:.6f} {format_ids_alert(alert)}")
+    if len(stats.alerts) > 10:
+        TRACE.print(f"    ... +{len(stats.alerts) - 10} more")
+    TRACE.print(f"{'='*100}\n")
+    TRACE.close()
+
+
+def skew_check_main(args, frames: int = 20000, seed: int = 0):
+    """
+    Prova randomizzata di ClockSkewIDS su ID sintetici (periodo, skew e jitter casuali).
+    Ogni trial: una traccia benigna (conta i falsi allarmi) e una con lo stesso ID che a metà
+    passa a un trasmettitore con skew diverso di 20..300 ppm (ritardo di detection in frame).
+    """
+    rng = random.Random(seed)
+    periods = (0.01, 0.02, 0.1, 0.5, 1.0, 5.0)
+    detector_h = ClockSkewIDS().cusum_h
+    benign_frames = false_alarms = 0
+    delays = defaultdict(list)   # banda di delta skew -> ritardi (frame)
+    missed = Counter()
+
+    def trace(period, skew, jitter, delta, trial_rng):
+        ids = ClockSkewIDS(cooldown_s=0.0)
+        t, alerts = 0.0, []
+        for k in range(frames):
+            ppm = skew + (delta if k >= frames // 2 else 0.0)
+            t += period * (1 + ppm * 1e-6)
+            if trial_rng.random() < 0.01:
+                continue  # frame perso (arbitraggio, errore)
+            if ids.observe_frame(0x100, t + trial_rng.gauss(0.0, jitter)):
+                alerts.append(k)
+        return alerts
+
+    for _ in range(args.skew_check):
+        period = rng.choice(periods)
+        skew = rng.uniform(-100.0, 100.0)
+        jitter = period * rng.uniform(2e-4, 2e-3)
+        alerts = trace(period, skew, jitter, 0.0, random.Random(rng.random()))
+        benign_frames += frames
+        false_alarms += len(alerts)
+
+        delta = rng.choice((-1, 1)) * rng.uniform(20.0, 300.0)
+        band = "20-100ppm" if abs(delta) < 100 else "100-300ppm"
+        alerts = trace(period, skew, jitter, delta, random.Random(rng.random()))
+        false_alarms += sum(1 for k in alerts if k < frames // 2)
+        benign_frames += frames // 2
+        after = [k - frames // 2 for k in alerts if k >= frames // 2]
+        if after:
+            delays[band].append(after[0])
+        else:
+            missed[band] += 1
+
+    TRACE.print(f"\n{'='*100}")
+    TRACE.print(f"CLOCK SKEW IDS CHECK - {args.skew_check} trials x {frames} frames (h={detector_h:.2f})")
+    TRACE.print(f"{'='*100}")
+    TRACE.print(f"  Benign: frames={benign_frames} false_alarms={false_alarms} "
+          f"({false_alarms / benign_frames * 1e6:.2f} per 1e6 frames)")
+    for band in sorted(set(delays) | set(missed)):
+        d = sorted(delays[band])
+        n = len(d) + missed[band]
+        if d:
+            TRACE.print(f"  Injected {band}: detected={len(d)}/{n} delay median={d[len(d) // 2]} "
+                  f"p90={d[min(len(d) - 1, int(len(d) * 0.9))]} max={d[-1]} frames")
+        else:
+            TRACE.print(f"  Injected {band}: detected=0/{n}")
+    TRACE.print(f"{'='*100}\n")
+
 
-    print("\n=== Simulation ended ===")
+def entropy_check_main(args, history_s: int = 2000, seed: int = 0):
+    """
+    Regressione del confronto H <= entropy_th in SimpleCANIDS. Ogni trial: una finestra di 4
+    bucket che non si svuota mai (history_s epoche di collisioni casuali su 64 bit), poi le
+    ultime 4 epoche con c collisioni ciascuna sui bit 0..3: c/c/c/c ha H esatta 2.0 = soglia
+    di default e l'alert deve scattare (col bordo mancato, es. 2/2/2/2 o 5/5/5/5, no).
+    """
+    rng = random.Random(seed)
+    missed = []
+    for _ in range(args.entropy_check):
+        ids = SimpleCANIDS(windows_s=[4.0], bucket_s=1.0, min_collisions=8, cooldown_s=0.0)
+        for epoch in range(history_s):
+            for _ in range(rng.randint(1, 6)):
+                ids.observe_collision(0x100, rng.randrange(64), "ecu%d" % rng.randrange(3), ts=epoch + 0.5)
+        c = rng.randint(2, 50)
+        for k in range(4):
+            for _ in range(c):
+                ids.observe_collision(0x100, k, "ecu0", ts=history_s + k + 0.5)
+        if not ids.check_alert(0x100, ts=history_s + 3.5):
+            missed.append(c)
+
+    TRACE.print(f"\n{'='*100}")
+    TRACE.print(f"IDS ENTROPY BOUNDARY CHECK - {args.entropy_check} trials x {history_s}s history")
+    TRACE.print(f"{'='*100}")
+    TRACE.print(f"  c/c/c/c on 4 bits (H=2.0): alerted={args.entropy_check - len(missed)}/{args.entropy_check}"
+                + (f" missed c={sorted(set(missed))}" if missed else ""))
+    TRACE.print(f"{'='*100}\n")
+    if missed:
+        sys.exit(1)
+
+
+def monitor_main(args):
+    """Detector sui frame (TimingIDS, ClockSkewIDS) in parallelo a una capture live."""
+    try:
+        bus = can.interface.Bus(channel=args.monitor, interface='socketcan')
+    except Exception as e:
+        TRACE.print(f"[MONITOR] Error connecting to {args.monitor}: {e}")
+        return
+    detectors = (TimingIDS(), ClockSkewIDS())
+    frames = alerts = 0
+    TRACE.print(f"[MONITOR] Listening on {args.monitor} (Ctrl+C per fermare)")
+    try:
+        while True:
+            msg = bus.recv(timeout=1.0)
+            if msg is None or msg.is_error_frame:
+                continue
+            frames += 1
+            for detector in detectors:
+                alert = detector.observe_frame(msg.arbitration_id, msg.timestamp)
+                if alert:
+                    alerts += 1
+                    log_ids_alert(alert)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        bus.shutdown()
+        TRACE.flush()
+        TRACE.print(f"\n[MONITOR] frames={frames} alerts={alerts}")
+        TRACE.close()
 
 
 if __name__ == "__main__":